@@ -4,23 +4,30 @@ from __future__ import annotations
 
 import logging
 
+from cache.embedding_cache import EmbeddingCache
 from cache.redis_cache import RedisCache
+from cache.rerank_cache import CachedReranker, RerankCache
+from cache.retrieval_cache import RetrievalCache
 from config.settings import Settings
+from core.tokenizer import TokenizerService, init_tokenizer
 from generation.llm_generator import GeminiLLMGenerator, MockLLMGenerator
 from generation.query_rewriter import QueryRewriter
 from generation.token_budget import TokenBudgetManager
 from ingestion.chunk_splitter import HierarchicalChunkSplitter
 from ingestion.data_cleaner import DataCleaner
 from ingestion.document_parser import MarkdownDocumentParser
-from ingestion.embedder import Embedder
+from ingestion.embedder import Embedder, build_embedding_backend
 from ingestion.kafka_consumer import KafkaChunkConsumer
 from ingestion.kafka_producer import KafkaChunkProducer
 from ingestion.pipeline import IngestionPipeline
-from models.schemas import DocumentChunk
 from retrieval.bm25_engine import BM25Engine
+from retrieval.local_bm25_engine import LocalBM25Engine
+from retrieval.local_vector_engine import LocalVectorEngine
 from retrieval.pipeline_retriever import ThreeLevelRetriever
-from retrieval.reranker import CrossEncoderReranker
+from retrieval.rerank_server import MicroBatchingReranker, build_backend
+from retrieval.reranker import CrossEncoderReranker, ModelReranker
 from retrieval.vector_engine import MilvusVectorEngine
+from storage.chunk_store import ChunkStore
 
 logger = logging.getLogger(__name__)
 
@@ -31,17 +38,30 @@ class Components:
     def __init__(self):
         self.settings = Settings()
 
+        # 分词词典在启动时加载，避免首个请求承担 jieba 初始化耗时
+        self.tokenizer: TokenizerService = init_tokenizer(
+            self.settings.tokenizer_user_dict, self.settings.tokenizer_cache_size
+        )
+
         # 存储层
         self.redis_cache = RedisCache(self.settings)
-        self.bm25_engine = BM25Engine(self.settings)
-        self.vector_engine = MilvusVectorEngine(self.settings)
+        self.bm25_engine = _build_bm25_engine(self.settings)
+        self.vector_engine = _build_vector_engine(self.settings)
 
         # 消息队列
         self.kafka_producer = KafkaChunkProducer(self.settings)
         self.kafka_consumer = KafkaChunkConsumer(self.settings)
 
         # 核心组件
-        self.embedder = Embedder(self.settings)
+        self.embedder = _build_embedder(self.settings)
+        self.embedding_cache: EmbeddingCache | None = None
+        if self.settings.embedding_cache_enabled:
+            self.embedding_cache = EmbeddingCache(
+                version=self.embedder.version,
+                capacity=self.settings.embedding_cache_capacity,
+                path=self.settings.embedding_cache_path,
+            )
+            self.embedder.cache = self.embedding_cache
         self.parser = MarkdownDocumentParser()
         self.cleaner = DataCleaner()
         self.splitter = HierarchicalChunkSplitter(self.settings)
@@ -57,11 +77,26 @@ class Components:
             self.generator = MockLLMGenerator(self.token_budget)
             logger.info("[Init] LLM Provider: Mock")
 
-        # chunk 全局存储
-        self.chunk_store: dict[str, DocumentChunk] = {}
+        # chunk 全局存储（列式紧凑存储）
+        self.chunk_store = ChunkStore(
+            directory=self.settings.chunk_store_dir,
+            max_segments=self.settings.chunk_store_max_segments,
+            refresh_interval_ms=self.settings.chunk_store_refresh_interval_ms,
+            text_cache_size=self.settings.chunk_store_text_cache_size,
+        )
 
-        # Reranker
-        self.reranker = CrossEncoderReranker(self.chunk_store)
+        # Reranker（可选外包分数缓存）
+        self.rerank_cache: RerankCache | None = None
+        self.reranker = _build_reranker(self.settings, self.chunk_store)
+        if self.settings.rerank_cache_enabled:
+            self.rerank_cache = RerankCache(
+                version=f"{self.settings.reranker_backend}:{self.settings.reranker_version}",
+                capacity=self.settings.rerank_cache_capacity,
+                redis_cache=self.redis_cache if self.settings.rerank_cache_redis else None,
+                ttl_seconds=self.settings.rerank_cache_ttl_seconds,
+                chunk_store=self.chunk_store,
+            )
+            self.reranker = CachedReranker(self.reranker, self.rerank_cache)
 
         # 三级检索器
         self.retriever = ThreeLevelRetriever(
@@ -72,6 +107,20 @@ class Components:
             embedder=self.embedder,
             chunk_store=self.chunk_store,
         )
+        self.retrieval_cache: RetrievalCache | None = None
+        if self.settings.retrieval_cache_enabled:
+            self.retrieval_cache = RetrievalCache(
+                capacity=self.settings.retrieval_cache_capacity,
+                redis_cache=self.redis_cache if self.settings.retrieval_cache_redis else None,
+                ttl_seconds=self.settings.retrieval_cache_ttl_seconds,
+                chunk_store=self.chunk_store,
+            )
+            if not self.settings.retrieval_cache_redis and not self.settings.chunk_store_dir:
+                logger.warning(
+                    "[RetrievalCache] 未配置 Redis 与 chunk_store_dir，索引代号仅在本进程内有效；"
+                    "多 worker 部署时其他 worker 的写入不会使本进程缓存失效"
+                )
+            self.retriever.result_cache = self.retrieval_cache
 
         # Ingestion 流水线
         self.ingestion_pipeline = IngestionPipeline(
@@ -85,8 +134,69 @@ class Components:
             bm25_engine=self.bm25_engine,
             vector_engine=self.vector_engine,
         )
-        # 共享 chunk_store 引用
+        # 共享 chunk_store 引用；重新摄入的 chunk 使 rerank 缓存失效
         self.ingestion_pipeline.chunk_store = self.chunk_store
+        self.ingestion_pipeline.rerank_cache = self.rerank_cache
+        self.ingestion_pipeline.retrieval_cache = self.retrieval_cache
+
+    def use_bm25_engine(self, engine: BM25Engine | LocalBM25Engine) -> None:
+        """替换 BM25 后端，同步更新检索器与摄入流水线持有的引用。"""
+        self.bm25_engine = engine
+        self.retriever.bm25_engine = engine
+        self.ingestion_pipeline.bm25_engine = engine
+
+    def use_vector_engine(self, engine: MilvusVectorEngine | LocalVectorEngine) -> None:
+        """替换向量后端，同步更新检索器与摄入流水线持有的引用。"""
+        self.vector_engine = engine
+        self.retriever.vector_engine = engine
+        self.ingestion_pipeline.vector_engine = engine
+
+
+def _build_bm25_engine(settings: Settings) -> BM25Engine | LocalBM25Engine:
+    if settings.bm25_backend == "local":
+        logger.info("[Init] BM25 Backend: Local")
+        return LocalBM25Engine(settings)
+    return BM25Engine(settings)
+
+
+def _build_vector_engine(settings: Settings) -> MilvusVectorEngine | LocalVectorEngine:
+    if settings.vector_backend == "local":
+        logger.info("[Init] Vector Backend: Local (%s)", settings.local_vector_index_type)
+        return LocalVectorEngine(settings)
+    return MilvusVectorEngine(settings)
+
+
+def _build_embedder(settings: Settings) -> Embedder:
+    try:
+        backend = build_embedding_backend(settings)
+    except Exception as e:
+        logger.warning("[Init] Embedding 模型加载失败，使用特征哈希向量: %s", e)
+        return Embedder(settings)
+    logger.info("[Init] Embedding Backend: %s", backend.name)
+    return Embedder(settings, backend)
+
+
+def _build_reranker(
+    settings: Settings, chunk_store: ChunkStore
+) -> CrossEncoderReranker | ModelReranker:
+    if settings.reranker_backend in ("torch", "onnx"):
+        try:
+            backend = build_backend(
+                settings.reranker_backend,
+                settings.reranker_model_dir,
+                settings.reranker_max_length,
+            )
+        except Exception as e:
+            logger.warning("[Init] Reranker 模型加载失败，使用模拟打分: %s", e)
+        else:
+            logger.info("[Init] Reranker Backend: %s (微批)", settings.reranker_backend)
+            scheduler = MicroBatchingReranker(
+                backend,
+                max_batch_size=settings.rerank_max_batch_size,
+                max_wait_ms=settings.rerank_max_wait_ms,
+            )
+            return ModelReranker(chunk_store, scheduler)
+    return CrossEncoderReranker(chunk_store)
 
 
 _components: Components | None = None
@@ -99,8 +209,21 @@ def init_components() -> Components:
 
     # 尝试连接各基础设施（连接失败不阻塞启动，走降级路径）
     _try_connect("Redis", _components.redis_cache.connect)
-    _try_connect("Elasticsearch", _components.bm25_engine.connect)
-    _try_connect("Milvus", _components.vector_engine.connect)
+    _try_connect("Chunk Store", _components.chunk_store.load)
+    if isinstance(_components.bm25_engine, LocalBM25Engine):
+        _try_connect("Local BM25", _components.bm25_engine.connect)
+    elif (
+        not _try_connect("Elasticsearch", _components.bm25_engine.connect)
+        and _components.settings.bm25_fallback_local
+    ):
+        _fallback_bm25(_components)
+    if isinstance(_components.vector_engine, LocalVectorEngine):
+        _try_connect("Local Vector", _components.vector_engine.connect)
+    elif (
+        not _try_connect("Milvus", _components.vector_engine.connect)
+        and _components.settings.vector_fallback_local
+    ):
+        _fallback_vector(_components)
     _try_connect("Kafka Producer", _components.kafka_producer.connect)
     _try_connect("Kafka Consumer", _components.kafka_consumer.connect)
 
@@ -108,13 +231,43 @@ def init_components() -> Components:
     return _components
 
 
-def _try_connect(name: str, connect_fn) -> None:
-    """尝试连接，失败只记录警告不阻塞。"""
+def _fallback_bm25(comp: Components) -> None:
+    """ES 不可用时切换到进程内 BM25：无快照则由 chunk store 中的分词重建倒排，不以空索引顶替。"""
+    local_engine = LocalBM25Engine(comp.settings)
+    local_engine.connect()
+    if len(local_engine) == 0:
+        try:
+            count = local_engine.index_chunks(comp.chunk_store.values())
+            local_engine.refresh()
+        except Exception as e:
+            logger.warning("[Init] 进程内 BM25 重建失败，保持 Elasticsearch 降级路径: %s", e)
+            return
+        logger.info("[Init] 进程内 BM25 已由 Chunk Store 重建: %d chunks", count)
+    logger.warning("[Init] Elasticsearch 不可用，BM25 切换为进程内引擎")
+    comp.use_bm25_engine(local_engine)
+
+
+def _fallback_vector(comp: Components) -> None:
+    """Milvus 不可用时仅在 local_vector_dir 有持久化索引时切换，否则保持 BM25_ONLY 降级。"""
+    local_vector = LocalVectorEngine(comp.settings)
+    if not local_vector.has_persisted_index():
+        logger.warning("[Init] Milvus 不可用且无本地向量索引，检索降级为 BM25_ONLY")
+        return
+    if not _try_connect("Local Vector", local_vector.connect):
+        return
+    logger.warning("[Init] Milvus 不可用，向量检索切换为进程内引擎")
+    comp.use_vector_engine(local_vector)
+
+
+def _try_connect(name: str, connect_fn) -> bool:
+    """尝试连接，失败只记录警告不阻塞。返回是否连接成功。"""
     try:
         connect_fn()
         logger.info("[Init] %s 连接成功", name)
+        return True
     except Exception as e:
         logger.warning("[Init] %s 连接失败（将使用降级模式）: %s", name, e)
+        return False
 
 
 def get_components() -> Components:
@@ -131,6 +284,15 @@ def shutdown_components() -> None:
     if _components:
         _try_close("Kafka Producer", _components.kafka_producer.close)
         _try_close("Kafka Consumer", _components.kafka_consumer.close)
+        _try_close("Retriever", _components.retriever.close)
+        _try_close("Ingestion", _components.ingestion_pipeline.close)
+        _try_close("Reranker", _components.reranker.close)
+        _try_close("BM25", _components.bm25_engine.close)
+        _try_close("Chunk Store", _components.chunk_store.close)
+        if _components.embedding_cache is not None:
+            _try_close("Embedding Cache", _components.embedding_cache.close)
+        if isinstance(_components.vector_engine, LocalVectorEngine):
+            _try_close("Local Vector", _components.vector_engine.close)
         _components = None
         logger.info("[Shutdown] 所有连接已关闭")
 
@@ -6,44 +6,82 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 
-from fastapi import APIRouter, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import Response, StreamingResponse
 
 from api.dependencies import Components, get_components
-from models.schemas import ChatRequest, ChatResponse, IngestRequest, IngestResponse
+from core.deadline import GENERATION_TRUNCATED, Deadline
+from core.metrics import count_response
+from core.metrics import render as render_metrics
+from models.schemas import (
+    ChatRequest,
+    ChatResponse,
+    IngestBatchRequest,
+    IngestBatchResponse,
+    IngestRequest,
+    IngestResponse,
+)
 from tasks.summarize import summarize_history
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 同一时间只运行一个批量摄入：共享进程池、ES bulk_load 与 chunk store flush 都按单个任务设计
+_batch_ingest_lock = asyncio.Lock()
+
 
 @router.get("/health")
 async def health_check(comp: Components = Depends(get_components)):
     """健康检查。"""
-    return {
+    health = {
         "status": "ok",
         "chunks_indexed": len(comp.chunk_store),
+        "tokenizer": comp.tokenizer.stats(),
     }
+    if comp.rerank_cache is not None:
+        health["rerank_cache"] = comp.rerank_cache.stats()
+    if comp.retrieval_cache is not None:
+        health["retrieval_cache"] = comp.retrieval_cache.stats()
+    if comp.embedding_cache is not None:
+        health["embedding_cache"] = comp.embedding_cache.stats()
+    return health
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus 指标（需安装 prometheus_client）。"""
+    rendered = render_metrics()
+    if rendered is None:
+        return Response("prometheus_client not installed\n", status_code=503)
+    body, content_type = rendered
+    return Response(body, media_type=content_type)
 
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, comp: Components = Depends(get_components)):
     """非流式问答接口（返回完整 JSON）。"""
-    # 1. Pydantic 参数强校验已由 FastAPI 自动完成
+    # 1. Pydantic 参数强校验已由 FastAPI 自动完成；延迟预算从此刻开始计算
+    deadline = Deadline(comp.settings.request_timeout_ms)
+    # 答案缓存以 query 为键，不区分过滤范围：带过滤条件的请求不读写答案缓存
+    scoped = request.filter is not None and not request.filter.is_empty()
 
     # 2. 缓存检查
     try:
-        cached = comp.redis_cache.get_exact_cache(request.query)
-        if cached:
-            return ChatResponse(answer=cached, source="exact_cache")
+        if not scoped:
+            cached = comp.redis_cache.get_exact_cache(request.query)
+            if cached:
+                count_response("exact_cache")
+                return ChatResponse(answer=cached, source="exact_cache")
 
-        query_vec = comp.embedder.embed_384(request.query)
-        semantic_cached = comp.redis_cache.get_semantic_cache(query_vec)
-        if semantic_cached:
-            return ChatResponse(answer=semantic_cached, source="semantic_cache")
+            query_vec = comp.embedder.embed_384(request.query)
+            semantic_cached = comp.redis_cache.get_semantic_cache(query_vec)
+            if semantic_cached:
+                count_response("semantic_cache")
+                return ChatResponse(answer=semantic_cached, source="semantic_cache")
     except Exception as e:
         logger.warning("[Cache] 缓存查询失败（继续 RAG 链路）: %s", e)
 
@@ -56,26 +94,39 @@ async def chat(request: ChatRequest, comp: Components = Depends(get_components))
         history = []
 
     # 4. 查询改写（指代消解 + 问题扩展）
-    rewritten = comp.rewriter.rewrite(request.query, history)
+    rewritten = await comp.rewriter.arewrite(request.query, history, deadline)
 
     # 5. 三级检索
     results = await comp.retriever.retrieve(
-        request.query, rewritten, top_k=request.top_k
+        request.query,
+        rewritten,
+        top_k=request.top_k,
+        deadline=deadline,
+        metadata_filter=request.filter,
     )
 
-    # 6. LLM 生成
+    # 6. LLM 生成（超出预算时截断，已生成部分照常返回）
     chunks = [r.chunk for r in results]
-    answer_parts = []
-    async for token in comp.generator.generate_stream(request.query, chunks, history):
-        answer_parts.append(token)
+    answer_parts: list[str] = []
+
+    async def consume() -> None:
+        async for token in comp.generator.generate_stream(request.query, chunks, history):
+            answer_parts.append(token)
+
+    generation_ms = max(deadline.remaining_ms(), comp.settings.generation_min_timeout_ms)
+    try:
+        await asyncio.wait_for(consume(), generation_ms / 1000)
+    except asyncio.TimeoutError:
+        deadline.degrade(GENERATION_TRUNCATED, f"已生成 {len(answer_parts)} 段")
     answer = "".join(answer_parts)
 
     citations = [r.chunk.chunk_id for r in results]
 
-    # 7. 异步写缓存 + 更新会话
+    # 7. 异步写缓存 + 更新会话（降级产生的答案不写入答案缓存）
     try:
-        comp.redis_cache.set_exact_cache(request.query, answer)
-        comp.redis_cache.set_semantic_cache(request.query, query_vec, answer)
+        if not deadline.degradations and not scoped:
+            comp.redis_cache.set_exact_cache(request.query, answer)
+            comp.redis_cache.set_semantic_cache(request.query, query_vec, answer)
         comp.redis_cache.push_message(
             request.user_id,
             request.session_id,
@@ -95,21 +146,30 @@ async def chat(request: ChatRequest, comp: Components = Depends(get_components))
     except Exception as e:
         logger.warning("[Celery] 摘要任务触发失败: %s", e)
 
+    count_response("rag")
     return ChatResponse(
         answer=answer,
         citations=citations,
         rewritten_queries=rewritten,
         source="rag",
+        degradations=deadline.degradations,
     )
 
 
 @router.post("/chat/stream")
 async def chat_stream(request: ChatRequest, comp: Components = Depends(get_components)):
-    """SSE 流式问答接口（Server-Sent Events 打字机效果）。"""
+    """SSE 流式问答接口（Server-Sent Events 打字机效果）。
+
+    检索阶段的降级项通过响应头 X-RAG-Degradations 返回；生成超时截断时在 [DONE] 之前
+    追加一个 degradations 事件，携带包含 generation_truncated 的完整降级项。
+    """
+    deadline = Deadline(comp.settings.request_timeout_ms)
+    scoped = request.filter is not None and not request.filter.is_empty()
     # 1. 缓存检查
     try:
-        cached = comp.redis_cache.get_exact_cache(request.query)
+        cached = None if scoped else comp.redis_cache.get_exact_cache(request.query)
         if cached:
+            count_response("exact_cache")
 
             async def cached_stream():
                 yield f"data: {cached}\n\n"
@@ -127,28 +187,51 @@ async def chat_stream(request: ChatRequest, comp: Components = Depends(get_compo
     except Exception:
         history = []
 
-    rewritten = comp.rewriter.rewrite(request.query, history)
+    rewritten = await comp.rewriter.arewrite(request.query, history, deadline)
     results = await comp.retriever.retrieve(
-        request.query, rewritten, top_k=request.top_k
+        request.query,
+        rewritten,
+        top_k=request.top_k,
+        deadline=deadline,
+        metadata_filter=request.filter,
     )
     chunks = [r.chunk for r in results]
+    count_response("rag")
+
+    # 3. SSE 流式生成（与 /chat 相同的生成预算；超时截断，降级项随末尾事件返回）
+    generation_ms = max(deadline.remaining_ms(), comp.settings.generation_min_timeout_ms)
 
-    # 3. SSE 流式生成
     async def sse_generator():
         full_answer: list[str] = []
-        async for token in comp.generator.generate_stream(
-            request.query, chunks, history
-        ):
-            full_answer.append(token)
-            yield f"data: {token}\n\n"
+        loop = asyncio.get_running_loop()
+        stop_at = loop.time() + generation_ms / 1000
+        stream = comp.generator.generate_stream(request.query, chunks, history)
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(
+                        stream.__anext__(), max(stop_at - loop.time(), 0.0)
+                    )
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    deadline.degrade(GENERATION_TRUNCATED, f"已生成 {len(full_answer)} 段")
+                    # 响应头在开始推流时已固定，截断后的降级项通过单独事件告知客户端
+                    yield f"event: degradations\ndata: {','.join(deadline.degradations)}\n\n"
+                    break
+                full_answer.append(token)
+                yield f"data: {token}\n\n"
+        finally:
+            await stream.aclose()
         yield "data: [DONE]\n\n"
 
-        # 流结束后异步写缓存
+        # 流结束后异步写缓存（降级产生的答案不写入答案缓存）
         answer = "".join(full_answer)
         try:
-            query_vec = comp.embedder.embed_384(request.query)
-            comp.redis_cache.set_exact_cache(request.query, answer)
-            comp.redis_cache.set_semantic_cache(request.query, query_vec, answer)
+            if not deadline.degradations and not scoped:
+                query_vec = comp.embedder.embed_384(request.query)
+                comp.redis_cache.set_exact_cache(request.query, answer)
+                comp.redis_cache.set_semantic_cache(request.query, query_vec, answer)
             comp.redis_cache.push_message(
                 request.user_id,
                 request.session_id,
@@ -170,7 +253,11 @@ async def chat_stream(request: ChatRequest, comp: Components = Depends(get_compo
     return StreamingResponse(
         sse_generator(),
         media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-RAG-Degradations": ",".join(deadline.degradations),
+        },
     )
 
 
@@ -195,16 +282,35 @@ async def ingest_document(
             file_type="markdown",
         )
 
-    # 刷新 ES 索引使文档可搜索
-    try:
-        comp.bm25_engine.refresh()
-    except Exception:
-        pass
+    # ES refresh 与向量 flush 已在流水线内、缓存失效之前完成
+    return IngestResponse(status="success", chunks_created=len(chunks))
 
-    # 刷新 Milvus
-    try:
-        comp.vector_engine.flush()
-    except Exception:
-        pass
 
-    return IngestResponse(status="success", chunks_created=len(chunks))
+@router.post("/ingest/batch", response_model=IngestBatchResponse)
+async def ingest_batch(
+    request: IngestBatchRequest, comp: Components = Depends(get_components)
+):
+    """批量摄入接口：进程池解析切分 -> 合批 Embedding -> bulk 写入，跳过 Kafka。
+
+    Embedding / 写入失败不返回 500：未写完的文档连同失败原因逐条列在 errors 中。
+    已有批量摄入在运行时直接返回 409，不排队。
+    """
+    if _batch_ingest_lock.locked():
+        raise HTTPException(status_code=409, detail="已有批量摄入任务在运行，请稍后重试")
+    async with _batch_ingest_lock:
+        stats = await asyncio.to_thread(
+            comp.ingestion_pipeline.ingest_documents, request.documents, raise_on_error=False
+        )
+    status = "success"
+    if stats.failed:
+        status = "partial" if stats.documents else "failed"
+    return IngestBatchResponse(
+        status=status,
+        documents=stats.documents,
+        failed_doc_ids=stats.failed_doc_ids,
+        errors=stats.errors,
+        chunks_created=stats.chunks,
+        elapsed_ms=stats.elapsed_s * 1000,
+        docs_per_second=stats.docs_per_s,
+        utilization=stats.utilization(),
+    )
@@ -0,0 +1,137 @@
+"""Embedding 缓存：(模型版本, 维度, 文本摘要) -> float32 向量。
+
+重复摄入未变化的 chunk、热门 query 与其改写都会反复计算相同文本的向量。两级缓存：
+1. 进程内 LRU
+2. 磁盘 KV（可选，sqlite 单文件，WAL 模式），进程重启与多个 worker 之间共享
+
+键中的模型版本由 Embedder 提供，模型或哈希方案变化后旧向量自然不再命中。
+Embedder 只写入完整维度的向量，较小维度在读取后截断得到，同一文本只占一条。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from core.metrics import count_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# 单条 SELECT ... IN 的参数个数上限（低于 sqlite 默认的 999）
+_SQL_BATCH = 500
+
+
+def text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, version: str, capacity: int = 50000, path: str = ""):
+        self.version = version
+        self.capacity = capacity
+        self.path = path
+
+        self._lru: OrderedDict[tuple[int, str], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._db.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get_many(self, dim: int, digests: list[str]) -> dict[str, np.ndarray]:
+        """返回已缓存的 {摘要: 向量}，未命中的摘要不在结果中。"""
+        found: dict[str, np.ndarray] = {}
+        with self._lock:
+            for digest in digests:
+                vector = self._lru.get((dim, digest))
+                if vector is not None:
+                    self._lru.move_to_end((dim, digest))
+                    found[digest] = vector
+
+        missing = [d for d in dict.fromkeys(digests) if d not in found]
+        if missing and self._db is not None:
+            keys = {self._key(dim, d): d for d in missing}
+            names = list(keys)
+            rows = []
+            try:
+                with self._lock:
+                    for i in range(0, len(names), _SQL_BATCH):
+                        part = names[i : i + _SQL_BATCH]
+                        rows += self._db.execute(
+                            "SELECT key, vector FROM embeddings WHERE key IN "
+                            f"({','.join('?' * len(part))})",
+                            part,
+                        ).fetchall()
+            except sqlite3.Error as e:
+                logger.warning("[EmbeddingCache] 磁盘缓存读取失败: %s", e)
+            promoted = {keys[k]: np.frombuffer(v, dtype=np.float32) for k, v in rows}
+            self._put_local(dim, promoted)
+            found.update(promoted)
+            self.disk_hits += len(promoted)
+
+        hits = sum(1 for d in digests if d in found)
+        self.hits += hits
+        self.misses += len(digests) - hits
+        count_cache_lookup("embedding", True, hits)
+        count_cache_lookup("embedding", False, len(digests) - hits)
+        return found
+
+    def set_many(self, dim: int, vectors: dict[str, np.ndarray]) -> None:
+        if not vectors:
+            return
+        vectors = {d: np.ascontiguousarray(v, dtype=np.float32) for d, v in vectors.items()}
+        self._put_local(dim, vectors)
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(self._key(dim, d), v.tobytes()) for d, v in vectors.items()],
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("[EmbeddingCache] 磁盘缓存写入失败: %s", e)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # ---- 内部 ----
+
+    def _key(self, dim: int, digest: str) -> str:
+        return f"{self.version}:{dim}:{digest}"
+
+    def _put_local(self, dim: int, vectors: dict[str, np.ndarray]) -> None:
+        with self._lock:
+            for digest, vector in vectors.items():
+                self._lru[(dim, digest)] = vector
+                self._lru.move_to_end((dim, digest))
+            while len(self._lru) > self.capacity:
+                self._lru.popitem(last=False)
@@ -18,6 +18,7 @@ import numpy as np
 import redis
 
 from config.settings import Settings
+from core.metrics import count_cache_lookup, stage_timer
 
 logger = logging.getLogger(__name__)
 
@@ -83,7 +84,9 @@ class RedisCache:
     def get_exact_cache(self, query: str) -> str | None:
         """精确匹配缓存查询。"""
         key = self._exact_cache_key(query)
-        result = self.client.get(key)
+        with stage_timer("cache_lookup"):
+            result = self.client.get(key)
+        count_cache_lookup("exact", bool(result))
         if result:
             logger.info("[Cache] 精确缓存命中: %s", query[:30])
         return result
@@ -97,6 +100,12 @@ class RedisCache:
 
     def get_semantic_cache(self, query_vector: list[float]) -> str | None:
         """语义缓存查询：遍历已缓存的向量，余弦相似度 >= 阈值则命中。"""
+        with stage_timer("cache_lookup"):
+            answer = self._scan_semantic_cache(query_vector)
+        count_cache_lookup("semantic", answer is not None)
+        return answer
+
+    def _scan_semantic_cache(self, query_vector: list[float]) -> str | None:
         keys = self.client.keys("cache:semantic:*")
         if not keys:
             return None
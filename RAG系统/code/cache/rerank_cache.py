@@ -0,0 +1,268 @@
+"""Rerank 分数缓存：(规范化 query, chunk_id, reranker 版本) -> cross-encoder 分数。
+
+热门问题及其改写反复命中同一批候选，L3 是在线链路最贵的一环。
+两级缓存：
+1. 进程内 LRU：OrderedDict，按 chunk_id 建反向索引以便按 chunk 失效
+2. Redis（可选）：每个 (版本, query) 一个 Hash，field 为 chunk_id；
+   另以 Set 记录每个 chunk 出现在哪些 Hash 中，摄入时按 chunk 精确删除
+
+一次请求的全部候选通过 get_many / set_many 批量读写，Redis 侧各一次 pipeline 往返。
+
+失效：摄入进程调用 invalidate 删除本地与 Redis 中的条目；其他 worker 进程的本地 LRU
+通过共享 ChunkStore 的 MANIFEST generation 失效——读取前同步 MANIFEST，
+映射到新 segment 时删除其中 chunk 的分数（整体重新映射时清空）。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from core.metrics import count_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Redis 操作失败后暂停使用二级缓存的秒数，避免每个请求都等待连接超时
+_REDIS_RETRY_SECONDS = 30.0
+
+
+def normalize_query(query: str) -> str:
+    return _WHITESPACE.sub(" ", query.strip().lower())
+
+
+def query_digest(query: str) -> str:
+    return hashlib.blake2b(normalize_query(query).encode(), digest_size=16).hexdigest()
+
+
+class RerankCache:
+    def __init__(
+        self,
+        version: str,
+        capacity: int = 100000,
+        redis_cache=None,
+        ttl_seconds: int = 86400,
+        chunk_store=None,
+    ):
+        self.version = version
+        self.capacity = capacity
+        self.redis_cache = redis_cache
+        self.ttl = ttl_seconds
+        self.chunk_store = chunk_store
+
+        self._lru: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._by_chunk: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self._redis_retry_at = 0.0
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+        if chunk_store is not None:
+            chunk_store.add_listener(self._on_store_change)
+
+    # ---- 批量读写 ----
+
+    def get_many(self, query: str, chunk_ids: list[str]) -> dict[str, float]:
+        """返回已缓存的 {chunk_id: score}，未命中的 chunk 不在结果中。"""
+        if self.chunk_store is not None:
+            self.chunk_store.maybe_refresh()  # 先应用其他进程的写入，再读本地 LRU
+        digest = query_digest(query)
+        found: dict[str, float] = {}
+        with self._lock:
+            for chunk_id in chunk_ids:
+                score = self._lru.get((digest, chunk_id))
+                if score is not None:
+                    self._lru.move_to_end((digest, chunk_id))
+                    found[chunk_id] = score
+        local_hits = len(found)
+
+        missing = [c for c in chunk_ids if c not in found]
+        if missing and self._redis_usable():
+            try:
+                values = self._redis().hmget(self._redis_key(digest), missing)
+            except Exception as e:
+                self._redis_failed(e)
+            else:
+                promoted = {c: float(v) for c, v in zip(missing, values) if v is not None}
+                self._put_local(digest, promoted)
+                found.update(promoted)
+                self.redis_hits += len(promoted)
+
+        self.hits += len(found)
+        self.misses += len(chunk_ids) - len(found)
+        count_cache_lookup("rerank", True, len(found))
+        count_cache_lookup("rerank", False, len(chunk_ids) - len(found))
+        logger.debug(
+            "[RerankCache] %d 个候选: 本地命中 %d, Redis 命中 %d",
+            len(chunk_ids),
+            local_hits,
+            len(found) - local_hits,
+        )
+        return found
+
+    def set_many(self, query: str, scores: dict[str, float]) -> None:
+        if not scores:
+            return
+        digest = query_digest(query)
+        self._put_local(digest, scores)
+        if not self._redis_usable():
+            return
+        key = self._redis_key(digest)
+        try:
+            pipe = self._redis().pipeline(transaction=False)
+            pipe.hset(key, mapping={c: repr(float(s)) for c, s in scores.items()})
+            pipe.expire(key, self.ttl)
+            for chunk_id in scores:
+                pipe.sadd(self._chunk_key(chunk_id), key)
+                pipe.expire(self._chunk_key(chunk_id), self.ttl)
+            pipe.execute()
+        except Exception as e:
+            self._redis_failed(e)
+
+    def invalidate(self, chunk_ids: list[str]) -> int:
+        """删除这些 chunk 的全部缓存分数（重新摄入后调用），返回本地删除条数。"""
+        removed = self._invalidate_local(chunk_ids)
+        if chunk_ids and self._redis_usable():
+            try:
+                client = self._redis()
+                pipe = client.pipeline(transaction=False)
+                for chunk_id in chunk_ids:
+                    pipe.smembers(self._chunk_key(chunk_id))
+                members = pipe.execute()
+                pipe = client.pipeline(transaction=False)
+                for chunk_id, keys in zip(chunk_ids, members):
+                    for key in keys:
+                        pipe.hdel(key, chunk_id)
+                    pipe.delete(self._chunk_key(chunk_id))
+                pipe.execute()
+            except Exception as e:
+                self._redis_failed(e)
+
+        if removed:
+            logger.info("[RerankCache] 失效 %d 个 chunk 的 %d 条缓存", len(chunk_ids), removed)
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self._by_chunk.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    # ---- 内部 ----
+
+    def _invalidate_local(self, chunk_ids: list[str]) -> int:
+        removed = 0
+        with self._lock:
+            for chunk_id in chunk_ids:
+                for digest in self._by_chunk.pop(chunk_id, ()):
+                    if self._lru.pop((digest, chunk_id), None) is not None:
+                        removed += 1
+        return removed
+
+    def _on_store_change(self, chunk_ids: list[str] | None) -> None:
+        """其他进程发布了新 segment：Redis 已由写入方清理，这里只失效本地 LRU。"""
+        if chunk_ids is None:
+            self.clear()
+            return
+        removed = self._invalidate_local(chunk_ids)
+        if removed:
+            logger.info("[RerankCache] 同步其他进程写入，失效 %d 条缓存", removed)
+
+    def _put_local(self, digest: str, scores: dict[str, float]) -> None:
+        with self._lock:
+            for chunk_id, score in scores.items():
+                self._lru[(digest, chunk_id)] = float(score)
+                self._lru.move_to_end((digest, chunk_id))
+                self._by_chunk.setdefault(chunk_id, set()).add(digest)
+            while len(self._lru) > self.capacity:
+                (old_digest, old_chunk), _ = self._lru.popitem(last=False)
+                digests = self._by_chunk.get(old_chunk)
+                if digests is not None:
+                    digests.discard(old_digest)
+                    if not digests:
+                        del self._by_chunk[old_chunk]
+
+    def _redis_key(self, digest: str) -> str:
+        return f"rerank:{self.version}:{digest}"
+
+    def _chunk_key(self, chunk_id: str) -> str:
+        return f"rerank:{self.version}:chunk:{chunk_id}"
+
+    def _redis(self):
+        return self.redis_cache.client
+
+    def _redis_usable(self) -> bool:
+        return self.redis_cache is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error: Exception) -> None:
+        logger.warning(
+            "[RerankCache] Redis 操作失败，%.0fs 内只用本地缓存: %s", _REDIS_RETRY_SECONDS, error
+        )
+        self._redis_retry_at = time.monotonic() + _REDIS_RETRY_SECONDS
+
+
+class CachedReranker:
+    """在任意 reranker 外包一层分数缓存，只把未命中的候选交给模型打分。"""
+
+    def __init__(self, reranker, cache: RerankCache):
+        self.reranker = reranker
+        self.cache = cache
+
+    def _merge(
+        self,
+        query: str,
+        candidates: list[tuple[str, float]],
+        cached: dict[str, float],
+        fresh: list[tuple[str, float]],
+    ) -> list[tuple[str, float]]:
+        self.cache.set_many(query, dict(fresh))
+        scores = {**cached, **dict(fresh)}
+        results = [(c, scores[c]) for c, _ in candidates if c in scores]
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results
+
+    def rerank(
+        self,
+        query: str,
+        candidates: list[tuple[str, float]],
+        stats: dict[str, int] | None = None,
+    ) -> list[tuple[str, float]]:
+        """stats 不为空时写入 scored：实际交给模型打分的候选数。"""
+        cached = self.cache.get_many(query, [c for c, _ in candidates])
+        missing = [(c, s) for c, s in candidates if c not in cached]
+        if stats is not None:
+            stats["scored"] = len(missing)
+        fresh = self.reranker.rerank(query, missing) if missing else []
+        return self._merge(query, candidates, cached, fresh)
+
+    async def arerank(
+        self,
+        query: str,
+        candidates: list[tuple[str, float]],
+        stats: dict[str, int] | None = None,
+    ) -> list[tuple[str, float]]:
+        cached = self.cache.get_many(query, [c for c, _ in candidates])
+        missing = [(c, s) for c, s in candidates if c not in cached]
+        if stats is not None:
+            stats["scored"] = len(missing)
+        fresh = await self.reranker.arerank(query, missing) if missing else []
+        return self._merge(query, candidates, cached, fresh)
+
+    def close(self) -> None:
+        self.reranker.close()
@@ -0,0 +1,200 @@
+"""检索结果缓存：(query, 改写 query 集合, top_k) -> 最终 [(chunk_id, score), ...]。
+
+RedisCache 的精确 / 语义缓存只缓存最终答案，会话历史不同导致答案缓存未命中时，
+相同的改写 query 仍会重跑三级检索。本缓存位于检索层：
+1. 进程内 LRU
+2. Redis（可选），多个 API worker 共享
+
+每条结果携带写入时的索引代号（generation），摄入新文档时代号 +1，
+代号不一致的条目视为未命中，保证新文档入库后不会返回旧的检索结果。
+配置 Redis 时代号存在 Redis 中（跨进程一致），查询时与结果在同一次 pipeline 中读取；
+Redis 不可用时使用本地代号（本进程 bump 次数与 ChunkStore MANIFEST generation），
+其他 worker 写入共享 chunk_store_dir 并发布新 segment 后，本进程的旧条目同样失效。
+两种代号带不同前缀，Redis 故障前后写入的条目不会互相命中。
+写入时只接受检索开始前读到的代号：检索期间索引变化，结果直接丢弃。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from cache.rerank_cache import normalize_query
+from core.metrics import count_cache_lookup
+from models.schemas import RetrievalFilter
+
+logger = logging.getLogger(__name__)
+
+_GENERATION_KEY = "retrieval:generation"
+
+# Redis 操作失败后暂停使用二级缓存的秒数
+_REDIS_RETRY_SECONDS = 30.0
+
+
+def retrieval_key(
+    query: str,
+    rewritten_queries: list[str],
+    top_k: int,
+    metadata_filter: RetrievalFilter | None = None,
+) -> str:
+    """改写 query 规范化、去重、排序后与原始 query、top_k、过滤条件一起取摘要。
+
+    原始 query 参与 L2 alpha、768 维重打分与精排，因此也是键的一部分。
+    """
+    rewrites = sorted({normalize_query(q) for q in rewritten_queries})
+    scope = ""
+    if metadata_filter is not None and not metadata_filter.is_empty():
+        scope = json.dumps(
+            {
+                "doc_ids": sorted(set(metadata_filter.doc_ids or [])),
+                "node_types": sorted(set(metadata_filter.node_types or [])),
+                "heading_prefix": metadata_filter.heading_prefix or "",
+            },
+            ensure_ascii=False,
+        )
+    raw = "\n".join([normalize_query(query), str(top_k), scope, *rewrites])
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+class RetrievalCache:
+    def __init__(
+        self,
+        capacity: int = 10000,
+        redis_cache=None,
+        ttl_seconds: int = 3600,
+        chunk_store=None,
+    ):
+        self.capacity = capacity
+        self.redis_cache = redis_cache
+        self.ttl = ttl_seconds
+        self.chunk_store = chunk_store
+
+        self._lru: OrderedDict[str, tuple[str, list[tuple[str, float]]]] = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._redis_retry_at = 0.0
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> tuple[list[tuple[str, float]] | None, str]:
+        """返回 (命中结果或 None, 查询时的索引代号)；代号须原样传给之后的 set()。"""
+        generation = None
+        redis_value = None
+        if self._redis_usable():
+            try:
+                pipe = self._redis().pipeline(transaction=False)
+                pipe.get(_GENERATION_KEY)
+                pipe.get(self._redis_key(key))
+                remote_gen, redis_value = pipe.execute()
+                generation = f"r:{int(remote_gen or 0)}"
+            except Exception as e:
+                self._redis_failed(e)
+        if generation is None:
+            generation = self._local_generation()
+
+        hits = None
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None and entry[0] == generation:
+                self._lru.move_to_end(key)
+                hits = entry[1]
+        if hits is None and redis_value is not None:
+            data = json.loads(redis_value)
+            if data["generation"] == generation:
+                hits = [(cid, score) for cid, score in data["hits"]]
+                self._put_local(key, generation, hits)
+
+        if hits is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        count_cache_lookup("retrieval", hits is not None)
+        return hits, generation
+
+    def current_generation(self) -> str:
+        """Redis 可用时取 Redis 计数，否则取本地代号；两者带不同前缀，不会相等。"""
+        if self._redis_usable():
+            try:
+                return f"r:{int(self._redis().get(_GENERATION_KEY) or 0)}"
+            except Exception as e:
+                self._redis_failed(e)
+        return self._local_generation()
+
+    def set(self, key: str, hits: list[tuple[str, float]], generation: str) -> bool:
+        """generation 为检索开始前 get() 返回的代号；期间索引发生变化则放弃写入。"""
+        if self.current_generation() != generation:
+            logger.debug("[RetrievalCache] 检索期间索引代号变化，结果不写入缓存")
+            return False
+        if generation.startswith("r:"):
+            try:
+                self._redis().setex(
+                    self._redis_key(key),
+                    self.ttl,
+                    json.dumps({"generation": generation, "hits": hits}),
+                )
+            except Exception as e:
+                self._redis_failed(e)
+        self._put_local(key, generation, hits)
+        return True
+
+    def bump_generation(self) -> str:
+        """索引内容变化后调用，之前缓存的检索结果全部失效。"""
+        with self._lock:
+            self._generation += 1
+            self._lru.clear()
+        if self._redis_usable():
+            try:
+                self._redis().incr(_GENERATION_KEY)
+            except Exception as e:
+                self._redis_failed(e)
+        generation = self.current_generation()
+        logger.info("[RetrievalCache] 索引代号 -> %s", generation)
+        return generation
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "generation": self.current_generation(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+    # ---- 内部 ----
+
+    def _local_generation(self) -> str:
+        """本进程 bump 次数与 ChunkStore MANIFEST generation：任一变化即代表索引被写入过。"""
+        if self.chunk_store is None:
+            return f"l:{self._generation}"
+        self.chunk_store.maybe_refresh()
+        return f"l:{self._generation}:{self.chunk_store.generation}"
+
+    def _put_local(self, key: str, generation: str, hits: list[tuple[str, float]]) -> None:
+        with self._lock:
+            self._lru[key] = (generation, hits)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.capacity:
+                self._lru.popitem(last=False)
+
+    def _redis_key(self, key: str) -> str:
+        return f"retrieval:{key}"
+
+    def _redis(self):
+        return self.redis_cache.client
+
+    def _redis_usable(self) -> bool:
+        return self.redis_cache is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error: Exception) -> None:
+        logger.warning(
+            "[RetrievalCache] Redis 操作失败，%.0fs 内只用本地缓存: %s",
+            _REDIS_RETRY_SECONDS,
+            error,
+        )
+        self._redis_retry_at = time.monotonic() + _REDIS_RETRY_SECONDS
@@ -21,10 +21,55 @@ class Settings(BaseSettings):
     level1_topk: int = 1500
     level2_topk: int = 80
     level3_topk: int = 10
+    level1_timeout_ms: int = 2000  # L1 多路召回整体超时
+    level1_max_workers: int = 8  # L1 并发召回线程池上限
+    level2_dense_rescore: bool = True  # L2 是否用 768 维向量对候选重打分
+    level2_rescore_candidates: int = 300  # 进入 768 维重打分的候选数
+
+    # ---- 延迟预算 ----
+    request_timeout_ms: float = 8000.0  # /chat 整体预算，各阶段超时取 min(阶段预算, 剩余预算)
+    rewrite_timeout_ms: float = 1000.0  # LLM 改写，超时降级为规则改写
+    level2_timeout_ms: float = 500.0  # 768 维重打分，超时使用 384 维融合结果
+    rerank_timeout_ms: float = 800.0  # cross-encoder 精排，超时使用 RSF 融合顺序
+    generation_min_timeout_ms: float = 3000.0  # 总预算耗尽时生成阶段仍保留的最短时长
 
     # ---- Rerank 截断参数 ----
     rerank_diff_threshold: float = 0.8
 
+    # ---- 自适应 Rerank 深度 ----
+    rerank_adaptive_depth: bool = False  # 开启后按 RSF 分差与剩余预算决定精排候选数
+    rerank_min_depth: int = 20  # 分差断点前至少精排的候选数
+    rerank_skip_gap: float = 0.35  # top1 与 top2 的 RSF 分差达到该值时跳过 cross-encoder
+    rerank_gap_threshold: float = 0.15  # 相邻 RSF 分差达到该值时只精排断点之前的候选
+    rerank_latency_budget_ms: float = 1500.0  # 检索整体预算，剩余不足时缩减精排深度
+
+    # ---- Reranker 推理 ----
+    reranker_backend: str = "simulated"  # "simulated" | "torch" | "onnx"
+    reranker_model_dir: str = ""  # cross-encoder 模型目录（onnx 需含 model.onnx）
+    reranker_max_length: int = 512  # (query, doc) 对的最大 token 数
+    rerank_max_batch_size: int = 64  # 单次前向的最大 pair 数
+    rerank_max_wait_ms: float = 5.0  # 请求密集时首个 pair 入队后最长等待合批时间，稀疏时不等待
+    reranker_version: str = "v1"  # 模型或打分逻辑变更时修改，旧的分数缓存随之失效
+
+    # ---- Rerank 分数缓存 ----
+    rerank_cache_enabled: bool = True
+    rerank_cache_capacity: int = 100000  # 进程内 LRU 条目上限（query x chunk）
+    rerank_cache_redis: bool = False  # 是否启用 Redis 二级缓存
+    rerank_cache_ttl_seconds: int = 86400
+
+    # ---- 检索结果缓存 ----
+    retrieval_cache_enabled: bool = True
+    retrieval_cache_capacity: int = 10000  # 进程内 LRU 条目上限
+    retrieval_cache_redis: bool = False  # 是否启用 Redis 二级缓存（多 worker 共享）
+    retrieval_cache_ttl_seconds: int = 3600
+
+    # ---- 元数据过滤 ----
+    milvus_filter_max_ids: int = 10000  # 非 doc_id 条件下推为 chunk_id in [...] 时单个表达式的 id 上限，超出则分段检索
+
+    # ---- 分词 ----
+    tokenizer_user_dict: str = ""  # jieba 领域词典路径，启动时加载
+    tokenizer_cache_size: int = 10000  # query 分词 LRU 条目上限
+
     # ---- Chunk 参数 ----
     chunk_leaf_min_tokens: int = 512
     chunk_leaf_max_tokens: int = 800
@@ -42,14 +87,60 @@ class Settings(BaseSettings):
 
     # ---- Embedding ----
     embedding_dim_light: int = 384
-    embedding_dim_dense: int = 768
+    embedding_dim_dense: int = 768  # 后端输出维度，384 维由其截断得到（Matryoshka）
+    embedding_backend: str = "hash"  # "hash" | "gte"
+    embedding_model_dir: str = ""  # gte 模型目录
+    embedding_max_length: int = 512  # gte 输入的最大 token 数
+    embedding_device: str = "cpu"  # gte 推理设备
+    embedding_hash_buckets: int = 16384  # 特征哈希桶数（投影表行数）
+    embedding_batch_size: int = 256  # 摄入时每批 embedding 的 chunk 数
+    embedding_model_version: str = "v1"  # 与后端名一起参与 embedding 缓存键，模型重新微调时更新
+
+    # ---- Embedding 缓存 ----
+    embedding_cache_enabled: bool = True
+    embedding_cache_capacity: int = 50000  # 进程内 LRU 条目上限（每条文本只缓存完整维度向量）
+    embedding_cache_path: str = ""  # sqlite 磁盘缓存路径，为空则只用进程内 LRU
+
+    # ---- 批量摄入 ----
+    ingest_workers: int = 0  # 解析 / 清洗 / 切分 / 分词进程数，0 为 CPU 核数，1 为在当前进程内执行
+    ingest_queue_size: int = 64  # 阶段之间的队列容量（文档数或 embedding 批数）
+    ingest_write_batch_size: int = 2000  # 写入阶段合并后每批写入的 chunk 数
+    ingest_inprocess_threshold: int = 16  # 文档数少于该值时 prepare 在当前进程内执行，不经过进程池
 
     # ---- Milvus Collection ----
     milvus_collection_384: str = "rag_vectors_384"
     milvus_collection_768: str = "rag_vectors_768"
+    milvus_insert_batch_size: int = 1000  # 单次 insert RPC 的最大行数
+
+    # ---- BM25 后端 ----
+    bm25_backend: str = "elasticsearch"  # "elasticsearch" | "local"
+    bm25_fallback_local: bool = False  # ES 连接失败时切换到进程内 BM25（有快照则加载，否则由 chunk store 重建）
+    bm25_local_snapshot: str = ""  # 进程内 BM25 快照路径（.npz），为空不落盘
+
+    # ---- 向量后端 ----
+    vector_backend: str = "milvus"  # "milvus" | "local"
+    vector_fallback_local: bool = False  # Milvus 连接失败时切换到进程内向量索引（仅当 local_vector_dir 已有持久化索引）
+    local_vector_dir: str = ""  # 进程内向量索引的 .npy 目录，为空不落盘
+    local_vector_index_type: str = "flat"  # "flat" 精确检索 | "ivf" 倒排粗聚类
+    local_ivf_nlist: int = 256  # IVF 聚类中心数
+    local_ivf_nprobe: int = 16  # 检索时探测的簇数
+    local_ivf_min_rows: int = 20000  # 向量数低于该值时仍走 flat
+    local_ivf_retrain_ratio: float = 0.5  # 存活行数比上次训练时增长超过该比例才重新 k-means
+    local_vector_quantization: str = "none"  # 384 维层量化: "none" | "float16" | "int8"
+    local_vector_rescore_factor: int = 2  # 量化近似召回 top_k x factor 后精确重打分
 
     # ---- Elasticsearch Index ----
     es_index_name: str = "rag_chunks"
+    es_bulk_batch_size: int = 500  # 每个 bulk 请求的文档数
+    es_bulk_workers: int = 4  # 并行 bulk 写入线程数
+    es_bulk_refresh_threshold: int = 2000  # 单次写入超过该 chunk 数时关闭自动 refresh
+    es_backfill_poll_interval_s: float = 5.0  # heading_path.raw 后台回填任务的状态轮询间隔（秒）
+
+    # ---- Chunk Store ----
+    chunk_store_dir: str = ""  # 磁盘 segment 目录，为空则只保存在内存
+    chunk_store_max_segments: int = 32  # segment 数超过该值时合并
+    chunk_store_refresh_interval_ms: int = 1000  # 读者检查 MANIFEST 新 generation 的间隔
+    chunk_store_text_cache_size: int = 4096  # 解码后文本的缓存条数，0 关闭
 
     # ---- Kafka Topics ----
     kafka_topic_text: str = "topic_text_slice"
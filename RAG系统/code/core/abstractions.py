@@ -5,7 +5,8 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 from typing import AsyncIterator
 
-from models.schemas import DocumentChunk, RetrievedChunk
+from core.deadline import Deadline
+from models.schemas import DocumentChunk, RetrievalFilter, RetrievedChunk
 
 
 class DocumentParser(ABC):
@@ -29,7 +30,12 @@ class PipelineRetriever(ABC):
 
     @abstractmethod
     async def retrieve(
-        self, query: str, rewritten_queries: list[str], top_k: int = 10
+        self,
+        query: str,
+        rewritten_queries: list[str],
+        top_k: int = 10,
+        deadline: Deadline | None = None,
+        metadata_filter: RetrievalFilter | None = None,
     ) -> list[RetrievedChunk]: ...
 
 
@@ -87,3 +87,40 @@ def rerank_with_threshold_cutoff(
             break
 
     return output
+
+
+def choose_rerank_depth(
+    fused_scores: list[float],
+    max_depth: int,
+    min_depth: int = 20,
+    skip_gap: float = 0.35,
+    gap_threshold: float = 0.15,
+    remaining_ms: float | None = None,
+    cost_per_candidate_ms: float | None = None,
+) -> tuple[int, str]:
+    """根据 RSF 分数分布与剩余延迟预算决定 cross-encoder 精排深度。
+
+    fused_scores 为降序的 RSF 融合分，返回 (depth, reason)，depth=0 表示跳过精排：
+    1. top1 与 top2 分差 >= skip_gap：排序已足够确定，跳过精排
+    2. 在 [min_depth, max_depth) 内找到第一个相邻分差 >= gap_threshold 的断点，只精排断点之前
+    3. 剩余预算 / 单候选精排耗时 不足 depth 时缩减深度，连 min_depth 都不够则跳过
+    """
+    n = min(len(fused_scores), max_depth)
+    if n <= 1:
+        return n, "full"
+
+    depth, reason = n, "full"
+    if fused_scores[0] - fused_scores[1] >= skip_gap:
+        return 0, "decisive_top"
+    for i in range(min_depth, n):
+        if fused_scores[i - 1] - fused_scores[i] >= gap_threshold:
+            depth, reason = i, "score_gap"
+            break
+
+    if remaining_ms is not None and cost_per_candidate_ms:
+        affordable = int(max(remaining_ms, 0.0) / cost_per_candidate_ms)
+        if affordable < depth:
+            if affordable < min(min_depth, n):
+                return 0, "budget_exhausted"
+            depth, reason = affordable, "budget"
+    return depth, reason
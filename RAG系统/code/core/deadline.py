@@ -0,0 +1,54 @@
+"""请求级延迟预算：一个 Deadline 贯穿 改写 -> L1 -> L2 -> L3 -> 生成。
+
+每个阶段取 min(阶段预算, 剩余总预算) 作为超时；超时后阶段切换到更便宜的路径，
+并在 Deadline 上登记降级项，最终随 ChatResponse.degradations 返回。
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+
+from core.metrics import count_degradation
+
+logger = logging.getLogger(__name__)
+
+# 降级项名称
+RULE_REWRITE = "rule_rewrite"  # LLM 改写超时，使用规则改写
+BM25_ONLY = "bm25_only"  # 向量召回超时，L1 只用 BM25
+VECTOR_ONLY = "vector_only"  # BM25 召回超时，L1 只用向量
+NO_DENSE_RESCORE = "no_dense_rescore"  # 768 维重打分超时，使用 384 维融合结果
+NO_RERANK = "no_rerank"  # 精排超时，使用 RSF 融合顺序
+GENERATION_TRUNCATED = "generation_truncated"  # 生成超时，答案被截断
+
+
+class Deadline:
+    def __init__(self, total_ms: float):
+        self.total_ms = total_ms
+        self._start = time.perf_counter()
+        self.degradations: list[str] = []
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def remaining_ms(self) -> float:
+        return max(self.total_ms - self.elapsed_ms(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining_ms() <= 0
+
+    def budget_s(self, stage_ms: float) -> float:
+        """阶段超时（秒）：阶段预算与剩余总预算取小。"""
+        return min(stage_ms, self.remaining_ms()) / 1000
+
+    def degrade(self, name: str, reason: str = "") -> None:
+        if name not in self.degradations:
+            self.degradations.append(name)
+            count_degradation(name)
+        logger.warning(
+            "[Deadline] 降级 %s (已用 %.0fms/%.0fms) %s",
+            name,
+            self.elapsed_ms(),
+            self.total_ms,
+            reason,
+        )
@@ -0,0 +1,171 @@
+"""Prometheus 指标：各阶段延迟直方图、候选数 Gauge、缓存命中计数。
+
+prometheus_client 为可选依赖，未安装时所有埋点退化为空操作，/metrics 返回 503。
+埋点只做一次 labels 查找 + 原子累加，可放在请求热路径上。
+
+多 worker 部署（gunicorn / uvicorn --workers）时每个进程各有一份计数，
+需在启动前设置 PROMETHEUS_MULTIPROC_DIR（空目录）：埋点写入该目录下的 mmap 文件，
+/metrics 由 MultiProcessCollector 汇总所有 worker；worker 退出时调用 mark_process_dead。
+未设置时指标只反映处理本次 /metrics 请求的那个进程。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 1ms ~ 10s，覆盖缓存查询到完整生成
+_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class _Noop:
+    def labels(self, *args, **kwargs) -> _Noop:
+        return self
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+
+class _Metrics:
+    def __init__(self):
+        try:
+            from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+        except ImportError:
+            logger.info("[Metrics] 未安装 prometheus_client，指标埋点关闭")
+            self.registry = None
+            self.stage_latency = self.candidates = _Noop()
+            self.cache_lookups = self.responses = self.degradations = _Noop()
+            return
+
+        self.registry = CollectorRegistry()
+        self.stage_latency = Histogram(
+            "rag_stage_latency_seconds",
+            "各阶段耗时",
+            ["stage"],
+            buckets=_LATENCY_BUCKETS,
+            registry=self.registry,
+        )
+        self.candidates = Gauge(
+            "rag_candidates",
+            "最近一次请求各阶段的候选数",
+            ["stage"],
+            registry=self.registry,
+            multiprocess_mode="livemostrecent",  # 多进程下取存活 worker 中最近一次写入
+        )
+        self.cache_lookups = Counter(
+            "rag_cache_lookups_total",
+            "缓存查询次数",
+            ["cache", "result"],
+            registry=self.registry,
+        )
+        self.responses = Counter(
+            "rag_chat_responses_total",
+            "问答响应数（按 ChatResponse.source）",
+            ["source"],
+            registry=self.registry,
+        )
+        self.degradations = Counter(
+            "rag_degradations_total",
+            "延迟预算触发的降级次数",
+            ["kind"],
+            registry=self.registry,
+        )
+
+
+_metrics: _Metrics | None = None
+
+
+def get_metrics() -> _Metrics:
+    global _metrics
+    if _metrics is None:
+        _metrics = _Metrics()
+    return _metrics
+
+
+# ---- 埋点 ----
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    get_metrics().stage_latency.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def set_candidates(stage: str, count: int) -> None:
+    get_metrics().candidates.labels(stage).set(count)
+
+
+def count_cache_lookup(cache: str, hit: bool, amount: int = 1) -> None:
+    if amount:
+        get_metrics().cache_lookups.labels(cache, "hit" if hit else "miss").inc(amount)
+
+
+def count_response(source: str) -> None:
+    get_metrics().responses.labels(source).inc()
+
+
+def count_degradation(kind: str) -> None:
+    get_metrics().degradations.labels(kind).inc()
+
+
+class GenerationTimer:
+    """流式生成计时：首 token 延迟与完整生成耗时。"""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._first_seen = False
+
+    def token(self) -> None:
+        if not self._first_seen:
+            self._first_seen = True
+            observe_stage("generation_first_token", time.perf_counter() - self._start)
+
+    def finish(self) -> None:
+        observe_stage("generation_total", time.perf_counter() - self._start)
+
+
+def render() -> tuple[bytes, str] | None:
+    """Prometheus 文本格式的指标快照；未安装 prometheus_client 时返回 None。"""
+    metrics = get_metrics()
+    if metrics.registry is None:
+        return None
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+
+    registry = metrics.registry
+    if _multiproc_dir():
+        from prometheus_client.multiprocess import MultiProcessCollector
+
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """多进程模式下清理已退出 worker 的 live Gauge 文件（gunicorn child_exit 钩子中调用）。"""
+    if _multiproc_dir() and get_metrics().registry is not None:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
+
+
+def _multiproc_dir() -> str:
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")
@@ -0,0 +1,110 @@
+"""共享分词服务：jieba 词典启动时加载一次，query 分词结果进程内 LRU 缓存。
+
+同一请求中 RSF alpha（token 数）、进程内 BM25（检索词）、Reranker（query 词集合）
+都读取同一个 TokenizedQuery，query 只分词一次；改写 query 与热门问题跨请求命中缓存。
+文档侧（摄入、无预计算词表的 chunk）走 cut()，不进入缓存。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TokenizedQuery:
+    text: str
+    tokens: tuple[str, ...]  # jieba 原始切分结果（含空白 token）
+    terms: frozenset[str] = field(init=False)  # 去重后的非空白 token
+
+    def __post_init__(self):
+        object.__setattr__(self, "terms", frozenset(t for t in self.tokens if t.strip()))
+
+    @property
+    def token_count(self) -> int:
+        return len(self.tokens)
+
+
+class TokenizerService:
+    def __init__(self, user_dict: str = "", cache_size: int = 10000):
+        self.user_dict = user_dict
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, TokenizedQuery] = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> None:
+        """加载 jieba 主词典与领域词典；未调用时由第一次分词触发 jieba 的惰性加载。"""
+        import jieba
+
+        start = time.perf_counter()
+        jieba.initialize()
+        if self.user_dict:
+            if os.path.exists(self.user_dict):
+                jieba.load_userdict(self.user_dict)
+            else:
+                logger.warning("[Tokenizer] 领域词典不存在: %s", self.user_dict)
+        self._loaded = True
+        logger.info(
+            "[Tokenizer] 词典加载完成 (%.0fms)", (time.perf_counter() - start) * 1000
+        )
+
+    def cut(self, text: str) -> list[str]:
+        """文档分词，不缓存。"""
+        import jieba
+
+        return list(jieba.cut(text))
+
+    def query(self, text: str) -> TokenizedQuery:
+        """query 分词，按原文 LRU 缓存。"""
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        tokenized = TokenizedQuery(text, tuple(self.cut(text)))
+        with self._lock:
+            self._cache[text] = tokenized
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokenized
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "loaded": self._loaded,
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+_tokenizer: TokenizerService | None = None
+
+
+def get_tokenizer() -> TokenizerService:
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = TokenizerService()
+    return _tokenizer
+
+
+def init_tokenizer(user_dict: str = "", cache_size: int = 10000) -> TokenizerService:
+    """启动时调用：按配置替换全局分词服务并立即加载词典，避免首个请求承担加载耗时。"""
+    global _tokenizer
+    _tokenizer = TokenizerService(user_dict, cache_size)
+    _tokenizer.load()
+    return _tokenizer
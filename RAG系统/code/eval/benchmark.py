@@ -0,0 +1,573 @@
+"""检索组件性能基准：在示例语料上对比各实现的延迟与结果一致性。
+
+运行方式
+--------
+  cd code/
+
+  # 进程内 BM25 vs Elasticsearch（ES 未启动时只测进程内引擎）
+  python eval/benchmark.py bm25
+
+  # 语料放大 50 倍（chunk_id 加后缀复制），观察规模对延迟的影响
+  python eval/benchmark.py bm25 --scale 50
+
+  # 384 维向量索引：float32 / float16 / int8 的 Recall@K、延迟与常驻内存
+  python eval/benchmark.py vector --size 200000
+
+  # chunk 存储：dict[str, DocumentChunk] vs 列式 ChunkStore 的内存占用
+  python eval/benchmark.py chunk_store --scale 20
+
+  # Reranker：逐条分词打分 vs 预计算词表批量打分（每请求 CPU 时间）
+  python eval/benchmark.py rerank --candidates 80
+
+  # Cross-encoder 推理：逐请求 max_length padding vs 动态微批（模拟后端的吞吐与延迟）
+  python eval/benchmark.py rerank_server --concurrency 32
+
+  # Embedder：逐 n-gram 构造 RNG vs 特征哈希投影表批量计算（chunks/sec）
+  python eval/benchmark.py embedder --scale 10
+
+  # 摄入：逐文档 ingest_document_direct vs 三阶段批量 ingest_documents（docs/sec 与各阶段利用率）
+  python eval/benchmark.py ingest --scale 50 --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+# 保证从 code/ 目录导入
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from config.settings import Settings
+from eval.dataset import EVAL_SAMPLES
+from models.schemas import DocumentChunk
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 公共工具
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def load_sample_chunks(settings: Settings, scale: int = 1) -> list[DocumentChunk]:
+    """解析 + 清洗 + 切分示例文档并预先分词；scale > 1 时按副本复制 chunk。"""
+    from core.tokenizer import get_tokenizer
+    from data.sample_documents import SAMPLE_DOCUMENTS
+    from ingestion.chunk_splitter import HierarchicalChunkSplitter
+    from ingestion.data_cleaner import DataCleaner
+    from ingestion.document_parser import MarkdownDocumentParser
+
+    parser = MarkdownDocumentParser()
+    cleaner = DataCleaner()
+    splitter = HierarchicalChunkSplitter(settings)
+
+    base: list[DocumentChunk] = []
+    for doc in SAMPLE_DOCUMENTS:
+        markdown = cleaner.clean(parser.parse(doc["content"], "markdown"))
+        base.extend(splitter.split(markdown, doc["doc_id"], doc["doc_name"]))
+    for chunk in base:
+        chunk.bm25_tokens = get_tokenizer().cut(chunk.text)
+
+    if scale <= 1:
+        return base
+    chunks = list(base)
+    for i in range(1, scale):
+        for chunk in base:
+            chunks.append(chunk.model_copy(update={"chunk_id": f"{chunk.chunk_id}#{i}"}))
+    return chunks
+
+
+def sample_queries() -> list[str]:
+    return [s["query"] for s in EVAL_SAMPLES]
+
+
+def time_calls(fn: Callable[[], object], repeat: int) -> list[float]:
+    """重复调用 fn，返回每次耗时（ms）。"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def summarize(durations: list[float]) -> str:
+    ordered = sorted(durations)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"p50={statistics.median(ordered):8.2f}ms  p95={p95:8.2f}ms"
+
+
+def overlap_at_k(a: list[tuple[str, float]], b: list[tuple[str, float]], k: int) -> float:
+    top_a = {cid for cid, _ in a[:k]}
+    top_b = {cid for cid, _ in b[:k]}
+    return len(top_a & top_b) / max(len(top_a | top_b), 1)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# bm25：进程内 BM25 vs Elasticsearch
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def bench_bm25(args: argparse.Namespace) -> None:
+    from retrieval.bm25_engine import BM25Engine
+    from retrieval.local_bm25_engine import LocalBM25Engine
+
+    settings = Settings(es_index_name="rag_chunks_bench")
+    chunks = load_sample_chunks(settings, args.scale)
+    queries = sample_queries()
+    top_k = settings.level1_topk
+    print(f"\n[bm25] 语料 {len(chunks)} chunks, {len(queries)} 条 query, top_k={top_k}")
+
+    engines: dict[str, object] = {}
+
+    local = LocalBM25Engine(settings)
+    start = time.perf_counter()
+    local.index_chunks(chunks)
+    local.refresh()
+    print(f"  local  索引耗时: {(time.perf_counter() - start) * 1000:8.1f}ms")
+    engines["local"] = local
+
+    es = BM25Engine(settings)
+    try:
+        es.connect()
+        start = time.perf_counter()
+        es.index_chunks(chunks)
+        es.refresh()
+        print(f"  es     索引耗时: {(time.perf_counter() - start) * 1000:8.1f}ms")
+        engines["es"] = es
+    except Exception as e:
+        print(f"  es     [跳过] Elasticsearch 不可用: {e}")
+
+    for name, engine in engines.items():
+        single = []
+        for q in queries:
+            single.extend(time_calls(lambda q=q: engine.search(q, top_k), args.repeat))
+        batch = time_calls(lambda: engine.search_many(queries, top_k), args.repeat)
+        print(f"  {name:<6} 单 query    {summarize(single)}")
+        print(f"  {name:<6} search_many {summarize(batch)}  ({len(queries)} 条/次)")
+
+    if "es" in engines:
+        local_hits = local.search_many(queries, top_k)
+        es_hits = es.search_many(queries, top_k)
+        overlaps = [overlap_at_k(a, b, 10) for a, b in zip(local_hits, es_hits)]
+        print(f"  Top10 结果重合度 (Jaccard): {statistics.mean(overlaps):.2f}")
+        es.delete_index()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# vector：量化向量存储的召回率与内存
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def bench_vector(args: argparse.Namespace) -> None:
+    import numpy as np
+
+    from ingestion.embedder import Embedder
+    from retrieval.local_vector_engine import LocalVectorEngine
+
+    settings = Settings()
+    embedder = Embedder(settings)
+    base = np.asarray(
+        [embedder.embed_384(c.text) for c in load_sample_chunks(settings)],
+        dtype=np.float32,
+    )
+    # 以示例 chunk 为簇中心加噪声扩充到 --size 条，近似真实语料的聚簇分布
+    rng = np.random.default_rng(0)
+    centers = base[rng.integers(len(base), size=args.size)]
+    vectors = centers + rng.standard_normal(centers.shape).astype(np.float32) * (
+        args.noise / np.sqrt(base.shape[1])
+    )
+    chunks = [
+        DocumentChunk(
+            chunk_id=f"v{i}",
+            text="",
+            metadata={"chunk_id": f"v{i}", "doc_id": "bench", "doc_name": "bench"},
+            vector_384=vec.tolist(),
+        )
+        for i, vec in enumerate(vectors)
+    ]
+    queries = [embedder.embed_384(q) for q in sample_queries()]
+    top_k = min(args.top_k, args.size)
+    print(f"\n[vector] {args.size} 条 384 维向量, {len(queries)} 条 query, top_k={top_k}")
+
+    truth: list[set[str]] = []
+    for mode in ("none", "float16", "int8"):
+        engine = LocalVectorEngine(
+            Settings(
+                local_vector_quantization=mode,
+                local_vector_index_type=args.index_type,
+            )
+        )
+        engine.insert_chunks(chunks)
+        hits = engine.search_384_many(queries, top_k)
+        if mode == "none":
+            truth = [{cid for cid, _ in h} for h in hits]
+        recall = statistics.mean(
+            len(t & {cid for cid, _ in h}) / max(len(t), 1) for t, h in zip(truth, hits)
+        )
+        durations = time_calls(lambda: engine.search_384_many(queries, top_k), args.repeat)
+        resident = engine.memory_usage()["vectors_384"]
+        print(
+            f"  {mode:<8} Recall@{top_k}={recall:.4f}  {summarize(durations)}  "
+            f"常驻 {resident / 2**20:8.1f}MB ({resident / args.size:.0f} B/向量)"
+        )
+        engine.drop_collections()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# chunk_store：dict vs 列式 ChunkStore 内存
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def bench_chunk_store(args: argparse.Namespace) -> None:
+    import tracemalloc
+
+    from ingestion.embedder import Embedder
+    from storage.chunk_store import ChunkStore
+
+    settings = Settings()
+    embedder = Embedder(settings)
+    base = load_sample_chunks(settings)
+    for chunk in base:
+        chunk.vector_384, chunk.vector_768 = embedder.embed_dual(chunk.text)
+    messages = [c.model_dump_json() for c in base]
+    n = len(base) * args.scale
+    print(f"\n[chunk_store] {n} chunks（含 384 + 768 维向量与分词，ChunkStore 不保存向量）")
+
+    def build(factory, keep_vectors: bool = True):
+        """模拟摄入：每个 chunk 从消息反序列化后写入存储，统计存储净增内存。"""
+        tracemalloc.start()
+        store = factory()
+        for i in range(args.scale):
+            for msg in messages:
+                chunk = DocumentChunk.model_validate_json(msg)
+                chunk.chunk_id = f"{chunk.chunk_id}#{i}"
+                if not keep_vectors:
+                    chunk.vector_384 = chunk.vector_768 = None
+                store[chunk.chunk_id] = chunk
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return store, size
+
+    # 两项收益分开报告：不保存向量（dict 含向量 vs 不含）与列式布局（dict 不含向量 vs ChunkStore）
+    dict_store, dict_bytes = build(dict)
+    _, text_bytes = build(dict, keep_vectors=False)
+    columnar, col_bytes = build(ChunkStore)
+    for name, size in (
+        ("dict", dict_bytes),
+        ("dict-text", text_bytes),  # 同一 dict，写入前清空向量
+        ("ChunkStore", col_bytes),
+    ):
+        print(f"  {name:<10} {size / 2**20:8.1f}MB  ({size / n:8.0f} B/chunk)")
+    print(f"  不保存向量 节省 {1 - text_bytes / dict_bytes:.1%}")
+    print(f"  列式布局   节省 {1 - col_bytes / text_bytes:.1%}（同为不含向量）")
+
+    ids = list(dict_store)
+    reads = {
+        "dict.get": lambda: [dict_store.get(c).text for c in ids],
+        "ChunkStore.text": lambda: [columnar.text(c) for c in ids],
+        "ChunkStore.get": lambda: [columnar.get(c) for c in ids[:10]],
+    }
+    for name, fn in reads.items():
+        print(f"  {name:<16} {summarize(time_calls(fn, args.repeat))}")
+
+    # 持久化后冷启动：memory-map 全部 segment，不逐条解析
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        columnar.directory = directory
+        start = time.perf_counter()
+        columnar.flush()
+        print(f"  flush 封存 segment   {(time.perf_counter() - start) * 1000:8.1f}ms")
+        restored = ChunkStore(directory)
+        start = time.perf_counter()
+        restored.load()
+        restored.get(ids[-1])
+        print(
+            f"  重启加载 {len(restored)} chunks "
+            f"{(time.perf_counter() - start) * 1000:8.1f}ms"
+        )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# rerank：逐条分词 vs 批量打分
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def bench_rerank(args: argparse.Namespace) -> None:
+    from retrieval.reranker import CrossEncoderReranker
+    from storage.chunk_store import ChunkStore
+
+    settings = Settings()
+    chunks = load_sample_chunks(settings, scale=max(1, args.candidates // 90 + 1))
+    store = ChunkStore()
+    store.add_many(chunks)
+    reranker = CrossEncoderReranker(store)
+    candidates = [(c.chunk_id, 0.0) for c in chunks[: args.candidates]]
+    queries = sample_queries()
+    print(f"\n[rerank] {len(candidates)} 个候选 x {len(queries)} 条 query")
+
+    def per_chunk() -> None:
+        for q in queries:
+            for cid, _ in candidates:
+                reranker._compute_relevance(q, store.text(cid))
+
+    def batch() -> None:
+        for q in queries:
+            reranker.rerank(q, candidates)
+
+    legacy = [d / len(queries) for d in time_calls(per_chunk, args.repeat)]
+    batched = [d / len(queries) for d in time_calls(batch, args.repeat)]
+    print(f"  逐条分词  {summarize(legacy)}  (每请求)")
+    print(f"  批量打分  {summarize(batched)}  (每请求)")
+    print(f"  加速 {statistics.median(legacy) / statistics.median(batched):.1f}x")
+
+
+def bench_rerank_server(args: argparse.Namespace) -> None:
+    from retrieval.rerank_server import MicroBatchingReranker, SimulatedBackend
+
+    settings = Settings()
+    chunks = load_sample_chunks(settings, scale=max(1, args.candidates // 90 + 1))
+    docs = [c.text for c in chunks[: args.candidates]]
+    queries = sample_queries()
+    print(
+        f"\n[rerank_server] 并发 {args.concurrency} 请求 x {len(docs)} 个候选，"
+        f"模拟后端 fixed={args.fixed_ms}ms per_token={args.per_token_us}us"
+    )
+
+    async def run(score) -> tuple[float, list[float]]:
+        latencies: list[float] = []
+
+        async def one(i: int) -> None:
+            t0 = time.perf_counter()
+            await score(queries[i % len(queries)], docs)
+            latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.concurrency)))
+        return time.perf_counter() - t0, latencies
+
+    # 旧路径：每个请求单独一次前向，padding 到 max_length，共用一个模型线程
+    legacy_backend = SimulatedBackend(
+        args.fixed_ms, args.per_token_us, pad_to=args.max_length, max_length=args.max_length
+    )
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def per_request(query: str, texts: list[str]) -> list[float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, legacy_backend.score_pairs, [(query, d) for d in texts]
+        )
+
+    batching = MicroBatchingReranker(
+        SimulatedBackend(args.fixed_ms, args.per_token_us, max_length=args.max_length),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+
+    for name, score in (("逐请求推理", per_request), ("微批推理  ", batching.score)):
+        elapsed, latencies = asyncio.run(run(score))
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"  {name}  吞吐 {args.concurrency / elapsed:7.1f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:7.1f}ms  p95 {p95 * 1000:7.1f}ms"
+        )
+    print(f"  微批: {batching.batches} 次前向, 平均 batch {batching.pairs / max(batching.batches, 1):.1f}")
+    executor.shutdown()
+    batching.close()
+
+    # 低负载：请求逐个到达，自适应窗口不应付出 max_wait 的等待
+    idle = MicroBatchingReranker(
+        SimulatedBackend(args.fixed_ms, args.per_token_us, max_length=args.max_length),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+
+    async def sequential() -> list[float]:
+        latencies = []
+        for i in range(8):
+            t0 = time.perf_counter()
+            await idle.score(queries[i % len(queries)], docs[:8])
+            latencies.append(time.perf_counter() - t0)
+            await asyncio.sleep(args.max_wait_ms * 4 / 1000)
+        return latencies
+
+    latencies = asyncio.run(sequential())
+    print(f"  低负载逐个请求 (8 候选)  p50 {statistics.median(latencies) * 1000:7.1f}ms")
+    idle.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# embedder：逐 n-gram RNG vs 投影表批量 embedding
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def _legacy_embed(text: str, dim: int):
+    """改造前的实现：每个 trigram / 词各构造一个 RandomState 生成 dim 维高斯向量。"""
+    import numpy as np
+
+    vec = np.zeros(dim, dtype=np.float32)
+    for i in range(len(text) - 2):
+        vec += np.random.RandomState(hash(text[i : i + 3]) % (2**31)).randn(dim)
+    for word in text.split():
+        vec += np.random.RandomState(hash(word) % (2**31)).randn(dim) * 2.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+def bench_embedder(args: argparse.Namespace) -> None:
+    from ingestion.embedder import Embedder
+
+    settings = Settings()
+    embedder = Embedder(settings)
+    texts = [c.text for c in load_sample_chunks(settings, scale=args.scale)]
+    print(f"\n[embedder] {len(texts)} chunks, 384 + 768 维")
+
+    legacy = texts[: args.legacy_limit]
+    start = time.perf_counter()
+    for text in legacy:
+        _legacy_embed(text, settings.embedding_dim_light)
+        _legacy_embed(text, settings.embedding_dim_dense)
+    legacy_rate = len(legacy) / (time.perf_counter() - start)
+    print(f"  逐 n-gram RNG    {legacy_rate:10.1f} chunks/s  (前 {len(legacy)} 条)")
+
+    embedder.embed_batch(texts[:1])  # 投影表生成不计入
+    start = time.perf_counter()
+    for i in range(0, len(texts), args.batch_size):
+        embedder.embed_batch(texts[i : i + args.batch_size])
+    batch_rate = len(texts) / (time.perf_counter() - start)
+    print(
+        f"  投影表批量       {batch_rate:10.1f} chunks/s  "
+        f"(batch={args.batch_size}, 加速 {batch_rate / legacy_rate:.1f}x)"
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ingest：逐文档 direct vs 三阶段批量摄入
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def bench_ingest(args: argparse.Namespace) -> None:
+    from data.sample_documents import SAMPLE_DOCUMENTS
+    from ingestion.chunk_splitter import HierarchicalChunkSplitter
+    from ingestion.data_cleaner import DataCleaner
+    from ingestion.document_parser import MarkdownDocumentParser
+    from ingestion.embedder import Embedder
+    from ingestion.pipeline import IngestionPipeline
+    from models.schemas import IngestRequest
+    from retrieval.local_bm25_engine import LocalBM25Engine
+    from retrieval.local_vector_engine import LocalVectorEngine
+
+    settings = Settings(ingest_workers=args.workers)
+
+    def make_pipeline() -> IngestionPipeline:
+        return IngestionPipeline(
+            settings=settings,
+            parser=MarkdownDocumentParser(),
+            cleaner=DataCleaner(),
+            splitter=HierarchicalChunkSplitter(settings),
+            embedder=Embedder(settings),
+            kafka_producer=None,
+            kafka_consumer=None,
+            bm25_engine=LocalBM25Engine(settings),
+            vector_engine=LocalVectorEngine(settings),
+        )
+
+    docs = [
+        IngestRequest(doc_id=f"{d['doc_id']}#{i}", doc_name=d["doc_name"], content=d["content"])
+        for i in range(args.scale)
+        for d in SAMPLE_DOCUMENTS
+    ]
+    print(f"\n[ingest] {len(docs)} 篇文档, 进程内 BM25 + 向量引擎")
+
+    pipeline = make_pipeline()
+    sequential = docs[: args.sequential_limit]
+    start = time.perf_counter()
+    for doc in sequential:
+        pipeline.ingest_document_direct(doc.doc_id, doc.doc_name, doc.content)
+    seq_rate = len(sequential) / (time.perf_counter() - start)
+    print(f"  逐文档 direct    {seq_rate:10.1f} docs/s  (前 {len(sequential)} 篇)")
+
+    batch_pipeline = make_pipeline()
+    try:
+        stats = batch_pipeline.ingest_documents(iter(docs))
+    finally:
+        batch_pipeline.close()
+    util = stats.utilization()
+    print(
+        f"  三阶段批量       {stats.docs_per_s:10.1f} docs/s  "
+        f"({stats.chunks_per_s:.0f} chunks/s, workers={stats.workers}, "
+        f"加速 {stats.docs_per_s / seq_rate:.1f}x)"
+    )
+    print(
+        "  利用率           "
+        + "  ".join(f"{stage}={value:.0%}" for stage, value in util.items())
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 入口
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="RAG 检索组件性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_bm25 = sub.add_parser("bm25", help="进程内 BM25 vs Elasticsearch")
+    p_bm25.add_argument("--scale", type=int, default=1, help="语料复制倍数")
+    p_bm25.add_argument("--repeat", type=int, default=20, help="每条 query 重复次数")
+    p_bm25.set_defaults(func=bench_bm25)
+
+    p_vec = sub.add_parser("vector", help="384 维向量量化存储的召回率与内存")
+    p_vec.add_argument("--size", type=int, default=100000, help="向量条数")
+    p_vec.add_argument("--top-k", type=int, default=1500, help="召回条数（Recall@K 的 K）")
+    p_vec.add_argument("--noise", type=float, default=0.5, help="相对簇中心的噪声幅度")
+    p_vec.add_argument("--index-type", default="flat", choices=["flat", "ivf"])
+    p_vec.add_argument("--repeat", type=int, default=5, help="批量检索重复次数")
+    p_vec.set_defaults(func=bench_vector)
+
+    p_store = sub.add_parser("chunk_store", help="dict vs 列式 ChunkStore 内存占用")
+    p_store.add_argument("--scale", type=int, default=10, help="语料复制倍数")
+    p_store.add_argument("--repeat", type=int, default=5, help="读取重复次数")
+    p_store.set_defaults(func=bench_chunk_store)
+
+    p_rerank = sub.add_parser("rerank", help="Reranker 逐条分词 vs 批量打分")
+    p_rerank.add_argument("--candidates", type=int, default=80, help="每请求候选数")
+    p_rerank.add_argument("--repeat", type=int, default=5, help="重复次数")
+    p_rerank.set_defaults(func=bench_rerank)
+
+    p_server = sub.add_parser("rerank_server", help="Cross-encoder 逐请求推理 vs 动态微批")
+    p_server.add_argument("--concurrency", type=int, default=32, help="并发请求数")
+    p_server.add_argument("--candidates", type=int, default=80, help="每请求候选数")
+    p_server.add_argument("--max-batch-size", type=int, default=64)
+    p_server.add_argument("--max-wait-ms", type=float, default=5.0)
+    p_server.add_argument("--max-length", type=int, default=512, help="旧路径 padding 长度")
+    p_server.add_argument("--fixed-ms", type=float, default=8.0, help="单次前向固定开销")
+    p_server.add_argument("--per-token-us", type=float, default=0.5, help="每 token 前向开销")
+    p_server.set_defaults(func=bench_rerank_server)
+
+    p_embed = sub.add_parser("embedder", help="逐 n-gram RNG vs 投影表批量 embedding")
+    p_embed.add_argument("--scale", type=int, default=10, help="语料复制倍数")
+    p_embed.add_argument("--batch-size", type=int, default=256)
+    p_embed.add_argument("--legacy-limit", type=int, default=200, help="旧实现只测前 N 条")
+    p_embed.set_defaults(func=bench_embedder)
+
+    p_ingest = sub.add_parser("ingest", help="逐文档摄入 vs 三阶段批量摄入")
+    p_ingest.add_argument("--scale", type=int, default=20, help="文档复制倍数")
+    p_ingest.add_argument("--workers", type=int, default=0, help="prepare 进程数，0 为 CPU 核数")
+    p_ingest.add_argument(
+        "--sequential-limit", type=int, default=40, help="逐文档路径只测前 N 篇"
+    )
+    p_ingest.set_defaults(func=bench_ingest)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
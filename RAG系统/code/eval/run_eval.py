@@ -47,7 +47,7 @@ from dataclasses import dataclass, field
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from eval.dataset import EVAL_SAMPLES
-from models.schemas import DocumentChunk, RetrievedChunk
+from models.schemas import DocumentChunk
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 辅助数据结构
@@ -121,13 +121,7 @@ def build_gt_chunk_ids(comp, samples: list[dict]) -> dict[str, list[str]]:
     """从 chunk_store 中找出每条样本对应的 Ground Truth Chunk ID 列表。"""
     gt_map: dict[str, list[str]] = {}
     for sample in samples:
-        expected = set(sample["expected_doc_ids"])
-        gt_ids = [
-            cid
-            for cid, chunk in comp.chunk_store.items()
-            if chunk.metadata.doc_id in expected
-        ]
-        gt_map[sample["qid"]] = gt_ids
+        gt_map[sample["qid"]] = comp.chunk_store.ids_by_doc(sample["expected_doc_ids"])
     return gt_map
 
 
@@ -136,11 +130,6 @@ def build_gt_chunk_ids(comp, samples: list[dict]) -> dict[str, list[str]]:
 # ─────────────────────────────────────────────────────────────────────────────
 
 
-async def _retrieve(comp, query: str, top_k: int = 10) -> list[RetrievedChunk]:
-    """直接调用三级检索（不经过改写，以单独评测基础检索能力）。"""
-    return await comp.retriever.retrieve(query, [query], top_k=top_k)
-
-
 def _build_answer_from_chunks(query: str, chunks: list[DocumentChunk]) -> str:
     """从 chunk 直接拼装回答（跳过流式延迟，专为评测设计）。"""
     if not chunks:
@@ -158,9 +147,13 @@ def run_pipeline_batch(comp, samples: list[dict], gt_map: dict) -> list[Pipeline
     """对全部样本执行检索（同步包装 async），返回 PipelineResult 列表。"""
 
     async def _batch():
+        # 直接调用三级检索（不经过改写，以单独评测基础检索能力）；
+        # 整个样本集的 L1 召回合并为一次 ES _msearch + 一次 Milvus 批量检索
+        retrieved_all = await comp.retriever.retrieve_many(
+            [(sample["query"], [sample["query"]]) for sample in samples], top_k=10
+        )
         results = []
-        for sample in samples:
-            retrieved = await _retrieve(comp, sample["query"], top_k=10)
+        for sample, retrieved in zip(samples, retrieved_all):
             chunks = [r.chunk for r in retrieved]
             result = PipelineResult(
                 qid=sample["qid"],
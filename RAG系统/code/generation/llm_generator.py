@@ -15,6 +15,7 @@ import logging
 from typing import AsyncIterator
 
 from core.abstractions import LLMGenerator
+from core.metrics import GenerationTimer
 from generation.token_budget import TokenBudgetManager
 from models.schemas import DocumentChunk
 
@@ -75,9 +76,14 @@ class MockLLMGenerator(LLMGenerator):
         answer = self._mock_generate(query, context_chunks)
 
         # 5. 模拟逐字流式输出（30-50 token/s）
-        for char in answer:
-            yield char
-            await asyncio.sleep(0.02)
+        timer = GenerationTimer()
+        try:
+            for char in answer:
+                timer.token()
+                yield char
+                await asyncio.sleep(0.02)
+        finally:
+            timer.finish()
 
     def _build_context(self, chunks: list[DocumentChunk]) -> str:
         """构建 <context> 标签包裹的参考资料。"""
@@ -212,13 +218,18 @@ class GeminiLLMGenerator(LLMGenerator):
             len(context_text),
         )
 
-        async for chunk in await client.aio.models.generate_content_stream(
-            model=self.settings.gemini_model,
-            contents=contents,
-            config=config,
-        ):
-            if chunk.text:
-                yield chunk.text
+        timer = GenerationTimer()
+        try:
+            async for chunk in await client.aio.models.generate_content_stream(
+                model=self.settings.gemini_model,
+                contents=contents,
+                config=config,
+            ):
+                if chunk.text:
+                    timer.token()
+                    yield chunk.text
+        finally:
+            timer.finish()
 
     def _build_context(self, chunks: list[DocumentChunk]) -> str:
         """构建 <context> 标签包裹的参考资料。"""
@@ -6,9 +6,13 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import re
 
+from core.deadline import RULE_REWRITE, Deadline
+from core.metrics import stage_timer
+
 logger = logging.getLogger(__name__)
 
 
@@ -94,6 +98,36 @@ class QueryRewriter:
         logger.info("[Rewrite][Rule] '%s' -> %s", query, result)
         return result
 
+    async def arewrite(
+        self,
+        query: str,
+        history: list[dict] | None = None,
+        deadline: Deadline | None = None,
+    ) -> list[str]:
+        """带延迟预算的改写：LLM 调用放到线程中执行，超时则降级为规则改写。"""
+        with stage_timer("rewrite"):
+            return await self._arewrite(query, history, deadline)
+
+    async def _arewrite(
+        self, query: str, history: list[dict] | None, deadline: Deadline | None
+    ) -> list[str]:
+        if not (self.settings and self.settings.llm_provider == "gemini"):
+            return self.rewrite(query, history)
+
+        timeout = (
+            None if deadline is None else deadline.budget_s(self.settings.rewrite_timeout_ms)
+        )
+        try:
+            return await asyncio.wait_for(
+                asyncio.to_thread(self.rewrite, query, history), timeout
+            )
+        except asyncio.TimeoutError:
+            if deadline is not None:
+                deadline.degrade(RULE_REWRITE, "LLM 改写超时")
+            result = self._rewrite_rule_based(query, history)
+            logger.info("[Rewrite][Rule] '%s' -> %s", query, result)
+            return result
+
     def _rewrite_with_gemini(
         self, query: str, history: list[dict] | None = None
     ) -> list[str]:
@@ -120,6 +154,8 @@ class QueryRewriter:
                 temperature=0.2,
                 max_output_tokens=512,
                 response_mime_type="application/json",  # 强制输出裸 JSON，无 fence 无前缀
+                # HTTP 超时与改写预算一致，超时后线程中的请求随之结束
+                http_options=types.HttpOptions(timeout=int(self.settings.rewrite_timeout_ms)),
             ),
         )
 
@@ -0,0 +1,134 @@
+"""批量摄入的阶段组件：解析 / 清洗 / 切分 / 分词的进程池 worker 与吞吐统计。
+
+IngestionPipeline.ingest_documents 把摄入拆成三个阶段，阶段之间用有界队列连接：
+1. prepare：进程池内执行 Parser -> Cleaner -> ChunkSplitter -> jieba 分词（CPU 密集，受 GIL 限制）
+2. embed：按 embedding_batch_size 合批，一次调用得到 384 / 768 维向量
+3. write：合并为大批次后写入 chunk store、ES bulk、Milvus 按列插入
+
+下游变慢时上游阻塞在 put 上，内存占用由队列容量而不是文档总数决定。
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+
+from core.abstractions import ChunkSplitter, DocumentParser
+from core.tokenizer import get_tokenizer, init_tokenizer
+from ingestion.data_cleaner import DataCleaner
+from models.schemas import DocumentChunk
+
+STAGES = ("prepare", "embed", "write")
+
+# 阶段结束标记
+DONE = object()
+
+# 阻塞在队列上时检查停止信号的间隔
+_POLL_S = 0.1
+
+
+@dataclass
+class IngestStats:
+    """批量摄入统计。利用率 = 阶段忙碌时间 / (墙钟时间 x 并行度)，接近 1 的阶段是瓶颈。"""
+
+    documents: int = 0
+    failed: int = 0
+    chunks: int = 0
+    elapsed_s: float = 0.0
+    workers: int = 1  # prepare 阶段并行度
+    busy_s: dict[str, float] = field(default_factory=lambda: dict.fromkeys(STAGES, 0.0))
+    failed_doc_ids: list[str] = field(default_factory=list)
+    errors: dict[str, str] = field(default_factory=dict)  # doc_id -> 失败原因
+
+    def fail(self, doc_id: str, reason: str) -> None:
+        if doc_id in self.errors:
+            return
+        self.errors[doc_id] = reason
+        self.failed += 1
+        self.failed_doc_ids.append(doc_id)
+
+    @property
+    def docs_per_s(self) -> float:
+        return self.documents / self.elapsed_s if self.elapsed_s else 0.0
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.chunks / self.elapsed_s if self.elapsed_s else 0.0
+
+    def utilization(self) -> dict[str, float]:
+        if not self.elapsed_s:
+            return dict.fromkeys(STAGES, 0.0)
+        parallel = {"prepare": self.workers}
+        return {
+            stage: busy / (self.elapsed_s * parallel.get(stage, 1))
+            for stage, busy in self.busy_s.items()
+        }
+
+
+def prepare_document(
+    parser: DocumentParser,
+    cleaner: DataCleaner,
+    splitter: ChunkSplitter,
+    doc_id: str,
+    doc_name: str,
+    raw_content: str,
+    file_type: str = "markdown",
+) -> tuple[list[DocumentChunk], float]:
+    """解析 -> 清洗 -> 切分 -> BM25 分词，返回 (chunks, 耗时秒)。"""
+    start = time.perf_counter()
+    markdown = parser.parse(raw_content, file_type)
+    chunks = splitter.split(cleaner.clean(markdown), doc_id, doc_name)
+    tokenizer = get_tokenizer()
+    for chunk in chunks:
+        chunk.bm25_tokens = tokenizer.cut(chunk.text)
+    return chunks, time.perf_counter() - start
+
+
+# ---- 进程池 worker ----
+
+_worker_components: tuple[DocumentParser, DataCleaner, ChunkSplitter] | None = None
+
+
+def init_prepare_worker(
+    parser: DocumentParser,
+    cleaner: DataCleaner,
+    splitter: ChunkSplitter,
+    user_dict: str = "",
+) -> None:
+    """worker 进程启动时调用一次：保存组件并加载 jieba 词典。"""
+    global _worker_components
+    _worker_components = (parser, cleaner, splitter)
+    init_tokenizer(user_dict)
+
+
+def prepare_in_worker(
+    doc_id: str, doc_name: str, raw_content: str, file_type: str = "markdown"
+) -> tuple[list[DocumentChunk], float]:
+    parser, cleaner, splitter = _worker_components
+    return prepare_document(parser, cleaner, splitter, doc_id, doc_name, raw_content, file_type)
+
+
+# ---- 有界队列 ----
+
+
+def put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """阻塞写入；任一阶段失败（stop 被置位）时放弃并返回 False。"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_S)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def get(q: queue.Queue, stop: threading.Event):
+    """阻塞读取；任一阶段失败时返回 DONE。"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_POLL_S)
+        except queue.Empty:
+            continue
+    return DONE
@@ -1,51 +1,293 @@
 """Embedding 生成器：产出 384 维与 768 维向量表征。
 
-Demo 中使用确定性伪随机向量（基于文本 hash），保证相同文本生成相同向量。
-生产环境替换为领域微调后的 gte-multilingual-base 模型。
+两个维度采用 Matryoshka 方式由同一次编码得到：后端只输出 768 维向量，
+384 维取其前 384 维再 L2 归一化（gte-multilingual-base 训练时使用了 MRL，截断后效果保持），
+摄入与同时需要两个维度的 query 都只编码一次。
+
+后端：
+- hash（默认，Demo）：特征哈希向量。文本的字符 trigram 与空格分词后的词被哈希到固定数量的桶，
+  每个桶对应投影表中的一行高斯随机向量，文本向量为命中行的加权和（词权重 2，trigram 权重 1）。
+  相同文本生成相同向量，共享 n-gram 越多的文本越相似。哈希不使用按进程加盐的内置 hash()，
+  向量在进程重启与多个 worker 之间保持一致，可以缓存。
+- gte：领域微调后的 gte-multilingual-base，mean pooling（与 GTEBiEncoder.encode 一致），
+  torch / transformers 按需导入。
 """
 
 from __future__ import annotations
 
+import os
+import threading
+from typing import Sequence
+
 import numpy as np
 
+from cache.embedding_cache import EmbeddingCache, text_digest
 from config.settings import Settings
 
+_TRIGRAM_WEIGHT = 1.0
+_WORD_WEIGHT = 2.0
+_TABLE_SEED = 20240501
+
+# trigram / 词多项式哈希的乘数与混合常数（64 位，溢出回绕）
+_P1 = np.uint64(0x9E3779B97F4A7C15)
+_P2 = np.uint64(0xC2B2AE3D27D4EB4F)
+_MIX = np.uint64(0xFF51AFD7ED558CCD)
+
+# 码点 -> 是否为空白（与 str.split() 一致），Unicode 空白字符的码点都不超过 U+3000
+_MAX_SPACE = 0x3000
+_IS_SPACE = np.array([chr(c).isspace() for c in range(_MAX_SPACE + 1)], dtype=bool)
+
+# 稀疏乘法按行分块，限制展开后的稠密块大小（块行数 x 命中桶数）
+_CSR_BLOCK_ROWS = 128
+
+# (桶数, 列数) -> 投影表，多个 Embedder 实例共享
+_tables: dict[tuple[int, int], np.ndarray] = {}
+_tables_lock = threading.Lock()
+
+
+def _projection_table(buckets: int, width: int) -> np.ndarray:
+    key = (buckets, width)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            rng = np.random.default_rng(_TABLE_SEED)
+            table = rng.standard_normal((buckets, width), dtype=np.float32)
+            _tables[key] = table
+        return table
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        h ^= h >> np.uint64(33)
+        h *= _MIX
+        h ^= h >> np.uint64(33)
+    return h
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 编码后端：encode(texts, dim) 返回 float32[n, dim]，为完整输出的前 dim 维（未归一化）
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class HashingEmbeddingBackend:
+    def __init__(self, buckets: int, dim: int):
+        self.buckets = buckets
+        self.dim = dim
+        self.name = f"hash-mrl2:{buckets}"
+        self._table: np.ndarray | None = None
+
+    def encode(self, texts: Sequence[str], dim: int) -> np.ndarray:
+        """整批特征组成一个 CSR 矩阵 (行, 桶, 权重)，与投影表前 dim 列相乘。
+
+        按行分块：块内只保留出现过的桶，稀疏块展开为 [块行数, 命中桶数] 的稠密矩阵
+        （同桶特征由 bincount 合并），再与投影表的对应行做一次矩阵乘。
+        """
+        if self._table is None:
+            self._table = _projection_table(self.buckets, self.dim)
+        out = np.zeros((len(texts), dim), dtype=np.float32)
+        rows, hashes, weights = self._features(texts)
+        if not len(rows):
+            return out
+
+        order = np.argsort(rows, kind="stable")
+        rows = rows[order]
+        cols = (hashes[order] % np.uint64(self.buckets)).astype(np.int64)
+        data = weights[order]
+        indptr = np.searchsorted(rows, np.arange(len(texts) + 1))
+        for r0 in range(0, len(texts), _CSR_BLOCK_ROWS):
+            r1 = min(r0 + _CSR_BLOCK_ROWS, len(texts))
+            lo, hi = indptr[r0], indptr[r1]
+            if lo == hi:
+                continue
+            used, inverse = np.unique(cols[lo:hi], return_inverse=True)
+            dense = np.bincount(
+                (rows[lo:hi] - r0) * len(used) + inverse,
+                weights=data[lo:hi],
+                minlength=(r1 - r0) * len(used),
+            ).reshape(r1 - r0, len(used))
+            out[r0:r1] = dense.astype(np.float32) @ self._table[used, :dim]
+        return out
+
+    @staticmethod
+    def _features(texts: Sequence[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """整批文本的字符 trigram 与词特征：返回 (行号, 64 位哈希, 权重) 三列。
+
+        各文本以空格连接为一个码点数组后一次向量化计算：trigram 为滚动哈希，
+        不跨越文本边界；词按 str.split() 的空白切分，哈希为码点多项式（reduceat 分段求和）
+        再混合长度。均与进程无关。
+        """
+        lens = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        joined = " ".join(texts) + " "
+        cps = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        row_of = np.repeat(np.arange(len(texts), dtype=np.int64), lens + 1)
+        boundary = np.zeros(len(cps), dtype=bool)
+        boundary[np.cumsum(lens + 1) - 1] = True
+
+        # trigram：起点与终点在同一文本内且终点不是分隔符
+        n = len(cps)
+        if n >= 3:
+            valid = np.flatnonzero((row_of[:-2] == row_of[2:]) & ~boundary[2:])
+            with np.errstate(over="ignore"):
+                grams = (cps[valid] * _P1 + cps[valid + 1]) * _P2 + cps[valid + 2]
+            grams = _mix(grams)
+            gram_rows = row_of[valid]
+        else:
+            grams = np.zeros(0, dtype=np.uint64)
+            gram_rows = np.zeros(0, dtype=np.int64)
+
+        # 词：非空白的连续段，h = sum(cp_j * P1^j) ^ (长度 * P2)
+        space = np.zeros(n, dtype=bool)
+        small = cps <= _MAX_SPACE
+        space[small] = _IS_SPACE[cps[small].astype(np.int64)]
+        space |= boundary
+        chars = np.flatnonzero(~space)
+        if len(chars):
+            is_start = np.r_[True, chars[1:] != chars[:-1] + 1]
+            word_starts = np.flatnonzero(is_start)
+            word_lens = np.diff(np.r_[word_starts, len(chars)])
+            offsets = np.arange(len(chars)) - np.repeat(word_starts, word_lens)
+            powers = np.cumprod(np.full(int(word_lens.max()), _P1, dtype=np.uint64))
+            powers = np.r_[np.uint64(1), powers[:-1]]
+            with np.errstate(over="ignore"):
+                words = np.add.reduceat(cps[chars] * powers[offsets], word_starts)
+                words ^= word_lens.astype(np.uint64) * _P2
+            words = _mix(words)
+            word_rows = row_of[chars[word_starts]]
+        else:
+            words = np.zeros(0, dtype=np.uint64)
+            word_rows = np.zeros(0, dtype=np.int64)
+
+        rows = np.concatenate([gram_rows, word_rows])
+        hashes = np.concatenate([grams, words])
+        weights = np.concatenate(
+            [
+                np.full(len(grams), _TRIGRAM_WEIGHT, dtype=np.float32),
+                np.full(len(words), _WORD_WEIGHT, dtype=np.float32),
+            ]
+        )
+        return rows, hashes, weights
+
+
+class GTEEmbeddingBackend:
+    """gte-multilingual-base 推理：一次前向 + mean pooling，按请求维度截断。"""
+
+    def __init__(
+        self,
+        model_dir: str,
+        max_length: int = 512,
+        device: str = "cpu",
+        batch_size: int = 32,
+    ):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = AutoModel.from_pretrained(model_dir, trust_remote_code=True)
+        self.model.eval().to(device)
+        self.device = device
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.name = f"gte:{os.path.basename(os.path.normpath(model_dir))}"
+
+    def encode(self, texts: Sequence[str], dim: int) -> np.ndarray:
+        torch = self._torch
+        out = np.zeros((len(texts), dim), dtype=np.float32)
+        # 按长度排序后切批，同批 padding 更少
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start : start + self.batch_size]
+            enc = self.tokenizer(
+                [texts[i] for i in idx],
+                max_length=self.max_length,
+                truncation=True,
+                padding=True,
+                return_tensors="pt",
+            )
+            enc = {k: v.to(self.device) for k, v in enc.items()}
+            with torch.inference_mode():
+                hidden = self.model(**enc).last_hidden_state
+                mask = enc["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            out[idx] = pooled[:, :dim].float().cpu().numpy()
+        return out
+
+
+def build_embedding_backend(settings: Settings):
+    if settings.embedding_backend == "hash":
+        return HashingEmbeddingBackend(
+            settings.embedding_hash_buckets, settings.embedding_dim_dense
+        )
+    if settings.embedding_backend == "gte":
+        return GTEEmbeddingBackend(
+            settings.embedding_model_dir,
+            max_length=settings.embedding_max_length,
+            device=settings.embedding_device,
+            batch_size=settings.embedding_batch_size,
+        )
+    raise ValueError(f"未知的 embedding 后端: {settings.embedding_backend}")
+
 
 class Embedder:
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, backend=None):
         self.dim_light = settings.embedding_dim_light
         self.dim_dense = settings.embedding_dim_dense
+        self.backend = backend or HashingEmbeddingBackend(
+            settings.embedding_hash_buckets, self.dim_dense
+        )
+        # 模型版本：模型或哈希方案变化后，缓存中的旧向量不再命中
+        self.version = f"{settings.embedding_model_version}:{self.backend.name}"
+        # Embedding 缓存（由 Components 按配置注入）
+        self.cache: EmbeddingCache | None = None
 
     def embed_384(self, text: str) -> list[float]:
         """生成 384 维轻量级向量（第一层粗筛用）。"""
-        return self._deterministic_embed(text, self.dim_light)
+        return self.embed_batch([text], dims=(self.dim_light,))[self.dim_light][0].tolist()
 
     def embed_768(self, text: str) -> list[float]:
         """生成 768 维密集语义向量（第二层精筛用）。"""
-        return self._deterministic_embed(text, self.dim_dense)
-
-    def _deterministic_embed(self, text: str, dim: int) -> list[float]:
-        """确定性伪随机向量：相同文本 -> 相同向量，且语义相近的文本向量有一定相似度。"""
-        # 基于 n-gram 特征生成稳定向量
-        vec = np.zeros(dim, dtype=np.float32)
-
-        # 字符级 n-gram (n=3) 叠加
-        for i in range(len(text) - 2):
-            trigram = text[i : i + 3]
-            seed = hash(trigram) % (2**31)
-            rng = np.random.RandomState(seed)
-            vec += rng.randn(dim).astype(np.float32)
-
-        # 词级特征叠加（更强的语义信号）
-        words = text.split()
-        for word in words:
-            seed = hash(word) % (2**31)
-            rng = np.random.RandomState(seed)
-            vec += rng.randn(dim).astype(np.float32) * 2.0
-
-        # L2 归一化
-        norm = np.linalg.norm(vec)
-        if norm > 0:
-            vec = vec / norm
-
-        return vec.tolist()
+        return self.embed_batch([text], dims=(self.dim_dense,))[self.dim_dense][0].tolist()
+
+    def embed_dual(self, text: str) -> tuple[list[float], list[float]]:
+        """一次编码同时得到 (384 维, 768 维) 向量。"""
+        vectors = self.embed_batch([text])
+        return vectors[self.dim_light][0].tolist(), vectors[self.dim_dense][0].tolist()
+
+    def embed_batch(
+        self, texts: Sequence[str], dims: Sequence[int] | None = None
+    ) -> dict[int, np.ndarray]:
+        """批量生成向量，返回 {维度: float32[len(texts), 维度]}，各行已 L2 归一化。
+
+        后端只按请求的最大维度编码一次，较小维度由截断得到。
+        配置了缓存时只按 (版本, 完整维度, 文本摘要) 缓存完整向量，只计算未命中的文本；
+        请求的各维度在读取时由完整向量截断并重新归一化得到。
+        """
+        dims = tuple(dims or (self.dim_light, self.dim_dense))
+        if self.cache is None:
+            return self._compute(texts, dims)
+
+        full_dim = max(self.dim_dense, *dims)
+        digests = [text_digest(t) for t in texts]
+        cached = self.cache.get_many(full_dim, digests)
+        pending = {d: t for d, t in zip(digests, texts) if d not in cached}
+        if pending:
+            fresh = self._compute(list(pending.values()), (full_dim,))[full_dim]
+            computed = dict(zip(pending, fresh))
+            self.cache.set_many(full_dim, computed)
+            cached.update(computed)
+
+        full = np.zeros((len(digests), full_dim), dtype=np.float32)
+        for i, digest in enumerate(digests):
+            full[i] = cached[digest]
+        return {dim: _truncate(full, dim) for dim in dims}
+
+    def _compute(self, texts: Sequence[str], dims: tuple[int, ...]) -> dict[int, np.ndarray]:
+        full = self.backend.encode(texts, max(dims))
+        return {dim: _truncate(full, dim) for dim in dims}
+
+
+def _truncate(vectors: np.ndarray, dim: int) -> np.ndarray:
+    """Matryoshka 截断：取前 dim 维并 L2 归一化，零向量保持为零。"""
+    block = vectors[:, :dim]
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    return block / np.where(norms > 0, norms, 1.0)
@@ -3,17 +3,41 @@
 from __future__ import annotations
 
 import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain, islice
+from typing import Iterable
 
+from cache.rerank_cache import RerankCache
+from cache.retrieval_cache import RetrievalCache
 from config.settings import Settings
+from core.metrics import observe_stage
+from core.tokenizer import get_tokenizer
+from ingestion.bulk_ingest import (
+    DONE,
+    IngestStats,
+    get,
+    init_prepare_worker,
+    prepare_document,
+    prepare_in_worker,
+    put,
+)
 from ingestion.chunk_splitter import HierarchicalChunkSplitter
 from ingestion.data_cleaner import DataCleaner
 from ingestion.document_parser import MarkdownDocumentParser
 from ingestion.embedder import Embedder
 from ingestion.kafka_producer import KafkaChunkProducer
 from ingestion.kafka_consumer import KafkaChunkConsumer
-from models.schemas import DocumentChunk
+from models.schemas import DocumentChunk, IngestRequest
 from retrieval.bm25_engine import BM25Engine
 from retrieval.vector_engine import MilvusVectorEngine
+from storage.chunk_store import ChunkStore
 
 logger = logging.getLogger(__name__)
 
@@ -48,8 +72,19 @@ class IngestionPipeline:
         self.bm25_engine = bm25_engine
         self.vector_engine = vector_engine
 
-        # chunk_id -> DocumentChunk 的全局存储（供检索后取回完整文本）
-        self.chunk_store: dict[str, DocumentChunk] = {}
+        # chunk_id -> chunk 的全局存储（供检索后取回完整文本）
+        self.chunk_store = ChunkStore(
+            text_cache_size=settings.chunk_store_text_cache_size
+        )
+        # 重新摄入的 chunk 需失效其 rerank 缓存分数；索引变化后检索结果缓存整体失效
+        # （均由 Components 注入）
+        self.rerank_cache: RerankCache | None = None
+        self.retrieval_cache: RetrievalCache | None = None
+
+        # prepare 阶段的进程池：首次批量摄入时创建，跨请求复用，close() 时关闭
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_key: tuple | None = None
+        self._pool_lock = threading.Lock()
 
     def ingest_document(
         self,
@@ -125,26 +160,359 @@ class IngestionPipeline:
 
         return self._embed_and_index(chunks)
 
+    def ingest_documents(
+        self,
+        documents: Iterable[IngestRequest],
+        file_type: str = "markdown",
+        raise_on_error: bool = True,
+    ) -> IngestStats:
+        """批量摄入：prepare（进程池）-> embed（跨文档合批）-> write（bulk）三阶段流水线。
+
+        documents 按需迭代，可以是生成器；阶段之间为有界队列，内存占用与文档总数无关。
+        与 ingest_document_direct 一样跳过 Kafka，直接写入索引，用于全量导入。
+        文档数少于 ingest_inprocess_threshold 时 prepare 在当前进程内执行。
+        单篇文档解析 / 切分失败只计入 failed；embedding 或写入失败时停止，
+        此前已写入的批次保留在索引中：raise_on_error 为 True 时抛出异常，
+        否则未写完与尚未处理的文档逐条记入 stats.errors 后正常返回（会读完 documents）。
+        """
+        settings = self.settings
+        workers = settings.ingest_workers or os.cpu_count() or 1
+        documents = iter(documents)
+        head = list(islice(documents, settings.ingest_inprocess_threshold))
+        if len(head) < settings.ingest_inprocess_threshold:
+            workers = 1
+        remaining = chain(head, documents)
+        accepted: list[str] = []
+
+        def track(docs: Iterable[IngestRequest]):
+            for doc in docs:
+                accepted.append(doc.doc_id)
+                yield doc
+
+        stats = IngestStats(workers=workers)
+        prepared: queue.Queue = queue.Queue(maxsize=settings.ingest_queue_size)
+        embedded: queue.Queue = queue.Queue(maxsize=settings.ingest_queue_size)
+        stop = threading.Event()
+        errors: list[tuple[str, BaseException]] = []
+        indexed_ids: list[str] = []
+        # doc_id -> chunk 数 / 已写入 chunk 数，写入失败时据此判断哪些文档未写完
+        chunk_counts: dict[str, int] = {}
+        written: Counter[str] = Counter()
+
+        def run(stage: str, fn, *args) -> None:
+            try:
+                fn(*args)
+            except BaseException as e:
+                logger.exception("[Ingestion-Bulk] %s 阶段失败，停止摄入", stage)
+                errors.append((stage, e))
+                stop.set()
+
+        threads = [
+            threading.Thread(
+                target=run,
+                args=("embed", self._embed_stage, prepared, embedded, stats, stop),
+                name="ingest-embed",
+                daemon=True,
+            ),
+            threading.Thread(
+                target=run,
+                args=("write", self._write_stage, embedded, stats, stop, indexed_ids, written),
+                name="ingest-write",
+                daemon=True,
+            ),
+        ]
+        logger.info("[Ingestion-Bulk] 开始批量摄入: prepare 进程数=%d", workers)
+        started = time.perf_counter()
+        try:
+            with self.bm25_engine.bulk_load():
+                for thread in threads:
+                    thread.start()
+                run(
+                    "prepare",
+                    self._prepare_stage,
+                    track(remaining),
+                    file_type,
+                    workers,
+                    prepared,
+                    stats,
+                    stop,
+                    chunk_counts,
+                )
+                put(prepared, DONE, stop)
+                for thread in threads:
+                    thread.join()
+        finally:
+            if indexed_ids:
+                write_start = time.perf_counter()
+                self.vector_engine.flush()
+                self._after_index(indexed_ids)
+                stats.busy_s["write"] += time.perf_counter() - write_start
+            stats.elapsed_s = time.perf_counter() - started
+        if errors:
+            stage, error = errors[0]
+            if raise_on_error:
+                raise error
+            reason = f"{stage} 阶段失败: {error}"
+            for doc_id in accepted:
+                if doc_id in chunk_counts and written[doc_id] >= chunk_counts[doc_id]:
+                    continue
+                if doc_id in chunk_counts:
+                    stats.documents -= 1
+                stats.fail(doc_id, reason)
+            for doc in remaining:
+                stats.fail(doc.doc_id, "摄入已中止，文档未处理")
+
+        utilization = stats.utilization()
+        logger.info(
+            "[Ingestion-Bulk] 完成: %d 篇文档 (失败 %d), %d 个 chunk, %.1fs, "
+            "%.1f docs/s, %.1f chunks/s, 利用率 prepare=%.0f%% embed=%.0f%% write=%.0f%%",
+            stats.documents,
+            stats.failed,
+            stats.chunks,
+            stats.elapsed_s,
+            stats.docs_per_s,
+            stats.chunks_per_s,
+            utilization["prepare"] * 100,
+            utilization["embed"] * 100,
+            utilization["write"] * 100,
+        )
+        return stats
+
+    def _prepare_stage(
+        self,
+        documents: Iterable[IngestRequest],
+        file_type: str,
+        workers: int,
+        out: queue.Queue,
+        stats: IngestStats,
+        stop: threading.Event,
+        chunk_counts: dict[str, int],
+    ) -> None:
+        """prepare 阶段：workers > 1 时在共享进程池中执行，在途文档数不超过 workers x 2。"""
+        if workers == 1:
+            for doc in documents:
+                if stop.is_set():
+                    return
+                try:
+                    result = prepare_document(
+                        self.parser,
+                        self.cleaner,
+                        self.splitter,
+                        doc.doc_id,
+                        doc.doc_name,
+                        doc.content,
+                        file_type,
+                    )
+                except Exception as e:
+                    self._prepare_failed(doc.doc_id, e, stats)
+                    continue
+                if not self._emit_prepared(doc.doc_id, result, out, stats, stop, chunk_counts):
+                    return
+            return
+
+        pool = self._get_pool(workers)
+        inflight: dict[Future, str] = {}
+        docs = iter(documents)
+        exhausted = False
+        try:
+            while not stop.is_set():
+                while not exhausted and len(inflight) < workers * 2:
+                    doc = next(docs, None)
+                    if doc is None:
+                        exhausted = True
+                        break
+                    future = pool.submit(
+                        prepare_in_worker, doc.doc_id, doc.doc_name, doc.content, file_type
+                    )
+                    inflight[future] = doc.doc_id
+                if not inflight:
+                    return
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    doc_id = inflight.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        self._discard_pool(pool)
+                        raise RuntimeError("prepare 进程池异常退出") from e
+                    except Exception as e:
+                        self._prepare_failed(doc_id, e, stats)
+                        continue
+                    if not self._emit_prepared(doc_id, result, out, stats, stop, chunk_counts):
+                        return
+        finally:
+            # 池由多次调用共享，只取消本次尚未开始的任务
+            for future in inflight:
+                future.cancel()
+
+    def _get_pool(self, workers: int) -> ProcessPoolExecutor:
+        """返回长期存在的 prepare 进程池；并行度或 parser / cleaner / splitter 被替换时重建。"""
+        key = (workers, id(self.parser), id(self.cleaner), id(self.splitter))
+        with self._pool_lock:
+            if self._pool is not None and self._pool_key != key:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._pool is None:
+                # spawn 启动：调用方进程中已有线程（FastAPI 线程池、embed / write 阶段），
+                # fork 可能复制被持有的锁
+                self._pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_prepare_worker,
+                    initargs=(
+                        self.parser,
+                        self.cleaner,
+                        self.splitter,
+                        self.settings.tokenizer_user_dict,
+                    ),
+                )
+                self._pool_key = key
+                logger.info("[Ingestion-Bulk] 创建 prepare 进程池: %d 个进程", workers)
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self) -> None:
+        """关闭 prepare 进程池。"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def _emit_prepared(
+        doc_id: str,
+        result: tuple[list[DocumentChunk], float],
+        out: queue.Queue,
+        stats: IngestStats,
+        stop: threading.Event,
+        chunk_counts: dict[str, int],
+    ) -> bool:
+        chunks, seconds = result
+        stats.documents += 1
+        stats.busy_s["prepare"] += seconds
+        chunk_counts[doc_id] = len(chunks)
+        observe_stage("ingest_prepare", seconds)
+        return put(out, chunks, stop)
+
+    @staticmethod
+    def _prepare_failed(doc_id: str, error: Exception, stats: IngestStats) -> None:
+        logger.warning("[Ingestion-Bulk] 文档 %s 处理失败，已跳过: %s", doc_id, error)
+        stats.fail(doc_id, str(error))
+
+    def _embed_stage(
+        self,
+        inp: queue.Queue,
+        out: queue.Queue,
+        stats: IngestStats,
+        stop: threading.Event,
+    ) -> None:
+        """embed 阶段：跨文档攒满 embedding_batch_size 个 chunk 再编码。"""
+        batch_size = self.settings.embedding_batch_size
+        buffer: list[DocumentChunk] = []
+        while True:
+            item = get(inp, stop)
+            if stop.is_set():
+                return
+            if item is not DONE:
+                buffer.extend(item)
+            while len(buffer) >= batch_size or (item is DONE and buffer):
+                batch, buffer = buffer[:batch_size], buffer[batch_size:]
+                start = time.perf_counter()
+                self._embed(batch)
+                elapsed = time.perf_counter() - start
+                stats.busy_s["embed"] += elapsed
+                observe_stage("ingest_embed", elapsed)
+                if not put(out, batch, stop):
+                    return
+            if item is DONE:
+                put(out, DONE, stop)
+                return
+
+    def _write_stage(
+        self,
+        inp: queue.Queue,
+        stats: IngestStats,
+        stop: threading.Event,
+        indexed_ids: list[str],
+        written: Counter[str],
+    ) -> None:
+        """write 阶段：队列中已就绪的批次合并到 ingest_write_batch_size 个 chunk 后一次写入。"""
+        limit = self.settings.ingest_write_batch_size
+        finished = False
+        while not finished:
+            item = get(inp, stop)
+            if item is DONE:
+                return
+            batch = list(item)
+            while len(batch) < limit:
+                try:
+                    item = inp.get_nowait()
+                except queue.Empty:
+                    break
+                if item is DONE:
+                    finished = True
+                    break
+                batch.extend(item)
+            start = time.perf_counter()
+            self._index(batch)
+            elapsed = time.perf_counter() - start
+            indexed_ids.extend(chunk.chunk_id for chunk in batch)
+            written.update(chunk.metadata.doc_id for chunk in batch)
+            stats.chunks += len(batch)
+            stats.busy_s["write"] += elapsed
+            observe_stage("ingest_write", elapsed)
+
     def _embed_and_index(self, chunks: list[DocumentChunk]) -> list[DocumentChunk]:
         """为 chunks 生成 embedding 并索引到 ES + Milvus。"""
-        import jieba
+        self._embed(chunks)
 
+        # 中文分词（用于 BM25）
+        tokenizer = get_tokenizer()
         for chunk in chunks:
-            # 生成双路向量
-            chunk.vector_384 = self.embedder.embed_384(chunk.text)
-            chunk.vector_768 = self.embedder.embed_768(chunk.text)
+            chunk.bm25_tokens = tokenizer.cut(chunk.text)
 
-            # 中文分词（用于 BM25）
-            chunk.bm25_tokens = list(jieba.cut(chunk.text))
+        self._index(chunks)
+        # 先让新 chunk 在 ES / Milvus 中可见，再使缓存失效：否则失效与可见之间到达的查询
+        # 会以新代号缓存旧索引上的结果
+        self.bm25_engine.refresh()
+        self.vector_engine.flush()
+        self._after_index([chunk.chunk_id for chunk in chunks])
 
-            # 索引到 Elasticsearch (BM25)
-            self.bm25_engine.index_chunk(chunk)
+        logger.info("[Index] BM25 + Vector 索引完成: %d chunks", len(chunks))
+        return chunks
 
-            # 索引到 Milvus (向量)
-            self.vector_engine.insert_chunk(chunk)
+    def _embed(self, chunks: list[DocumentChunk]) -> None:
+        # 双路向量按批生成，一次调用同时得到 384 / 768 维
+        dim_light, dim_dense = self.embedder.dim_light, self.embedder.dim_dense
+        batch_size = self.settings.embedding_batch_size
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start : start + batch_size]
+            vectors = self.embedder.embed_batch([c.text for c in batch])
+            for chunk, v384, v768 in zip(batch, vectors[dim_light], vectors[dim_dense]):
+                chunk.vector_384 = v384.tolist()
+                chunk.vector_768 = v768.tolist()
 
-            # 存入全局 chunk store
-            self.chunk_store[chunk.chunk_id] = chunk
+    def _index(self, chunks: list[DocumentChunk]) -> None:
+        # 先写入全局 chunk store，保证检索命中时文本可回填（向量只由向量引擎保存）
+        self.chunk_store.add_many(chunks)
 
-        logger.info("[Index] BM25 + Vector 索引完成: %d chunks", len(chunks))
-        return chunks
+        # 批量索引到 Elasticsearch (BM25)
+        self.bm25_engine.index_chunks(chunks)
+
+        # 按列批量写入 Milvus (向量)，flush 由调用方在整批摄入后统一执行
+        self.vector_engine.insert_chunks(chunks, flush=False)
+
+    def _after_index(self, chunk_ids: list[str]) -> None:
+        # 调用方须已 refresh ES 并 flush 向量引擎，缓存失效之后的查询一定能看到新 chunk
+        # 封存为磁盘 segment（配置 chunk_store_dir 时），重启后直接加载
+        self.chunk_store.flush()
+
+        if self.rerank_cache is not None:
+            self.rerank_cache.invalidate(chunk_ids)
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.bump_generation()
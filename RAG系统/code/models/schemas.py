@@ -6,6 +6,26 @@ from pydantic import BaseModel, Field
 # ---- 请求 / 响应 ----
 
 
+class RetrievalFilter(BaseModel):
+    """检索元数据过滤：各条件之间为 AND，列表内为 OR；为空的条件不参与过滤。
+
+    过滤在 BM25 / 向量索引内部执行（ES bool.filter、Milvus expr），先过滤再取 top-k。
+    """
+
+    doc_ids: list[str] | None = Field(default=None, max_length=1000)
+    node_types: list[str] | None = None  # "non_leaf" | "leaf" | "no_heading"
+    heading_prefix: str | None = Field(default=None, max_length=500)
+
+    model_config = {"extra": "forbid"}
+
+    def is_empty(self) -> bool:
+        return not (self.doc_ids or self.node_types or self.heading_prefix)
+
+    def only_doc_ids(self) -> bool:
+        """是否只有 doc_id 条件（Milvus schema 只有 doc_id 一个元数据字段）。"""
+        return not (self.node_types or self.heading_prefix)
+
+
 class ChatRequest(BaseModel):
     """在线问答请求，Pydantic 强校验防止越权与非法格式注入。"""
 
@@ -13,6 +33,7 @@ class ChatRequest(BaseModel):
     session_id: str = Field(..., max_length=64)
     query: str = Field(..., min_length=1, max_length=2000)
     top_k: int = Field(default=10, ge=1, le=50)
+    filter: RetrievalFilter | None = None
 
     model_config = {"extra": "forbid"}
 
@@ -22,6 +43,7 @@ class ChatResponse(BaseModel):
     citations: list[str] = []
     rewritten_queries: list[str] = []
     source: str = "rag"  # "exact_cache" | "semantic_cache" | "rag"
+    degradations: list[str] = []  # 超出延迟预算时各阶段采用的降级路径
 
 
 class IngestRequest(BaseModel):
@@ -36,6 +58,21 @@ class IngestResponse(BaseModel):
     chunks_created: int = 0
 
 
+class IngestBatchRequest(BaseModel):
+    documents: list[IngestRequest] = Field(..., min_length=1, max_length=1000)
+
+
+class IngestBatchResponse(BaseModel):
+    status: str = "success"
+    documents: int = 0  # 成功处理的文档数
+    failed_doc_ids: list[str] = []
+    errors: dict[str, str] = {}  # doc_id -> 失败原因
+    chunks_created: int = 0
+    elapsed_ms: float = 0.0
+    docs_per_second: float = 0.0
+    utilization: dict[str, float] = {}  # 各阶段忙碌时间占比：prepare / embed / write
+
+
 # ---- 内部数据模型 ----
 
 
@@ -6,11 +6,16 @@
 from __future__ import annotations
 
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
 
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import parallel_bulk, streaming_bulk
 
 from config.settings import Settings
-from models.schemas import DocumentChunk
+from models.schemas import DocumentChunk, RetrievalFilter
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +25,13 @@ class BM25Engine:
         self.settings = settings
         self.index_name = settings.es_index_name
         self._es: Elasticsearch | None = None
+        # bulk_load 引用计数与进入前的 refresh_interval（由 _bulk_lock 保护）
+        self._bulk_lock = threading.Lock()
+        self._bulk_depth = 0
+        self._bulk_previous: str | None = None
+        # heading_path.raw 后台回填任务：完成前 heading 前缀过滤改用 allowed_ids
+        self._backfill_task: str | None = None
+        self._backfill_checked = 0.0
 
     def connect(self) -> None:
         self._es = Elasticsearch(self.settings.elasticsearch_url)
@@ -27,8 +39,9 @@ class BM25Engine:
         logger.info("[ES] 已连接: %s", self.settings.elasticsearch_url)
 
     def _ensure_index(self) -> None:
-        """创建索引（如果不存在），配置 IK 分词器映射。"""
+        """创建索引（如果不存在），配置 IK 分词器映射；已存在时补齐 heading_path.raw。"""
         if self._es.indices.exists(index=self.index_name):
+            self._ensure_heading_raw()
             return
 
         mappings = {
@@ -53,7 +66,11 @@ class BM25Engine:
                         "type": "text",
                         "analyzer": "ik_smart_analyzer",
                     },
-                    "heading_path": {"type": "text"},
+                    # raw 子字段供 heading 前缀过滤（prefix 查询需要未分词的完整路径）
+                    "heading_path": {
+                        "type": "text",
+                        "fields": {"raw": {"type": "keyword"}},
+                    },
                     "node_type": {"type": "keyword"},
                 }
             },
@@ -61,12 +78,191 @@ class BM25Engine:
         self._es.indices.create(index=self.index_name, **mappings)
         logger.info("[ES] 创建索引: %s", self.index_name)
 
+    def _ensure_heading_raw(self) -> None:
+        """旧索引没有 heading_path.raw 子字段时 prefix 过滤静默无结果：补映射并后台回填已有文档。
+
+        新增 multi-field 不需要重建索引，update_by_query 原地重写一遍文档即可填充子字段；
+        回填以 ES task 异步执行，不阻塞启动，完成前 heading 前缀过滤由 ChunkStore 解析。
+        heading_path 不是 text 类型等无法补齐的情况，put_mapping 会抛错，启动直接失败。
+        """
+        resp = self._es.indices.get_mapping(index=self.index_name)
+        heading = (
+            resp.body.get(self.index_name, {})
+            .get("mappings", {})
+            .get("properties", {})
+            .get("heading_path", {})
+        )
+        if "raw" in heading.get("fields", {}):
+            return
+        logger.warning("[ES] 索引 %s 缺少 heading_path.raw，补齐映射并后台回填", self.index_name)
+        self._es.indices.put_mapping(
+            index=self.index_name,
+            properties={
+                "heading_path": {"type": "text", "fields": {"raw": {"type": "keyword"}}}
+            },
+        )
+        result = self._es.update_by_query(
+            index=self.index_name,
+            conflicts="proceed",
+            refresh=True,
+            wait_for_completion=False,
+        )
+        self._backfill_task = result.body["task"]
+        self._backfill_checked = time.monotonic()
+        logger.info("[ES] heading_path.raw 回填任务已提交: %s", self._backfill_task)
+
+    def _heading_raw_ready(self) -> bool:
+        """heading_path.raw 是否可用；回填进行中时按间隔轮询 ES task 状态。"""
+        if self._backfill_task is None:
+            return True
+        now = time.monotonic()
+        if now - self._backfill_checked < self.settings.es_backfill_poll_interval_s:
+            return False
+        self._backfill_checked = now
+        try:
+            task = self._es.tasks.get(task_id=self._backfill_task).body
+        except Exception as e:
+            logger.warning("[ES] 查询回填任务 %s 失败: %s", self._backfill_task, e)
+            return False
+        if not task.get("completed"):
+            return False
+        response = task.get("response") or {}
+        failures = response.get("failures") or []
+        if task.get("error") or failures:
+            # 保持未就绪：heading 前缀过滤继续走 allowed_ids，需人工处理后重启
+            logger.error(
+                "[ES] 回填 heading_path.raw 失败: %s", task.get("error") or failures[:3]
+            )
+            self._backfill_checked = float("inf")
+            return False
+        logger.info("[ES] heading_path.raw 回填完成: %s 条", response.get("updated", 0))
+        self._backfill_task = None
+        return True
+
+    def supports_filter(self, metadata_filter: RetrievalFilter) -> bool:
+        """doc_id / node_type / heading 前缀都可翻译为 bool.filter，无需 allowed_ids。
+
+        heading_path.raw 回填完成前，heading 前缀条件需要调用方给出 allowed_ids。
+        """
+        return not metadata_filter.heading_prefix or self._heading_raw_ready()
+
     def index_chunk(self, chunk: DocumentChunk) -> None:
         """将 chunk 索引到 Elasticsearch。"""
         if self._es is None:
             self.connect()
 
-        doc = {
+        self._es.index(
+            index=self.index_name, id=chunk.chunk_id, document=self._to_doc(chunk)
+        )
+
+    def index_chunks(
+        self,
+        chunks: Iterable[DocumentChunk],
+        batch_size: int | None = None,
+        workers: int | None = None,
+    ) -> int:
+        """批量索引：基于 bulk helper 分批写入，返回成功写入条数。
+
+        chunk 数超过 es_bulk_refresh_threshold 时自动进入 bulk_load()，
+        写入期间关闭 refresh，结束后恢复并统一 refresh 一次。
+        """
+        if self._es is None:
+            self.connect()
+
+        chunks = list(chunks)
+        if not chunks:
+            return 0
+
+        if (
+            self._bulk_depth == 0
+            and len(chunks) >= self.settings.es_bulk_refresh_threshold
+        ):
+            with self.bulk_load():
+                return self.index_chunks(chunks, batch_size, workers)
+
+        batch_size = batch_size or self.settings.es_bulk_batch_size
+        workers = workers or self.settings.es_bulk_workers
+        actions = (
+            {
+                "_index": self.index_name,
+                "_id": chunk.chunk_id,
+                "_source": self._to_doc(chunk),
+            }
+            for chunk in chunks
+        )
+        if workers > 1:
+            results = parallel_bulk(
+                self._es,
+                actions,
+                thread_count=workers,
+                chunk_size=batch_size,
+                raise_on_error=False,
+            )
+        else:
+            results = streaming_bulk(
+                self._es, actions, chunk_size=batch_size, raise_on_error=False
+            )
+
+        success = 0
+        for ok, item in results:
+            if ok:
+                success += 1
+            else:
+                logger.warning("[ES] bulk 写入失败: %s", item)
+
+        logger.info(
+            "[ES] bulk 索引 %d/%d 条 (batch=%d, workers=%d)",
+            success,
+            len(chunks),
+            batch_size,
+            workers,
+        )
+        return success
+
+    @contextmanager
+    def bulk_load(self) -> Iterator[None]:
+        """大批量写入上下文：关闭 refresh_interval，退出时恢复原值并 refresh 一次。
+
+        支持嵌套与多线程并发：引用计数由锁保护，只有 0 -> 1 时记录原值并关闭 refresh，
+        1 -> 0 时恢复；切换期间持锁，其他线程不会读到本上下文写入的 "-1"。
+        """
+        if self._es is None:
+            self.connect()
+
+        with self._bulk_lock:
+            if self._bulk_depth == 0:
+                resp = self._es.indices.get_settings(
+                    index=self.index_name, name="index.refresh_interval"
+                )
+                self._bulk_previous = (
+                    resp.body.get(self.index_name, {})
+                    .get("settings", {})
+                    .get("index", {})
+                    .get("refresh_interval")
+                )
+                self._es.indices.put_settings(
+                    index=self.index_name, settings={"index": {"refresh_interval": "-1"}}
+                )
+                logger.info("[ES] 进入批量写入模式: refresh_interval=-1")
+            self._bulk_depth += 1
+        try:
+            yield
+        finally:
+            with self._bulk_lock:
+                self._bulk_depth -= 1
+                if self._bulk_depth == 0:
+                    previous, self._bulk_previous = self._bulk_previous, None
+                    # previous 为 None 时写回 null，即恢复集群默认值
+                    self._es.indices.put_settings(
+                        index=self.index_name,
+                        settings={"index": {"refresh_interval": previous}},
+                    )
+                    self.refresh()
+                    logger.info("[ES] 退出批量写入模式: refresh_interval=%s", previous)
+
+    @staticmethod
+    def _to_doc(chunk: DocumentChunk) -> dict:
+        return {
             "chunk_id": chunk.chunk_id,
             "doc_id": chunk.metadata.doc_id,
             "doc_name": chunk.metadata.doc_name,
@@ -74,36 +270,145 @@ class BM25Engine:
             "heading_path": chunk.metadata.heading_path,
             "node_type": chunk.metadata.node_type,
         }
-        self._es.index(index=self.index_name, id=chunk.chunk_id, document=doc)
 
     def refresh(self) -> None:
         """刷新索引使文档可搜索。"""
         if self._es:
             self._es.indices.refresh(index=self.index_name)
 
-    def search(self, query: str, top_k: int = 1500) -> list[tuple[str, float]]:
+    def search(
+        self,
+        query: str,
+        top_k: int = 1500,
+        metadata_filter: RetrievalFilter | None = None,
+    ) -> list[tuple[str, float]]:
         """BM25 检索，返回 [(chunk_id, bm25_score), ...]。"""
+        return self.search_many([query], top_k=top_k, metadata_filter=metadata_filter)[0]
+
+    def search_many(
+        self,
+        queries: list[str],
+        top_k: int = 1500,
+        timeout: float | None = None,
+        metadata_filter: RetrievalFilter | None = None,
+        allowed_ids: set[str] | None = None,
+    ) -> list[list[tuple[str, float]]]:
+        """多 query 批量 BM25 检索：一次 _msearch 往返，结果与 queries 一一对应。
+
+        timeout（秒）同时作为客户端请求超时与 ES 端的搜索超时，超时后请求被中止。
+        metadata_filter 翻译为 bool.filter，在 ES 内部过滤后再取 top_k；
+        ES 可原生执行全部条件（见 supports_filter）；仅在 heading_path.raw 回填完成前，
+        heading 前缀条件改用调用方由 ChunkStore 解析出的 allowed_ids（ids 过滤）。
+        """
+        if not queries:
+            return []
         if self._es is None:
             self.connect()
 
-        body = {
+        ids = None
+        if (
+            metadata_filter is not None
+            and metadata_filter.heading_prefix
+            and allowed_ids is not None
+            and not self._heading_raw_ready()
+        ):
+            metadata_filter = metadata_filter.model_copy(update={"heading_prefix": None})
+            ids = sorted(allowed_ids)
+
+        searches: list[dict] = []
+        for query in queries:
+            searches.append({"index": self.index_name})
+            body = self._build_search_body(query, top_k, metadata_filter, ids)
+            if timeout is not None:
+                body["timeout"] = f"{max(int(timeout * 1000), 1)}ms"
+            searches.append(body)
+
+        client = self._es if timeout is None else self._es.options(request_timeout=timeout)
+        # responses.status 每条子响应必有，保证空结果不会被 filter_path 剔除导致错位
+        resp = client.msearch(
+            searches=searches,
+            filter_path=[
+                "responses.status",
+                "responses.hits.hits._id",
+                "responses.hits.hits._score",
+                "responses.error.reason",
+            ],
+        )
+
+        results: list[list[tuple[str, float]]] = []
+        responses = resp.body.get("responses", [])
+        for query, item in zip(queries, responses):
+            if "error" in item:
+                logger.warning(
+                    "[ES] msearch 子查询失败 '%s': %s",
+                    query[:30],
+                    item["error"].get("reason"),
+                )
+                results.append([])
+                continue
+            results.append(self._parse_hits(item))
+
+        logger.debug(
+            "[ES] BM25 msearch %d 条 query: %s 结果",
+            len(queries),
+            [len(r) for r in results],
+        )
+        return results
+
+    @staticmethod
+    def _build_search_body(
+        query: str,
+        top_k: int,
+        metadata_filter: RetrievalFilter | None = None,
+        ids: list[str] | None = None,
+    ) -> dict:
+        """构建精简检索请求：只需 _id 和 _score，关闭 _source 加载与总命中数统计。
+
+        不设置 stored_fields="_none_"：它会连同 _id 等元数据字段一起去掉，响应中将没有 _id。
+
+        元数据条件放在 bool.filter 中：不参与打分、可被 ES 缓存，且在取 top_k 之前生效。
+        """
+        match = {
+            "multi_match": {
+                "query": query,
+                "fields": ["text^3", "heading_path^2", "doc_name"],
+                "type": "best_fields",
+            }
+        }
+        clauses = BM25Engine._filter_clauses(metadata_filter)
+        if ids is not None:
+            clauses.append({"ids": {"values": ids}})
+        return {
             "size": top_k,
-            "query": {
-                "multi_match": {
-                    "query": query,
-                    "fields": ["text^3", "heading_path^2", "doc_name"],
-                    "type": "best_fields",
-                }
-            },
+            "query": {"bool": {"must": match, "filter": clauses}} if clauses else match,
+            "_source": False,
+            "track_total_hits": False,
         }
 
-        resp = self._es.search(index=self.index_name, **body)
-        results = []
-        for hit in resp["hits"]["hits"]:
-            results.append((hit["_id"], hit["_score"]))
+    @staticmethod
+    def _filter_clauses(metadata_filter: RetrievalFilter | None) -> list[dict]:
+        if metadata_filter is None:
+            return []
+        clauses: list[dict] = []
+        if metadata_filter.doc_ids:
+            clauses.append({"terms": {"doc_id": metadata_filter.doc_ids}})
+        if metadata_filter.node_types:
+            clauses.append({"terms": {"node_type": metadata_filter.node_types}})
+        if metadata_filter.heading_prefix:
+            clauses.append(
+                {"prefix": {"heading_path.raw": metadata_filter.heading_prefix}}
+            )
+        return clauses
 
-        logger.debug("[ES] BM25 搜索 '%s': %d 结果", query[:30], len(results))
-        return results
+    @staticmethod
+    def _parse_hits(item: dict) -> list[tuple[str, float]]:
+        hits = item.get("hits", {}).get("hits", [])
+        return [(hit["_id"], hit["_score"]) for hit in hits]
+
+    def close(self) -> None:
+        if self._es:
+            self._es.close()
+            self._es = None
 
     def delete_index(self) -> None:
         """删除索引（测试清理用）。"""
@@ -0,0 +1,412 @@
+"""进程内 BM25 检索引擎：Elasticsearch 不可用或小规模部署时的替代实现。
+
+与 BM25Engine 接口一致（index_chunk / index_chunks / refresh / search / search_many），
+倒排表以 CSR 形式保存在 NumPy 数组中：
+- term_offsets[t] : term t 的倒排区间起点
+- post_docs / post_tfs : 按 term 连续存放的 doc 序号与词频
+
+写入先追加到 array 缓冲区，refresh() 时与已有 CSR 归并为新的只读快照
+（与 ES 的 refresh 语义一致）；检索读取快照，多 query 一次 bincount 向量化打分。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from config.settings import Settings
+from core.tokenizer import get_tokenizer
+from models.schemas import DocumentChunk, RetrievalFilter
+
+logger = logging.getLogger(__name__)
+
+_SEP = "\x00"
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """refresh 后的只读倒排快照。"""
+
+    term_offsets: np.ndarray  # int64 [n_terms + 1]
+    post_docs: np.ndarray  # int32 [n_postings]
+    post_tfs: np.ndarray  # float32 [n_postings]
+    doc_len: np.ndarray  # float32 [n_docs]
+    live: np.ndarray  # bool [n_docs]
+    avg_doc_len: float
+    n_live: int
+
+
+class LocalBM25Engine:
+    def __init__(self, settings: Settings, k1: float = 1.2, b: float = 0.75):
+        self.settings = settings
+        self.k1 = k1
+        self.b = b
+        self.snapshot_path = settings.bm25_local_snapshot
+        self._lock = threading.Lock()
+        self._bulk_depth = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self._vocab: dict[str, int] = {}
+        self._chunk_ids: list[str] = []
+        self._doc_index: dict[str, int] = {}
+        # doc_id -> 行号，供 doc_id 过滤原生执行；旧快照未保存 doc_id 时为 False
+        self._doc_rows: dict[str, list[int]] = {}
+        self._doc_ids_known = True
+        self._doc_len = array("I")
+        self._live = bytearray()
+
+        # 待 refresh 的追加写缓冲：(term_id, doc, tf) 三列
+        self._pending_terms = array("i")
+        self._pending_docs = array("i")
+        self._pending_tfs = array("I")
+        self._dirty = False
+        self._snapshot = self._empty_snapshot()
+
+    def connect(self) -> None:
+        """加载快照（如配置且存在）；无外部连接。"""
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            self.load(self.snapshot_path)
+        logger.info("[LocalBM25] 已就绪: %d docs", len(self._doc_index))
+
+    def __len__(self) -> int:
+        return len(self._doc_index)
+
+    def close(self) -> None:
+        """关闭时落盘快照（如配置）。"""
+        if self.snapshot_path:
+            self.save(self.snapshot_path)
+
+    # ---- 写入 ----
+
+    def index_chunk(self, chunk: DocumentChunk) -> None:
+        """索引单个 chunk，同 chunk_id 重复写入视为覆盖。"""
+        self.index_chunks([chunk])
+
+    def index_chunks(
+        self,
+        chunks: Iterable[DocumentChunk],
+        batch_size: int | None = None,
+        workers: int | None = None,
+    ) -> int:
+        """批量索引；batch_size / workers 仅为与 BM25Engine 接口对齐。"""
+        count = 0
+        with self._lock:
+            for chunk in chunks:
+                tokens = chunk.bm25_tokens
+                if tokens is None:
+                    tokens = get_tokenizer().cut(chunk.text)
+                self._add_document(
+                    chunk.chunk_id, chunk.metadata.doc_id, self._normalize(tokens)
+                )
+                count += 1
+            self._dirty = self._dirty or count > 0
+        return count
+
+    def _add_document(self, chunk_id: str, doc_id: str, terms: list[str]) -> None:
+        old = self._doc_index.get(chunk_id)
+        if old is not None:
+            self._live[old] = 0
+
+        doc = len(self._chunk_ids)
+        self._chunk_ids.append(chunk_id)
+        self._doc_index[chunk_id] = doc
+        self._doc_rows.setdefault(doc_id, []).append(doc)
+        self._doc_len.append(len(terms))
+        self._live.append(1)
+
+        for term, tf in Counter(terms).items():
+            term_id = self._vocab.setdefault(term, len(self._vocab))
+            self._pending_terms.append(term_id)
+            self._pending_docs.append(doc)
+            self._pending_tfs.append(tf)
+
+    @contextmanager
+    def bulk_load(self) -> Iterator[None]:
+        """批量写入期间暂停检索侧的自动 refresh，退出时 refresh 一次。"""
+        self._bulk_depth += 1
+        try:
+            yield
+        finally:
+            self._bulk_depth -= 1
+            if self._bulk_depth == 0:
+                self.refresh()
+
+    def refresh(self) -> None:
+        """把追加缓冲归并进 CSR 倒排，生成新的只读快照，同时清理已覆盖文档的倒排。"""
+        with self._lock:
+            if not self._dirty:
+                return
+            old = self._snapshot
+            n_terms = len(self._vocab)
+
+            base_terms = np.repeat(
+                np.arange(len(old.term_offsets) - 1, dtype=np.int32),
+                np.diff(old.term_offsets),
+            )
+            terms = np.concatenate(
+                [base_terms, np.frombuffer(self._pending_terms, dtype=np.int32)]
+            )
+            docs = np.concatenate(
+                [old.post_docs, np.frombuffer(self._pending_docs, dtype=np.int32)]
+            )
+            tfs = np.concatenate(
+                [
+                    old.post_tfs,
+                    np.frombuffer(self._pending_tfs, dtype=np.uint32).astype(
+                        np.float32
+                    ),
+                ]
+            )
+
+            live = np.frombuffer(bytes(self._live), dtype=np.uint8).astype(bool)
+            keep = live[docs]
+            terms, docs, tfs = terms[keep], docs[keep], tfs[keep]
+
+            order = np.argsort(terms, kind="stable")
+            terms, docs, tfs = terms[order], docs[order], tfs[order]
+            term_offsets = np.zeros(n_terms + 1, dtype=np.int64)
+            np.cumsum(np.bincount(terms, minlength=n_terms), out=term_offsets[1:])
+
+            doc_len = np.frombuffer(self._doc_len, dtype=np.uint32).astype(np.float32)
+            n_live = int(live.sum())
+            avg_len = float(doc_len[live].mean()) if n_live else 0.0
+
+            self._snapshot = _Snapshot(
+                term_offsets=term_offsets,
+                post_docs=docs,
+                post_tfs=tfs,
+                doc_len=doc_len,
+                live=live,
+                avg_doc_len=avg_len,
+                n_live=n_live,
+            )
+            self._pending_terms = array("i")
+            self._pending_docs = array("i")
+            self._pending_tfs = array("I")
+            self._dirty = False
+
+        logger.debug(
+            "[LocalBM25] refresh: %d docs, %d terms, %d postings",
+            n_live,
+            n_terms,
+            len(docs),
+        )
+
+    # ---- 检索 ----
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 1500,
+        metadata_filter: RetrievalFilter | None = None,
+        allowed_ids: set[str] | None = None,
+    ) -> list[tuple[str, float]]:
+        """BM25 检索，返回 [(chunk_id, bm25_score), ...]。"""
+        return self.search_many(
+            [query], top_k=top_k, metadata_filter=metadata_filter, allowed_ids=allowed_ids
+        )[0]
+
+    def supports_filter(self, metadata_filter: RetrievalFilter) -> bool:
+        """只保存 doc_id：其余条件需要调用方由 ChunkStore 解析出 allowed_ids。"""
+        return self._doc_ids_known and metadata_filter.only_doc_ids()
+
+    def search_many(
+        self,
+        queries: list[str],
+        top_k: int = 1500,
+        timeout: float | None = None,
+        metadata_filter: RetrievalFilter | None = None,
+        allowed_ids: set[str] | None = None,
+    ) -> list[list[tuple[str, float]]]:
+        """多 query 向量化打分：所有 query 的倒排贡献一次 bincount 累加。
+
+        timeout 仅为与 BM25Engine 接口一致，进程内检索不会阻塞在网络上。
+        metadata_filter 中的 doc_id 条件按 doc_id -> 行号原生过滤，其余条件使用
+        调用方由 ChunkStore 解析出的 allowed_ids；两者与 live 掩码合并后在取 top_k 之前生效。
+        """
+        if not queries:
+            return []
+        if self._dirty and self._bulk_depth == 0:
+            self.refresh()
+
+        snap = self._snapshot
+        n_docs = len(snap.doc_len)
+        if n_docs == 0 or snap.n_live == 0:
+            return [[] for _ in queries]
+
+        df = np.diff(snap.term_offsets)
+        slots: list[np.ndarray] = []
+        weights: list[np.ndarray] = []
+        for qi, query in enumerate(queries):
+            tokens = get_tokenizer().query(query).tokens
+            for term, qtf in Counter(self._normalize(tokens)).items():
+                term_id = self._vocab.get(term)
+                if term_id is None or term_id >= len(df) or df[term_id] == 0:
+                    continue
+                start, end = snap.term_offsets[term_id], snap.term_offsets[term_id + 1]
+                docs = snap.post_docs[start:end]
+                tfs = snap.post_tfs[start:end]
+                idf = np.log1p((snap.n_live - df[term_id] + 0.5) / (df[term_id] + 0.5))
+                norm = self.k1 * (
+                    1 - self.b + self.b * snap.doc_len[docs] / snap.avg_doc_len
+                )
+                slots.append(docs.astype(np.int64) + qi * n_docs)
+                weights.append(qtf * idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        if not slots:
+            return [[] for _ in queries]
+
+        scores = np.bincount(
+            np.concatenate(slots),
+            weights=np.concatenate(weights),
+            minlength=len(queries) * n_docs,
+        ).reshape(len(queries), n_docs)
+        live = snap.live
+        if allowed_ids is not None:
+            live = live & self._doc_mask(allowed_ids, n_docs)
+        if metadata_filter is not None and metadata_filter.doc_ids and self._doc_ids_known:
+            live = live & self._doc_id_mask(metadata_filter.doc_ids, n_docs)
+        scores[:, ~live] = 0.0
+
+        results: list[list[tuple[str, float]]] = []
+        for row in scores:
+            nonzero = np.flatnonzero(row > 0)
+            if len(nonzero) > top_k:
+                part = np.argpartition(-row[nonzero], top_k - 1)[:top_k]
+                nonzero = nonzero[part]
+            order = nonzero[np.argsort(-row[nonzero], kind="stable")]
+            results.append([(self._chunk_ids[d], float(row[d])) for d in order])
+        return results
+
+    def _doc_mask(self, chunk_ids: set[str], n_docs: int) -> np.ndarray:
+        docs = [self._doc_index.get(cid, n_docs) for cid in chunk_ids]
+        docs = np.asarray(docs, dtype=np.int64)
+        mask = np.zeros(n_docs, dtype=bool)
+        mask[docs[docs < n_docs]] = True
+        return mask
+
+    def _doc_id_mask(self, doc_ids: list[str], n_docs: int) -> np.ndarray:
+        mask = np.zeros(n_docs, dtype=bool)
+        for doc_id in doc_ids:
+            rows = np.asarray(self._doc_rows.get(doc_id, ()), dtype=np.int64)
+            mask[rows[rows < n_docs]] = True
+        return mask
+
+    # ---- 快照 ----
+
+    def save(self, path: str) -> None:
+        """保存 refresh 后的快照（.npz），包含词表与 chunk_id 表。"""
+        self.refresh()
+        snap = self._snapshot
+        vocab = sorted(self._vocab, key=self._vocab.__getitem__)
+        extra = {}
+        if self._doc_ids_known:
+            extra["doc_ids"] = np.frombuffer(
+                _SEP.join(self._row_doc_ids()).encode("utf-8"), dtype=np.uint8
+            )
+        np.savez(
+            path,
+            term_offsets=snap.term_offsets,
+            post_docs=snap.post_docs,
+            post_tfs=snap.post_tfs,
+            doc_len=np.frombuffer(self._doc_len, dtype=np.uint32),
+            live=np.frombuffer(bytes(self._live), dtype=np.uint8),
+            vocab=np.frombuffer(_SEP.join(vocab).encode("utf-8"), dtype=np.uint8),
+            chunk_ids=np.frombuffer(
+                _SEP.join(self._chunk_ids).encode("utf-8"), dtype=np.uint8
+            ),
+            **extra,
+        )
+        logger.info("[LocalBM25] 快照已保存: %s (%d docs)", path, snap.n_live)
+
+    def load(self, path: str) -> None:
+        """从快照恢复，覆盖当前内存中的全部索引。"""
+        with np.load(path) as data:
+            vocab = self._split(data["vocab"])
+            chunk_ids = self._split(data["chunk_ids"])
+            doc_ids = self._split(data["doc_ids"]) if "doc_ids" in data.files else None
+            live = data["live"].astype(bool)
+            doc_len = data["doc_len"].astype(np.uint32)
+            term_offsets = data["term_offsets"].astype(np.int64)
+            post_docs = data["post_docs"].astype(np.int32)
+            post_tfs = data["post_tfs"].astype(np.float32)
+
+        with self._lock:
+            self._vocab = {term: i for i, term in enumerate(vocab)}
+            self._chunk_ids = chunk_ids
+            self._doc_index = {
+                cid: doc for doc, cid in enumerate(chunk_ids) if live[doc]
+            }
+            self._doc_rows = {}
+            for doc, doc_id in enumerate(doc_ids or ()):
+                self._doc_rows.setdefault(doc_id, []).append(doc)
+            self._doc_ids_known = doc_ids is not None
+            self._doc_len = array("I", doc_len.tobytes())
+            self._live = bytearray(live.astype(np.uint8).tobytes())
+            self._pending_terms = array("i")
+            self._pending_docs = array("i")
+            self._pending_tfs = array("I")
+            self._dirty = False
+            n_live = int(live.sum())
+            self._snapshot = _Snapshot(
+                term_offsets=term_offsets,
+                post_docs=post_docs,
+                post_tfs=post_tfs,
+                doc_len=doc_len.astype(np.float32),
+                live=live,
+                avg_doc_len=float(doc_len[live].mean()) if n_live else 0.0,
+                n_live=n_live,
+            )
+        if doc_ids is None:
+            logger.warning("[LocalBM25] 快照 %s 未保存 doc_id，doc_id 过滤改用 allowed_ids", path)
+        logger.info("[LocalBM25] 快照已加载: %s (%d docs)", path, n_live)
+
+    def delete_index(self) -> None:
+        """清空索引（测试清理用）。"""
+        with self._lock:
+            self._reset()
+
+    # ---- 工具 ----
+
+    def _row_doc_ids(self) -> list[str]:
+        row_doc = [""] * len(self._chunk_ids)
+        for doc_id, rows in self._doc_rows.items():
+            for row in rows:
+                row_doc[row] = doc_id
+        return row_doc
+
+    @staticmethod
+    def _split(buf: np.ndarray) -> list[str]:
+        text = buf.tobytes().decode("utf-8")
+        return text.split(_SEP) if text else []
+
+    @staticmethod
+    def _normalize(tokens: Iterable[str]) -> list[str]:
+        """小写化并丢弃纯空白 / 纯标点 token，与 ES standard 分词行为对齐。"""
+        terms = []
+        for token in tokens:
+            term = token.strip().lower()
+            if term and any(ch.isalnum() for ch in term):
+                terms.append(term)
+        return terms
+
+    @staticmethod
+    def _empty_snapshot() -> _Snapshot:
+        return _Snapshot(
+            term_offsets=np.zeros(1, dtype=np.int64),
+            post_docs=np.zeros(0, dtype=np.int32),
+            post_tfs=np.zeros(0, dtype=np.float32),
+            doc_len=np.zeros(0, dtype=np.float32),
+            live=np.zeros(0, dtype=bool),
+            avg_doc_len=0.0,
+            n_live=0,
+        )
@@ -0,0 +1,643 @@
+"""进程内向量检索引擎：Milvus 不可用时的本地替代（开发、CI、小规模站点）。
+
+与 MilvusVectorEngine 接口一致（insert_chunk(s) / search_384(_many) /
+search_768(_many) / rescore_768 / flush）。每个维度一个索引：
+- 向量存放在预分配、按倍数扩容的矩阵中（写入时 L2 归一化，内积即余弦）
+- flat：矩阵乘 + argpartition 精确 top-k
+- ivf：对全量向量做 k-means 粗聚类，检索只扫描 nprobe 个簇；flush 时新行按已有中心归簇，
+  行数相对建簇时增长超过 local_ivf_retrain_ratio 才重新训练（或调用 rebuild_ivf()）；
+  未归簇的尾部向量仍精确扫描，保证写入即可检索
+
+384 维宽召回层可开启量化（local_vector_quantization = float16 / int8）：
+常驻内存只保留量化码，float32 原始向量写入追加式 .f32 文件；
+检索先在量化码上近似打分取 top_k x rescore_factor 个候选，
+再从 memmap 读取候选的原始向量精确重算分数。
+
+持久化为目录下的 .npy 文件，加载时 memory-map，首次写入时才复制到内存。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Iterable
+
+import numpy as np
+
+from config.settings import Settings
+from models.schemas import DocumentChunk, RetrievalFilter
+from retrieval.quantization import approx_scores, code_dtype, quantize
+
+logger = logging.getLogger(__name__)
+
+
+class _VectorMatrix:
+    """可增长的行矩阵，容量不足时按 2 倍扩容。"""
+
+    def __init__(self, dim: int, capacity: int = 1024, dtype=np.float32):
+        self.dim = dim
+        self._data = np.empty((capacity, dim), dtype=dtype)
+        self.n = 0
+
+    def append(self, rows: np.ndarray) -> int:
+        """追加若干行，返回首行序号。"""
+        start = self.n
+        needed = self.n + len(rows)
+        if needed > len(self._data) or not self._data.flags.writeable:
+            capacity = max(needed, 2 * len(self._data), 1024)
+            data = np.empty((capacity, self.dim), dtype=self._data.dtype)
+            data[: self.n] = self._data[: self.n]
+            self._data = data
+        self._data[start:needed] = rows
+        self.n = needed
+        return start
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self._data[: self.n]
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows.nbytes
+
+    def save(self, path: str) -> None:
+        np.save(path, self.rows)
+
+    @classmethod
+    def load(cls, path: str, dim: int) -> "_VectorMatrix":
+        matrix = cls(dim, capacity=0)
+        matrix._data = np.load(path, mmap_mode="r")
+        matrix.n = len(matrix._data)
+        return matrix
+
+
+class _RawVectorFile:
+    """追加式 float32 原始向量文件，精确重打分时按行 memmap 读取。
+
+    只信任前 n 行：写入从第 n 行处覆盖并截断，残留的未持久化尾部自然被丢弃。
+    """
+
+    def __init__(self, path: str, dim: int, n: int = 0):
+        self.path = path
+        self.dim = dim
+        self.n = n
+        self._map: np.memmap | None = None
+
+    def append(self, rows: np.ndarray) -> None:
+        with open(self.path, "r+b" if os.path.exists(self.path) else "wb") as f:
+            f.seek(self.n * 4 * self.dim)
+            f.write(np.ascontiguousarray(rows, dtype=np.float32).tobytes())
+            f.truncate()
+        self.n += len(rows)
+        self._map = None
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        if self._map is None:
+            self._map = np.memmap(
+                self.path, dtype=np.float32, mode="r", shape=(self.n, self.dim)
+            )
+        return np.asarray(self._map).take(rows, axis=0)
+
+
+# k-means 训练时每个簇的采样向量数上限
+_TRAIN_POINTS_PER_LIST = 64
+
+
+class _IVFLists:
+    """倒排簇：centroids + 按簇连续存放的行号（CSR）。"""
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        covered: int,
+        trained_rows: int,
+    ):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.covered = covered  # 已归簇的行号上界，之后的行属于未归簇尾部
+        self.trained_rows = trained_rows  # 训练 k-means 时的存活行数
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        row_ids: np.ndarray,
+        covered: int,
+        nlist: int,
+        iterations: int = 10,
+        seed: int = 0,
+    ) -> "_IVFLists":
+        """球面 k-means：每轮一次矩阵乘分配 + 按簇累加（np.add.at），不按簇做 Python 循环。
+
+        与 faiss 一致，只在至多 nlist x _TRAIN_POINTS_PER_LIST 个采样向量上训练，再对全量归簇。
+        """
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist, len(vectors))
+        train = vectors
+        sample = nlist * _TRAIN_POINTS_PER_LIST
+        if len(vectors) > sample:
+            train = vectors[rng.choice(len(vectors), sample, replace=False)]
+        centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, train)
+            norms = np.linalg.norm(sums, axis=1)
+            nonempty = norms > 1e-12  # 空簇保留原中心
+            centroids[nonempty] = sums[nonempty] / norms[nonempty, None]
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        ivf = cls(
+            centroids,
+            np.zeros(nlist + 1, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            covered,
+            len(vectors),
+        )
+        return ivf.extend(assign, row_ids, covered)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def extend(self, assign: np.ndarray, row_ids: np.ndarray, covered: int) -> "_IVFLists":
+        """把已分配簇的新行并入倒排表，返回新对象（检索侧持有的旧对象不变）。"""
+        nlist = len(self.centroids)
+        old_counts = np.diff(self.offsets)
+        new_counts = np.bincount(assign, minlength=nlist)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(old_counts + new_counts, out=offsets[1:])
+
+        rows = np.empty(offsets[-1], dtype=np.int64)
+        old_cluster = np.repeat(np.arange(nlist), old_counts)
+        rank = np.arange(len(self.rows)) - self.offsets[old_cluster]
+        rows[offsets[old_cluster] + rank] = self.rows
+
+        order = np.argsort(assign, kind="stable")
+        new_cluster = assign[order]
+        new_start = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(new_counts, out=new_start[1:])
+        rank = np.arange(len(order)) - new_start[new_cluster]
+        rows[offsets[new_cluster] + old_counts[new_cluster] + rank] = row_ids[order]
+        return _IVFLists(self.centroids, offsets, rows, covered, self.trained_rows)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        probe = np.argsort(-(self.centroids @ query))[:nprobe]
+        return np.concatenate(
+            [self.rows[self.offsets[c] : self.offsets[c + 1]] for c in probe]
+        )
+
+
+def _select(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回分数最高的 k 个有限值位置（按分数降序）。"""
+    valid = np.flatnonzero(np.isfinite(scores))
+    if len(valid) > k:
+        valid = valid[np.argpartition(-scores[valid], k - 1)[:k]]
+    return valid[np.argsort(-scores[valid], kind="stable")]
+
+
+class _LocalIndex:
+    """单一维度的向量索引：向量（或量化码）矩阵 + chunk_id / doc_id 列 + 存活标记。"""
+
+    def __init__(self, dim: int, quantization: str = "none", raw_path: str = ""):
+        self.dim = dim
+        self.quantization = quantization
+        self.matrix = _VectorMatrix(dim, dtype=code_dtype(quantization))
+        self.scales = _VectorMatrix(1) if quantization == "int8" else None
+        self.raw = (
+            _RawVectorFile(raw_path, dim) if quantization != "none" else None
+        )
+        self.chunk_ids: list[str] = []
+        self.doc_ids: list[str] = []
+        self.row_of: dict[str, int] = {}
+        self.doc_rows: dict[str, list[int]] = {}  # doc_id -> 行号（含已覆盖的行，由 live 过滤）
+        self.live = np.zeros(0, dtype=bool)
+        self.ivf: _IVFLists | None = None
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    @property
+    def nbytes(self) -> int:
+        """常驻内存的向量字节数（不含 memmap 的原始向量文件）。"""
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales else 0)
+
+    def add(self, chunk_ids: list[str], doc_ids: list[str], vectors: np.ndarray) -> None:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+        codes, scales = quantize(vectors, self.quantization)
+        # 检索不加锁，以 live 的长度为可见行数：先写 id 列与向量，最后发布新的 live
+        self.chunk_ids.extend(chunk_ids)
+        self.doc_ids.extend(doc_ids)
+        if self.raw is not None:
+            self.raw.append(vectors)
+        if self.scales is not None:
+            self.scales.append(scales[:, None])
+        start = self.matrix.append(codes)
+
+        live = np.ones(self.matrix.n, dtype=bool)
+        live[: len(self.live)] = self.live
+        for offset, (cid, doc_id) in enumerate(zip(chunk_ids, doc_ids)):
+            old = self.row_of.get(cid)
+            if old is not None:
+                live[old] = False
+            self.row_of[cid] = start + offset
+            self.doc_rows.setdefault(doc_id, []).append(start + offset)
+        self.live = live
+
+    def exact(self, rows: np.ndarray) -> np.ndarray:
+        """取指定行的 float32 向量：量化模式读原始向量文件，否则直接取矩阵。"""
+        if self.raw is None:
+            return np.asarray(self.matrix.rows[rows])
+        if np.all(rows[1:] >= rows[:-1]):
+            return self.raw.take(rows)
+        order = np.argsort(rows)
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        vectors[order] = self.raw.take(rows[order])  # 按行号顺序读，减少随机 IO
+        return vectors
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        nprobe: int,
+        rescore_factor: int,
+        allowed_ids: set[str] | None = None,
+        doc_ids: list[str] | None = None,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """返回每个 query 的 (行号, 分数)，分数降序。
+
+        allowed_ids / doc_ids 与存活标记合并为行掩码，在取 top_k 之前过滤。
+        只检索本次读取到的 live 覆盖的行，并发写入中尚未发布的行不可见。
+        """
+        live = self.live
+        n = len(live)
+        if allowed_ids is not None:
+            live = live & self.row_mask(allowed_ids, n)
+        if doc_ids:
+            live = live & self.doc_mask(doc_ids, n)
+        ivf = self.ivf
+        if ivf is None:
+            rows = None
+            scores = self._scores(queries, None, n)
+            scores[:, ~live] = -np.inf
+            per_query = [(rows, s) for s in scores]
+        else:
+            per_query = []
+            tail = np.arange(min(ivf.covered, n), n, dtype=np.int64)
+            for q in queries:
+                rows = np.concatenate([ivf.candidates(q, nprobe), tail])
+                rows = rows[rows < n]
+                rows = rows[live[rows]]
+                per_query.append((rows, self._scores(q[None, :], rows, n)[0]))
+
+        if self.raw is None:
+            results = []
+            for rows, scores in per_query:
+                pos = _select(scores, top_k)
+                results.append((pos if rows is None else rows[pos], scores[pos]))
+            return results
+
+        # 量化码近似打分选候选，原始向量精确重算：各 query 的候选合并后只读一次原始向量
+        candidates = []
+        for rows, scores in per_query:
+            pos = _select(scores, top_k * rescore_factor)
+            candidates.append(pos if rows is None else rows[pos])
+        union = np.unique(np.concatenate(candidates))
+        exact_all = self.exact(union) @ queries.T
+        results = []
+        for i, cand in enumerate(candidates):
+            exact = exact_all[np.searchsorted(union, cand), i]
+            best = _select(exact, top_k)
+            results.append((cand[best], exact[best]))
+        return results
+
+    def row_mask(self, chunk_ids: set[str], n: int | None = None) -> np.ndarray:
+        n = len(self.live) if n is None else n
+        rows = np.fromiter(
+            (self.row_of.get(cid, -1) for cid in chunk_ids),
+            dtype=np.int64,
+            count=len(chunk_ids),
+        )
+        mask = np.zeros(n, dtype=bool)
+        mask[rows[(rows >= 0) & (rows < n)]] = True
+        return mask
+
+    def doc_mask(self, doc_ids: list[str], n: int) -> np.ndarray:
+        mask = np.zeros(n, dtype=bool)
+        for doc_id in doc_ids:
+            rows = np.asarray(self.doc_rows.get(doc_id, ()), dtype=np.int64)
+            mask[rows[rows < n]] = True
+        return mask
+
+    def _scores(self, queries: np.ndarray, rows: np.ndarray | None, n: int) -> np.ndarray:
+        codes = self.matrix.rows[:n] if rows is None else self.matrix.rows[rows]
+        if self.quantization == "none":
+            return queries @ codes.T
+        scales = None
+        if self.scales is not None:
+            scales = self.scales.rows[:n, 0] if rows is None else self.scales.rows[rows, 0]
+        return approx_scores(codes, scales, queries)
+
+    def save(self, directory: str) -> None:
+        prefix = os.path.join(directory, f"vectors_{self.dim}")
+        self.matrix.save(prefix + ".npy")
+        if self.scales is not None:
+            self.scales.save(prefix + "_scales.npy")
+        if self.raw is not None and os.path.abspath(self.raw.path) != os.path.abspath(
+            prefix + ".f32"
+        ):
+            shutil.copyfile(self.raw.path, prefix + ".f32")
+        np.save(prefix + "_live.npy", self.live)
+        with open(prefix + "_ids.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "quantization": self.quantization,
+                    "chunk_ids": self.chunk_ids,
+                    "doc_ids": self.doc_ids,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, directory: str, dim: int, quantization: str) -> "_LocalIndex":
+        prefix = os.path.join(directory, f"vectors_{dim}")
+        index = cls(dim, quantization, raw_path=prefix + ".f32")
+        if not os.path.exists(prefix + ".npy"):
+            return index
+        with open(prefix + "_ids.json", encoding="utf-8") as f:
+            ids = json.load(f)
+        if ids.get("quantization", "none") != quantization:
+            raise ValueError(
+                f"{prefix} 的量化模式为 {ids.get('quantization', 'none')}，"
+                f"与配置 {quantization} 不一致，请重建索引"
+            )
+        index.matrix = _VectorMatrix.load(prefix + ".npy", dim)
+        if index.scales is not None:
+            index.scales = _VectorMatrix.load(prefix + "_scales.npy", 1)
+        if index.raw is not None:
+            index.raw.n = index.matrix.n
+        index.live = np.load(prefix + "_live.npy")
+        index.chunk_ids = ids["chunk_ids"]
+        index.doc_ids = ids["doc_ids"]
+        index.row_of = {
+            cid: row for row, cid in enumerate(index.chunk_ids) if index.live[row]
+        }
+        for row, doc_id in enumerate(index.doc_ids):
+            index.doc_rows.setdefault(doc_id, []).append(row)
+        return index
+
+
+class LocalVectorEngine:
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.index_dir = settings.local_vector_dir
+        self.index_type = settings.local_vector_index_type
+        self.quantization = settings.local_vector_quantization
+        self._raw_dir = ""
+        self._lock = threading.Lock()
+        self._ivf_lock = threading.Lock()  # 串行化建簇，k-means 期间不阻塞写入与检索
+        self._reset()
+
+    def _reset(self) -> None:
+        self._index_384 = _LocalIndex(
+            self.settings.embedding_dim_light,
+            self.quantization,
+            raw_path=self._raw_path(self.settings.embedding_dim_light),
+        )
+        self._index_768 = _LocalIndex(self.settings.embedding_dim_dense)
+
+    def _raw_path(self, dim: int) -> str:
+        """量化模式下原始向量文件路径：优先 local_vector_dir，否则使用临时目录。"""
+        if self.quantization == "none":
+            return ""
+        if not self._raw_dir:
+            self._raw_dir = self.index_dir or tempfile.mkdtemp(prefix="local_vectors_")
+            os.makedirs(self._raw_dir, exist_ok=True)
+        return os.path.join(self._raw_dir, f"vectors_{dim}.f32")
+
+    def connect(self) -> None:
+        """从 local_vector_dir 加载已持久化的向量（如存在）。"""
+        if self.index_dir and os.path.isdir(self.index_dir):
+            self._index_384 = _LocalIndex.load(
+                self.index_dir, self.settings.embedding_dim_light, self.quantization
+            )
+            self._index_768 = _LocalIndex.load(
+                self.index_dir, self.settings.embedding_dim_dense, "none"
+            )
+            self.rebuild_ivf()
+        logger.info(
+            "[LocalVector] 已就绪: 384d=%d, 768d=%d (%s, 量化=%s)",
+            len(self._index_384),
+            len(self._index_768),
+            self.index_type,
+            self.quantization,
+        )
+
+    def has_persisted_index(self) -> bool:
+        """local_vector_dir 中是否已有持久化的向量索引。"""
+        if not self.index_dir:
+            return False
+        prefix = os.path.join(self.index_dir, f"vectors_{self.settings.embedding_dim_light}")
+        return os.path.exists(prefix + ".npy") and os.path.exists(prefix + "_ids.json")
+
+    def close(self) -> None:
+        """关闭时持久化（如配置 local_vector_dir），否则删除存放原始向量的临时目录。"""
+        if self.index_dir:
+            self.save(self.index_dir)
+        elif self._raw_dir:
+            shutil.rmtree(self._raw_dir, ignore_errors=True)
+            self._raw_dir = ""
+
+    def memory_usage(self) -> dict[str, int]:
+        """各维度常驻内存的向量字节数。"""
+        return {
+            "vectors_384": self._index_384.nbytes,
+            "vectors_768": self._index_768.nbytes,
+        }
+
+    # ---- 写入 ----
+
+    def insert_chunk(self, chunk: DocumentChunk) -> None:
+        self.insert_chunks([chunk], flush=False)
+
+    def insert_chunks(
+        self,
+        chunks: Iterable[DocumentChunk],
+        batch_size: int | None = None,
+        flush: bool = True,
+    ) -> int:
+        """按列批量写入两个维度的索引；batch_size 仅为与 Milvus 接口对齐。"""
+        chunks = list(chunks)
+        inserted = 0
+        with self._lock:
+            for index, attr in (
+                (self._index_384, "vector_384"),
+                (self._index_768, "vector_768"),
+            ):
+                rows = [c for c in chunks if getattr(c, attr)]
+                if not rows:
+                    continue
+                index.add(
+                    [c.chunk_id for c in rows],
+                    [c.metadata.doc_id for c in rows],
+                    np.asarray([getattr(c, attr) for c in rows], dtype=np.float32),
+                )
+                inserted += len(rows)
+        if flush:
+            self.flush()
+        return inserted
+
+    def flush(self) -> None:
+        """IVF 模式下把新行归入已有簇（与 Milvus flush 封存 segment 对应）。
+
+        首次达到 local_ivf_min_rows，或存活行数相对上次训练增长超过
+        local_ivf_retrain_ratio 时才重新训练 k-means。
+        """
+        self._update_ivf(force=False)
+
+    def rebuild_ivf(self) -> None:
+        """按需全量重新训练 IVF 聚类中心（同时清理倒排中已覆盖的行）。"""
+        self._update_ivf(force=True)
+
+    def _update_ivf(self, force: bool) -> None:
+        if self.index_type != "ivf":
+            return
+        with self._ivf_lock:
+            for index in (self._index_384, self._index_768):
+                self._update_index_ivf(index, force)
+
+    def _update_index_ivf(self, index: _LocalIndex, force: bool) -> None:
+        # 在写锁内取快照，k-means / 归簇在锁外计算，最后原子替换 index.ivf
+        with self._lock:
+            live = index.live
+            n = len(live)
+            ivf = index.ivf
+        live_count = int(live.sum())
+        if live_count < self.settings.local_ivf_min_rows:
+            index.ivf = None
+            return
+
+        retrain = (
+            force
+            or ivf is None
+            or live_count > ivf.trained_rows * (1 + self.settings.local_ivf_retrain_ratio)
+        )
+        if retrain:
+            live_rows = np.flatnonzero(live)
+            index.ivf = _IVFLists.build(
+                index.exact(live_rows), live_rows, n, self.settings.local_ivf_nlist
+            )
+            logger.info(
+                "[LocalVector] IVF 训练: dim=%d, %d 行, nlist=%d",
+                index.dim,
+                live_count,
+                len(index.ivf.centroids),
+            )
+        elif n > ivf.covered:
+            new_rows = np.arange(ivf.covered, n, dtype=np.int64)
+            new_rows = new_rows[live[new_rows]]
+            index.ivf = ivf.extend(ivf.assign(index.exact(new_rows)), new_rows, n)
+
+    # ---- 检索 ----
+
+    def search_384(
+        self, query_vector: list[float], top_k: int = 1500
+    ) -> list[tuple[str, float]]:
+        return self.search_384_many([query_vector], top_k)[0]
+
+    def search_768(
+        self, query_vector: list[float], top_k: int = 80
+    ) -> list[tuple[str, float]]:
+        return self.search_768_many([query_vector], top_k)[0]
+
+    def search_384_many(
+        self,
+        query_vectors: list[list[float]],
+        top_k: int = 1500,
+        timeout: float | None = None,
+        metadata_filter: RetrievalFilter | None = None,
+        allowed_ids: set[str] | None = None,
+    ) -> list[list[tuple[str, float]]]:
+        # timeout 仅为与 MilvusVectorEngine 接口一致；doc_id 条件按 doc_id 列原生过滤
+        doc_ids = metadata_filter.doc_ids if metadata_filter is not None else None
+        return self._search_many(
+            self._index_384, query_vectors, top_k, allowed_ids, doc_ids
+        )
+
+    def supports_filter(self, metadata_filter: RetrievalFilter) -> bool:
+        """与 Milvus 一致只保存 doc_id 列，其余条件需要调用方解析出 allowed_ids。"""
+        return metadata_filter.only_doc_ids()
+
+    def search_768_many(
+        self, query_vectors: list[list[float]], top_k: int = 80
+    ) -> list[list[tuple[str, float]]]:
+        return self._search_many(self._index_768, query_vectors, top_k)
+
+    def rescore_768(
+        self,
+        query_vector: list[float],
+        candidate_ids: list[str],
+        timeout: float | None = None,
+    ) -> list[tuple[str, float]]:
+        """只对给定候选做 768 维精确打分，不在索引中的候选被跳过。"""
+        index = self._index_768
+        pairs = [(cid, index.row_of[cid]) for cid in candidate_ids if cid in index.row_of]
+        if not pairs:
+            return []
+        rows = np.fromiter((row for _, row in pairs), dtype=np.int64, count=len(pairs))
+        scores = index.exact(rows) @ self._normalize(query_vector)
+        results = [(cid, float(s)) for (cid, _), s in zip(pairs, scores)]
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results
+
+    def _search_many(
+        self,
+        index: _LocalIndex,
+        query_vectors: list[list[float]],
+        top_k: int,
+        allowed_ids: set[str] | None = None,
+        doc_ids: list[str] | None = None,
+    ) -> list[list[tuple[str, float]]]:
+        if not query_vectors:
+            return []
+        if len(index) == 0:
+            return [[] for _ in query_vectors]
+
+        queries = np.stack([self._normalize(v) for v in query_vectors])
+        hits = index.search(
+            queries,
+            top_k,
+            nprobe=self.settings.local_ivf_nprobe,
+            rescore_factor=self.settings.local_vector_rescore_factor,
+            allowed_ids=allowed_ids,
+            doc_ids=doc_ids,
+        )
+        return [
+            [(index.chunk_ids[r], float(s)) for r, s in zip(rows, scores)]
+            for rows, scores in hits
+        ]
+
+    @staticmethod
+    def _normalize(vector: list[float] | np.ndarray) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    # ---- 持久化 ----
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._index_384.save(directory)
+            self._index_768.save(directory)
+        logger.info("[LocalVector] 已持久化到 %s", directory)
+
+    def drop_collections(self) -> None:
+        """清空索引（测试清理用）。"""
+        with self._lock:
+            self._reset()
@@ -1,25 +1,50 @@
 """三级渐进式混合检索器。
 
-L1（粗筛）: BM25 + 384 维向量，各召回 top_k，合并
-L2（精筛）: RSF 归一化融合打分 -> 80 docs
+L1（粗筛）: BM25 + 384 维向量，各召回 top_k，合并（所有改写 query 并发召回）
+L2（精筛）: RSF 预融合取候选 -> 768 维向量仅对候选重打分 -> RSF 融合 -> 80 docs
 L3（精排）: Cross-encoder rerank + 断崖截断 -> 10 docs
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Sequence
 
+from cache.rerank_cache import CachedReranker
+from cache.retrieval_cache import RetrievalCache, retrieval_key
 from config.settings import Settings
 from core.abstractions import PipelineRetriever
-from core.algorithms import compute_rsf_alpha, rerank_with_threshold_cutoff, rsf_fusion
+from core.deadline import (
+    BM25_ONLY,
+    NO_DENSE_RESCORE,
+    NO_RERANK,
+    VECTOR_ONLY,
+    Deadline,
+)
+from core.metrics import observe_stage, set_candidates
+from core.tokenizer import get_tokenizer
+from core.algorithms import (
+    choose_rerank_depth,
+    compute_rsf_alpha,
+    rerank_with_threshold_cutoff,
+    rsf_fusion,
+)
 from ingestion.embedder import Embedder
-from models.schemas import DocumentChunk, RetrievedChunk
+from models.schemas import RetrievalFilter, RetrievedChunk
 from retrieval.bm25_engine import BM25Engine
 from retrieval.reranker import CrossEncoderReranker
 from retrieval.vector_engine import MilvusVectorEngine
+from storage.chunk_store import ChunkStore
 
 logger = logging.getLogger(__name__)
 
+# 补足的未精排候选排在最后一条 cross-encoder 分数之下的最小间隔
+_FILL_MARGIN = 1e-3
+
 
 class ThreeLevelRetriever(PipelineRetriever):
     def __init__(
@@ -29,7 +54,7 @@ class ThreeLevelRetriever(PipelineRetriever):
         vector_engine: MilvusVectorEngine,
         reranker: CrossEncoderReranker,
         embedder: Embedder,
-        chunk_store: dict[str, DocumentChunk],
+        chunk_store: ChunkStore,
     ):
         self.settings = settings
         self.bm25_engine = bm25_engine
@@ -38,25 +63,136 @@ class ThreeLevelRetriever(PipelineRetriever):
         self.embedder = embedder
         self.chunk_store = chunk_store
 
+        # ES / Milvus 客户端均为同步阻塞调用，放入有界线程池避免阻塞事件循环
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.level1_max_workers,
+            thread_name_prefix="l1-recall",
+        )
+        self._rerank_cost_ms: float | None = None
+        # 检索结果缓存（由 Components 按配置注入）
+        self.result_cache: RetrievalCache | None = None
+
     async def retrieve(
-        self, query: str, rewritten_queries: list[str], top_k: int = 10
+        self,
+        query: str,
+        rewritten_queries: list[str],
+        top_k: int = 10,
+        deadline: Deadline | None = None,
+        metadata_filter: RetrievalFilter | None = None,
     ) -> list[RetrievedChunk]:
-        # ---- L1 粗筛：多路召回 ----
-        all_bm25: list[tuple[str, float]] = []
-        all_vector: list[tuple[str, float]] = []
-
-        for q in rewritten_queries:
-            # BM25 检索
-            bm25_hits = self.bm25_engine.search(q, top_k=self.settings.level1_topk)
-            all_bm25.extend(bm25_hits)
-
-            # 384 维向量检索
-            vec_384 = self.embedder.embed_384(q)
-            vec_hits = self.vector_engine.search_384(
-                vec_384, top_k=self.settings.level1_topk
+        """deadline 为空时按 request_timeout_ms 新建，各阶段超时降级登记在其上。
+
+        配置了检索结果缓存时先按 (query, 改写集合, top_k, 过滤条件) 查缓存；
+        检索过程中发生降级的结果不写入缓存。
+        metadata_filter 下推到 L1 的 BM25 / 向量索引内部，L2 / L3 只处理满足条件的候选。
+        """
+        deadline = deadline or Deadline(self.settings.request_timeout_ms)
+        if metadata_filter is not None and metadata_filter.is_empty():
+            metadata_filter = None
+        cache_key = cache_generation = None
+        if self.result_cache is not None:
+            cache_key = retrieval_key(query, rewritten_queries, top_k, metadata_filter)
+            cached, cache_generation = self.result_cache.get(cache_key)
+            if cached is not None:
+                logger.info("[Retrieval] 检索结果缓存命中: %d docs", len(cached))
+                return self._build_results(cached, source="retrieval_cache")
+
+        degraded_before = len(deadline.degradations)
+        started = time.perf_counter()
+        allowed_ids = self._resolve_filter(metadata_filter)
+        if allowed_ids is not None and not allowed_ids:
+            return []
+        # ---- L1 粗筛：多路并发召回 ----
+        dense_queries = [query] if self.settings.level2_dense_rescore else []
+        dense_vectors: dict[str, list[float]] = {}
+        bm25_hits, vector_hits = await self._recall_level1(
+            rewritten_queries,
+            deadline,
+            metadata_filter,
+            allowed_ids,
+            dense_queries=dense_queries,
+            dense_out=dense_vectors,
+        )
+        results = await self._rank(
+            query,
+            [hit for hits in bm25_hits for hit in hits],
+            [hit for hits in vector_hits for hit in hits],
+            top_k,
+            started,
+            deadline,
+            dense_vector=dense_vectors.get(query),
+        )
+        if cache_key is not None and len(deadline.degradations) == degraded_before:
+            self.result_cache.set(
+                cache_key, [(r.chunk.chunk_id, r.score) for r in results], cache_generation
+            )
+        return results
+
+    async def retrieve_many(
+        self,
+        requests: list[tuple[str, list[str]]],
+        top_k: int = 10,
+        deadline: Deadline | None = None,
+        metadata_filter: RetrievalFilter | None = None,
+    ) -> list[list[RetrievedChunk]]:
+        """批量检索：所有请求的改写 query 合并为一次 L1 批量召回，L2/L3 逐条执行。
+
+        requests: [(query, rewritten_queries), ...]，返回结果与之一一对应；
+        metadata_filter 对全部请求生效。
+        """
+        deadline = deadline or Deadline(self.settings.request_timeout_ms)
+        if metadata_filter is not None and metadata_filter.is_empty():
+            metadata_filter = None
+        started = time.perf_counter()
+        allowed_ids = self._resolve_filter(metadata_filter)
+        if allowed_ids is not None and not allowed_ids:
+            return [[] for _ in requests]
+        flat_queries = [q for _, rewrites in requests for q in rewrites]
+        dense_queries = (
+            [query for query, _ in requests] if self.settings.level2_dense_rescore else []
+        )
+        dense_vectors: dict[str, list[float]] = {}
+        bm25_hits, vector_hits = await self._recall_level1(
+            flat_queries,
+            deadline,
+            metadata_filter,
+            allowed_ids,
+            dense_queries=dense_queries,
+            dense_out=dense_vectors,
+        )
+
+        results: list[list[RetrievedChunk]] = []
+        offset = 0
+        for query, rewrites in requests:
+            span = slice(offset, offset + len(rewrites))
+            offset += len(rewrites)
+            results.append(
+                await self._rank(
+                    query,
+                    [hit for hits in bm25_hits[span] for hit in hits],
+                    [hit for hits in vector_hits[span] for hit in hits],
+                    top_k,
+                    started,
+                    deadline,
+                    dense_vector=dense_vectors.get(query),
+                )
             )
-            all_vector.extend(vec_hits)
+        return results
 
+    async def _rank(
+        self,
+        query: str,
+        all_bm25: list[tuple[str, float]],
+        all_vector: list[tuple[str, float]],
+        top_k: int,
+        started: float,
+        deadline: Deadline,
+        dense_vector: list[float] | None = None,
+    ) -> list[RetrievedChunk]:
+        """L1 结果去重后执行 L2 RSF 融合与 L3 精排。
+
+        dense_vector 为 L1 中与 384 维向量一次编码得到的 768 维 query 向量。
+        """
         # 去重，保留最高分
         bm25_deduped = self._deduplicate(all_bm25)
         vec_deduped = self._deduplicate(all_vector)
@@ -66,16 +202,27 @@ class ThreeLevelRetriever(PipelineRetriever):
             len(bm25_deduped),
             len(vec_deduped),
         )
+        set_candidates("l1_bm25", len(bm25_deduped))
+        set_candidates("l1_vector", len(vec_deduped))
 
         # ---- L2 精筛：RSF 融合 ----
-        token_len = self._count_tokens(query)
+        rsf_start = time.perf_counter()
+        # 同一 TokenizedQuery 随后被 Reranker 从 LRU 中复用
+        token_len = get_tokenizer().query(query).token_count
         alpha = compute_rsf_alpha(
             token_len, k=self.settings.rsf_k, s=self.settings.rsf_s
         )
-        fused = rsf_fusion(
-            bm25_deduped, vec_deduped, alpha, top_k=self.settings.level2_topk
-        )
+        if self.settings.level2_dense_rescore:
+            fused = await self._fuse_with_dense_rescore(
+                query, bm25_deduped, vec_deduped, alpha, deadline, dense_vector
+            )
+        else:
+            fused = rsf_fusion(
+                bm25_deduped, vec_deduped, alpha, top_k=self.settings.level2_topk
+            )
 
+        observe_stage("rsf", time.perf_counter() - rsf_start)
+        set_candidates("l2", len(fused))
         logger.info(
             "[L2 RSF] alpha=%.3f (token_len=%d), 输出: %d docs",
             alpha,
@@ -84,25 +231,345 @@ class ThreeLevelRetriever(PipelineRetriever):
         )
 
         # ---- L3 精排：Rerank + 断崖截断 ----
-        reranked = self.reranker.rerank(query, fused)
+        final, n_reranked = await self._rerank_level3(query, fused, top_k, started, deadline)
+        set_candidates("l3", len(final))
+        logger.info("[L3 Rerank] 精排后: %d docs (cross-encoder 打分 %d)", len(final), n_reranked)
+
+        results = self._build_results(final[:n_reranked], source="rerank")
+        results += self._build_results(final[n_reranked:], source="rsf")
+        observe_stage("retrieval", time.perf_counter() - started)
+        return results
+
+    def _build_results(
+        self, final: list[tuple[str, float]], source: str
+    ) -> list[RetrievedChunk]:
+        """只为最终 top-k 构造 DocumentChunk 视图，已不在 chunk store 中的 chunk 被跳过。"""
+        results: list[RetrievedChunk] = []
+        for chunk_id, score in final:
+            chunk = self.chunk_store.get(chunk_id)
+            if chunk:
+                results.append(RetrievedChunk(chunk=chunk, score=score, source=source))
+        return results
+
+    async def _rerank_level3(
+        self,
+        query: str,
+        fused: list[tuple[str, float]],
+        top_k: int,
+        started: float,
+        deadline: Deadline | None = None,
+    ) -> tuple[list[tuple[str, float]], int]:
+        """Cross-encoder 精排 + 断崖截断；开启自适应深度时只精排前 depth 个候选。
+
+        返回 (结果, 前多少条为 cross-encoder 分数)。
+        depth 小于 top_k 时，精排结果之后按 RSF 顺序补足未精排的候选，其分数平移到
+        最后一条精排分数之下（保留 RSF 分差），不与 cross-encoder 分数混排；
+        跳过精排或精排超时时直接使用 RSF 融合顺序，同样做断崖截断。
+        """
+        depth = len(fused)
+        if self.settings.rerank_adaptive_depth:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            remaining_ms = self.settings.rerank_latency_budget_ms - elapsed_ms
+            if deadline is not None:
+                remaining_ms = min(remaining_ms, deadline.remaining_ms())
+            depth, reason = choose_rerank_depth(
+                [score for _, score in fused],
+                max_depth=len(fused),
+                min_depth=self.settings.rerank_min_depth,
+                skip_gap=self.settings.rerank_skip_gap,
+                gap_threshold=self.settings.rerank_gap_threshold,
+                remaining_ms=remaining_ms,
+                cost_per_candidate_ms=self._rerank_cost_ms,
+            )
+            logger.info(
+                "[L3 Rerank] 自适应深度 %d/%d (%s), 已用 %.0fms",
+                depth,
+                len(fused),
+                reason,
+                elapsed_ms,
+            )
+
+        reranked: list[tuple[str, float]] | None = None
+        if depth > 0:
+            reranked = await self._cross_encode(query, fused[:depth], deadline)
+        if reranked is None:
+            # 未精排：RSF 分数本身降序，同样做断崖截断
+            final = rerank_with_threshold_cutoff(
+                fused, diff_threshold=self.settings.rerank_diff_threshold, max_output=top_k
+            )
+            return final, 0
+
         final = rerank_with_threshold_cutoff(
             reranked,
             diff_threshold=self.settings.rerank_diff_threshold,
             max_output=top_k,
         )
+        n_reranked = len(final)
+        rest = fused[depth : depth + top_k - len(final)]
+        if n_reranked == len(reranked) and rest:
+            floor, top = final[-1][1] if final else 0.0, rest[0][1]
+            final += [(cid, floor - (top - s) - _FILL_MARGIN) for cid, s in rest]
+        return final, n_reranked
 
-        logger.info("[L3 Rerank] 精排后: %d docs", len(final))
+    async def _cross_encode(
+        self,
+        query: str,
+        candidates: list[tuple[str, float]],
+        deadline: Deadline | None,
+    ) -> list[tuple[str, float]] | None:
+        """cross-encoder 打分，超时返回 None；单候选耗时 EMA 只按实际送入模型的候选更新。"""
+        t0 = time.perf_counter()
+        timeout = (
+            None if deadline is None else deadline.budget_s(self.settings.rerank_timeout_ms)
+        )
+        stats: dict[str, int] = {}
+        if isinstance(self.reranker, CachedReranker):
+            call = self.reranker.arerank(query, candidates, stats=stats)
+        else:
+            call = self.reranker.arerank(query, candidates)
+        try:
+            reranked = await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError:
+            if deadline is not None:
+                deadline.degrade(NO_RERANK, f"精排 {len(candidates)} 个候选超时")
+            return None
 
-        # 构建结果
-        results: list[RetrievedChunk] = []
-        for chunk_id, score in final:
-            chunk = self.chunk_store.get(chunk_id)
-            if chunk:
-                results.append(
-                    RetrievedChunk(chunk=chunk, score=score, source="rerank")
-                )
+        elapsed = time.perf_counter() - t0
+        observe_stage("rerank", elapsed)
+        scored = stats.get("scored", len(candidates))
+        if scored > 0:
+            # 单候选精排耗时的指数滑动平均，供后续请求估算可负担的深度；
+            # 全部命中分数缓存的请求几乎不耗时，计入会低估模型成本
+            cost = elapsed * 1000 / scored
+            self._rerank_cost_ms = (
+                cost if self._rerank_cost_ms is None else 0.8 * self._rerank_cost_ms + 0.2 * cost
+            )
+        return reranked
 
-        return results
+    async def _fuse_with_dense_rescore(
+        self,
+        query: str,
+        bm25_hits: list[tuple[str, float]],
+        vec_hits: list[tuple[str, float]],
+        alpha: float,
+        deadline: Deadline | None = None,
+        dense_vector: list[float] | None = None,
+    ) -> list[tuple[str, float]]:
+        """L2 精筛：BM25 + 384 维预融合选出候选，再用 768 维分数替换向量路重新融合。
+
+        768 维检索被限定在候选 chunk_id 内，不会引入 L1 之外的文档；
+        重打分失败或超时时退回预融合结果。
+        """
+        pre_fused = rsf_fusion(
+            bm25_hits, vec_hits, alpha, top_k=self.settings.level2_rescore_candidates
+        )
+        candidate_ids = [cid for cid, _ in pre_fused]
+
+        timeout = (
+            None if deadline is None else deadline.budget_s(self.settings.level2_timeout_ms)
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            dense_hits = await asyncio.wait_for(
+                loop.run_in_executor(
+                    self._executor,
+                    self._dense_rescore,
+                    query,
+                    candidate_ids,
+                    timeout,
+                    dense_vector,
+                ),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            if deadline is not None:
+                deadline.degrade(NO_DENSE_RESCORE, "768 维重打分超时")
+            return pre_fused[: self.settings.level2_topk]
+        except Exception as e:
+            logger.warning("[L2 RSF] 768 维重打分失败，使用 384 维融合结果: %s", e)
+            if deadline is not None:
+                deadline.degrade(NO_DENSE_RESCORE, str(e))
+            return pre_fused[: self.settings.level2_topk]
+
+        candidates = set(candidate_ids)
+        bm25_candidates = [(cid, s) for cid, s in bm25_hits if cid in candidates]
+        logger.info(
+            "[L2 RSF] 768 维重打分: %d 个候选, 命中 %d 条",
+            len(candidate_ids),
+            len(dense_hits),
+        )
+        return rsf_fusion(
+            bm25_candidates, dense_hits, alpha, top_k=self.settings.level2_topk
+        )
+
+    def _dense_rescore(
+        self,
+        query: str,
+        candidate_ids: list[str],
+        timeout: float | None = None,
+        vector: list[float] | None = None,
+    ) -> list[tuple[str, float]]:
+        """vector 为空（L1 向量路超时或失败）时才单独编码 768 维 query 向量。"""
+        vec_768 = vector if vector is not None else self.embedder.embed_768(query)
+        return self.vector_engine.rescore_768(vec_768, candidate_ids, timeout=timeout)
+
+    def _resolve_filter(self, metadata_filter: RetrievalFilter | None) -> set[str] | None:
+        """把过滤条件解析为允许的 chunk_id 集合，供无法原生过滤的引擎使用。
+
+        两路引擎都能原生执行（如只有 doc_id 条件）时不构造集合，返回 None；
+        本地 chunk store 为空（元数据尚未同步）时同样返回 None，各引擎只执行能原生表达的条件。
+        """
+        if metadata_filter is None:
+            return None
+        engines = (self.bm25_engine, self.vector_engine)
+        if all(engine.supports_filter(metadata_filter) for engine in engines):
+            return None
+        self.chunk_store.maybe_refresh()
+        if len(self.chunk_store) == 0:
+            logger.warning("[Filter] chunk store 为空，只下推引擎可原生执行的过滤条件")
+            return None
+        start = time.perf_counter()
+        allowed_ids = self.chunk_store.ids_matching(metadata_filter)
+        observe_stage("filter", time.perf_counter() - start)
+        logger.info("[Filter] 过滤条件命中 %d 个 chunk", len(allowed_ids))
+        return allowed_ids
+
+    async def _recall_level1(
+        self,
+        queries: list[str],
+        deadline: Deadline | None = None,
+        metadata_filter: RetrievalFilter | None = None,
+        allowed_ids: set[str] | None = None,
+        dense_queries: Sequence[str] = (),
+        dense_out: dict[str, list[float]] | None = None,
+    ) -> tuple[list[list[tuple[str, float]]], list[list[tuple[str, float]]]]:
+        """所有 query 的 BM25 / 向量召回同时发出，受 level1_timeout_ms 与剩余总预算约束。
+
+        BM25 合并为一次 _msearch，向量合并为一次 Milvus 批量检索，两路并发。
+        返回 (bm25_per_query, vector_per_query)，与 queries 一一对应；
+        超时或失败的一路只记录警告并返回空列表，不拖垮整个请求。
+        超时同时下发给 ES / Milvus 客户端，由客户端中止仍在进行的请求。
+        过滤条件与 allowed_ids 一并下发，由各引擎在取 top_k 之前过滤。
+        dense_queries 的 768 维向量在向量路中与 384 维一次编码得到，写入 dense_out。
+        """
+        loop = asyncio.get_running_loop()
+        top_k = self.settings.level1_topk
+        timeout = (
+            self.settings.level1_timeout_ms / 1000
+            if deadline is None
+            else deadline.budget_s(self.settings.level1_timeout_ms)
+        )
+
+        calls: dict[str, Callable[[], list[list[tuple[str, float]]]]] = {
+            "bm25": partial(
+                self.bm25_engine.search_many,
+                queries,
+                top_k=top_k,
+                timeout=timeout,
+                metadata_filter=metadata_filter,
+                allowed_ids=allowed_ids,
+            ),
+            "vector": partial(
+                self._vector_recall,
+                queries,
+                top_k,
+                timeout,
+                metadata_filter,
+                allowed_ids,
+                dense_queries,
+                dense_out,
+            ),
+        }
+        fallback = {"bm25": VECTOR_ONLY, "vector": BM25_ONLY}
+
+        durations: list[float] = []
+        futures = {
+            loop.run_in_executor(self._executor, self._timed, kind, fn, durations): kind
+            for kind, fn in calls.items()
+        }
+
+        start = time.perf_counter()
+        done, pending = await asyncio.wait(futures.keys(), timeout=timeout)
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        for fut in pending:
+            fut.cancel()
+            logger.warning(
+                "[L1 粗筛] %s 召回超时 (>%.0fms)，已丢弃 %d 条 query 的结果",
+                futures[fut],
+                timeout * 1000,
+                len(queries),
+            )
+            if deadline is not None:
+                deadline.degrade(fallback[futures[fut]], f"{futures[fut]} 召回超时")
+
+        per_query: dict[str, list[list[tuple[str, float]]]] = {
+            kind: [[] for _ in queries] for kind in calls
+        }
+        for fut in done:
+            kind = futures[fut]
+            try:
+                per_query[kind] = fut.result()
+            except Exception as e:
+                logger.warning("[L1 粗筛] %s 召回失败: %s", kind, e)
+                if deadline is not None:
+                    deadline.degrade(fallback[kind], str(e))
+
+        serial_ms = sum(durations)
+        logger.info(
+            "[L1 粗筛] %d 条 query 并发召回: wall=%.1fms, 串行累计=%.1fms, 节省=%.1fms",
+            len(queries),
+            wall_ms,
+            serial_ms,
+            max(serial_ms - wall_ms, 0.0),
+        )
+        return per_query["bm25"], per_query["vector"]
+
+    def _vector_recall(
+        self,
+        queries: list[str],
+        top_k: int,
+        timeout: float | None = None,
+        metadata_filter: RetrievalFilter | None = None,
+        allowed_ids: set[str] | None = None,
+        dense_queries: Sequence[str] = (),
+        dense_out: dict[str, list[float]] | None = None,
+    ) -> list[list[tuple[str, float]]]:
+        """384 维向量批量召回：embedding 与检索在同一工作线程内完成。
+
+        需要 768 维重打分时，原始 query 与改写 query 合并为一次双维度编码（384 维由截断得到）。
+        """
+        light, dense = self.embedder.dim_light, self.embedder.dim_dense
+        if dense_queries and dense_out is not None:
+            texts = list(dict.fromkeys([*queries, *dense_queries]))
+            vectors = self.embedder.embed_batch(texts, dims=(light, dense))
+            row = {text: i for i, text in enumerate(texts)}
+            for q in dense_queries:
+                dense_out[q] = vectors[dense][row[q]].tolist()
+            light_vectors = [vectors[light][row[q]].tolist() for q in queries]
+        else:
+            light_vectors = self.embedder.embed_batch(queries, dims=(light,))[light].tolist()
+        return self.vector_engine.search_384_many(
+            light_vectors,
+            top_k=top_k,
+            timeout=timeout,
+            metadata_filter=metadata_filter,
+            allowed_ids=allowed_ids,
+        )
+
+    @staticmethod
+    def _timed(kind: str, fn: Callable[[], list], durations: list[float]) -> list:
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            elapsed = time.perf_counter() - start
+            durations.append(elapsed * 1000)
+            observe_stage(kind, elapsed)
+
+    def close(self) -> None:
+        """关闭 L1 召回线程池。"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
     def _deduplicate(self, results: list[tuple[str, float]]) -> list[tuple[str, float]]:
         """去重，保留每个 chunk_id 的最高分。"""
@@ -110,9 +577,3 @@ class ThreeLevelRetriever(PipelineRetriever):
         for cid, score in results:
             best[cid] = max(best.get(cid, 0.0), score)
         return list(best.items())
-
-    def _count_tokens(self, text: str) -> int:
-        """粗略统计 token 数。"""
-        import jieba
-
-        return len(list(jieba.cut(text)))
@@ -0,0 +1,278 @@
+"""Cross-encoder 动态微批推理：把并发请求的 (query, doc) 对合批送入模型。
+
+单请求逐个推理时，每次 forward 只有几十个 pair，且按 max_length 补齐，
+大量算力浪费在 padding 上。MicroBatchingReranker 维护一个共享队列：
+- 各 /chat 请求把自己的 pair 入队并等待各自的 future
+- 后台协程取走队列中已有的全部 pair；请求密集（平均到达间隔小于 max_wait_ms）时
+  再从第一个 pair 入队起最多等待 max_wait_ms 攒满 max_batch_size，
+  请求稀疏时立即推理，低负载下不付等待延迟
+- 攒到的 pair 按估算长度排序后切批，同批长度接近，动态 padding 到批内最长
+- 推理在单线程 executor 中执行（一个模型实例），推理期间到达的 pair 留在队列中进入下一轮
+
+推理后端（torch / onnxruntime）按需导入；无模型时可用 SimulatedBackend 做基准测试。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 推理后端
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class TorchCrossEncoderBackend:
+    """transformers + torch 的 CPU 推理，sigmoid 把 logit 映射到 [0, 1]。"""
+
+    def __init__(self, model_dir: str, max_length: int = 512, device: str = "cpu"):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+        self.model.eval().to(device)
+        self.device = device
+        self.max_length = max_length
+
+    def score_pairs(self, pairs: list[tuple[str, str]]) -> list[float]:
+        enc = self.tokenizer(
+            [q for q, _ in pairs],
+            [d for _, d in pairs],
+            max_length=self.max_length,
+            truncation=True,
+            padding=True,  # 动态 padding 到本批最长
+            return_tensors="pt",
+        )
+        enc = {k: v.to(self.device) for k, v in enc.items()}
+        with self._torch.inference_mode():
+            logits = self.model(**enc).logits.squeeze(-1)
+        return self._torch.sigmoid(logits).cpu().tolist()
+
+
+class OnnxCrossEncoderBackend:
+    """onnxruntime CPU 推理，模型目录下需有 model.onnx 与 tokenizer 文件。"""
+
+    def __init__(self, model_dir: str, max_length: int = 512):
+        import os
+
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_length = max_length
+
+    def score_pairs(self, pairs: list[tuple[str, str]]) -> list[float]:
+        enc = self.tokenizer(
+            [q for q, _ in pairs],
+            [d for _, d in pairs],
+            max_length=self.max_length,
+            truncation=True,
+            padding=True,
+            return_tensors="np",
+        )
+        feeds = {k: v for k, v in enc.items() if k in self.input_names}
+        logits = self.session.run(None, feeds)[0].reshape(-1)
+        return [1.0 / (1.0 + math.exp(-x)) for x in logits.tolist()]
+
+
+class SimulatedBackend:
+    """无模型时的模拟后端：按 batch x padding 长度 sleep，模拟 CPU 前向耗时。
+
+    单次前向成本 = fixed_ms + per_token_us x batch_size x 本批最长长度，
+    与真实 cross-encoder 在 CPU 上的开销结构一致（固定开销 + 与 padding 后总 token 数成正比）。
+    pad_to 不为空时模拟旧的 padding="max_length" 行为；超过 max_length 的 pair 按截断计。
+    """
+
+    def __init__(
+        self,
+        fixed_ms: float = 8.0,
+        per_token_us: float = 0.5,
+        scorer=None,
+        pad_to: int | None = None,
+        max_length: int = 512,
+    ):
+        self.fixed_ms = fixed_ms
+        self.per_token_us = per_token_us
+        self.scorer = scorer
+        self.pad_to = pad_to
+        self.max_length = max_length
+        self.calls = 0
+
+    def score_pairs(self, pairs: list[tuple[str, str]]) -> list[float]:
+        longest = self.pad_to or min(
+            max(estimate_length(q, d) for q, d in pairs), self.max_length
+        )
+        time.sleep((self.fixed_ms + self.per_token_us * len(pairs) * longest / 1000) / 1000)
+        self.calls += 1
+        if self.scorer is None:
+            return [0.0] * len(pairs)
+        return [self.scorer(q, d) for q, d in pairs]
+
+
+def build_backend(backend: str, model_dir: str, max_length: int = 512):
+    if backend == "torch":
+        return TorchCrossEncoderBackend(model_dir, max_length)
+    if backend == "onnx":
+        return OnnxCrossEncoderBackend(model_dir, max_length)
+    raise ValueError(f"未知的 reranker 后端: {backend}")
+
+
+def estimate_length(query: str, doc: str) -> int:
+    """不调用 tokenizer 的长度估算（中文约 1 字 1 token），只用于切批前排序。"""
+    return len(query) + len(doc) + 3
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 微批调度
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+# 每轮最多从积压队列取出的批数：排序范围越大 padding 越少，但先到请求的完成时间被拉长
+_MAX_BATCHES_PER_ROUND = 4
+
+
+@dataclass
+class _Pending:
+    query: str
+    doc: str
+    length: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class MicroBatchingReranker:
+    """跨请求的 (query, doc) 微批调度器，后台协程在首次调用时于当前事件循环启动。"""
+
+    def __init__(
+        self,
+        backend,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+    ):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # 请求到达间隔的 EMA，决定是否值得等待合批；初始视为空闲
+        self._arrival_gap = math.inf
+        self._last_arrival: float | None = None
+        self._queue: asyncio.Queue[_Pending] | None = None
+        self._worker: asyncio.Task | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+        self.batches = 0
+        self.pairs = 0
+
+    async def score(self, query: str, docs: list[str]) -> list[float]:
+        """为一个请求的全部 doc 打分，结果与 docs 一一对应。"""
+        if not docs:
+            return []
+        self._ensure_worker()
+        self._observe_arrival()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for doc in docs:
+            future = loop.create_future()
+            self._queue.put_nowait(_Pending(query, doc, estimate_length(query, doc), future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    def score_sync(self, query: str, docs: list[str]) -> list[float]:
+        """同步调用方（离线评测、脚本）直接按长度分批推理，不经过队列。"""
+        pending = sorted(
+            range(len(docs)), key=lambda i: estimate_length(query, docs[i])
+        )
+        scores = [0.0] * len(docs)
+        for start in range(0, len(pending), self.max_batch_size):
+            idx = pending[start : start + self.max_batch_size]
+            for i, s in zip(idx, self.backend.score_pairs([(query, docs[i]) for i in idx])):
+                scores[i] = s
+        return scores
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _observe_arrival(self) -> None:
+        now = time.monotonic()
+        if self._last_arrival is not None:
+            gap = now - self._last_arrival
+            self._arrival_gap = (
+                gap if math.isinf(self._arrival_gap) else 0.8 * self._arrival_gap + 0.2 * gap
+            )
+        self._last_arrival = now
+
+    def _window(self) -> float:
+        """本轮合批的等待时间：预计 max_wait 内会有新请求到达才等待，否则立即推理。"""
+        return self.max_wait if self._arrival_gap < self.max_wait else 0.0
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            limit = self.max_batch_size * _MAX_BATCHES_PER_ROUND
+            while not self._queue.empty() and len(items) < limit:
+                items.append(self._queue.get_nowait())
+
+            # 攒批：直到最早的 pair 等满窗口，或攒满一批
+            deadline = items[0].enqueued_at + self._window()
+            while len(items) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # 按长度排序后切成不超过 max_batch_size 的批：同批 pair 长度相邻，
+            # 每批只 padding 到批内最长
+            items.sort(key=lambda p: p.length)
+            for start in range(0, len(items), self.max_batch_size):
+                await self._infer(loop, items[start : start + self.max_batch_size])
+
+    async def _infer(self, loop: asyncio.AbstractEventLoop, batch: list[_Pending]) -> None:
+        batch = [p for p in batch if not p.future.done()]  # 已取消的请求不再推理
+        if not batch:
+            return
+        try:
+            scores = await loop.run_in_executor(
+                self._executor,
+                self.backend.score_pairs,
+                [(p.query, p.doc) for p in batch],
+            )
+        except Exception as e:
+            logger.error("[Rerank] 批量推理失败 (batch=%d): %s", len(batch), e)
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(e)
+            return
+        for p, score in zip(batch, scores):
+            if not p.future.done():
+                p.future.set_result(float(score))
+        self.batches += 1
+        self.pairs += len(batch)
+        logger.debug(
+            "[Rerank] batch=%d, 最长=%d, 最早等待 %.1fms",
+            len(batch),
+            max(p.length for p in batch),
+            (time.monotonic() - min(p.enqueued_at for p in batch)) * 1000,
+        )
+
+    def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+        self._executor.shutdown(wait=False)
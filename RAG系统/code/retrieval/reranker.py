@@ -9,7 +9,10 @@ from __future__ import annotations
 import logging
 import math
 
-from models.schemas import DocumentChunk
+import numpy as np
+
+from core.tokenizer import get_tokenizer
+from storage.chunk_store import ChunkStore
 
 logger = logging.getLogger(__name__)
 
@@ -20,9 +23,13 @@ class CrossEncoderReranker:
     生产环境替换为 GPU 批量推理 gte-multilingual-reranker-0.3B。
     Demo 中使用 Jaccard + TF-IDF 风格的模拟打分，
     能产生合理的排序梯度以演示断崖截断逻辑。
+
+    query 词集合取自共享分词服务（与 RSF / BM25 同一份结果）；
+    chunk 侧使用摄入时预计算的去重词表与首次出现位置，
+    全部候选以数组运算批量打分。没有预计算词表的 chunk 回退到逐条分词。
     """
 
-    def __init__(self, chunk_store: dict[str, DocumentChunk]):
+    def __init__(self, chunk_store: ChunkStore):
         self._chunk_store = chunk_store
 
     def rerank(
@@ -33,18 +40,56 @@ class CrossEncoderReranker:
         输入: [(chunk_id, fusion_score), ...]
         输出: [(chunk_id, rerank_score), ...]
         """
+        chunk_ids = [chunk_id for chunk_id, _prev_score in candidates]
+        q_tokens = get_tokenizer().query(query).terms
+        matches = self._chunk_store.match_terms(chunk_ids, q_tokens)
+        scores = self._score_batch(len(q_tokens), matches)
+
         results = []
-        for chunk_id, _prev_score in candidates:
-            chunk = self._chunk_store.get(chunk_id)
-            if chunk is None:
+        for i, chunk_id in enumerate(chunk_ids):
+            if not matches.found[i]:
                 continue
-            score = self._compute_relevance(query, chunk.text)
+            if matches.has_table[i]:
+                score = float(scores[i])
+            else:
+                score = self._compute_relevance(query, self._chunk_store.text(chunk_id))
             results.append((chunk_id, score))
 
         results.sort(key=lambda x: x[1], reverse=True)
         logger.debug("[Reranker] 精排 %d 个候选", len(results))
         return results
 
+    async def arerank(
+        self, query: str, candidates: list[tuple[str, float]]
+    ) -> list[tuple[str, float]]:
+        """异步接口，与 ModelReranker 一致；模拟打分为纯 CPU 数组运算，直接同步执行。"""
+        return self.rerank(query, candidates)
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def _score_batch(n_query_terms: int, matches) -> np.ndarray:
+        """与 _compute_relevance 相同的打分公式，对全部候选一次性计算。"""
+        n = len(matches.found)
+        inter = np.bincount(matches.owner, minlength=n).astype(np.float64)
+        length = np.maximum(matches.text_len[matches.owner], 1)
+        decay = np.where(
+            matches.first_pos >= 0, np.exp(-matches.first_pos / length * 3), 0.0
+        )
+        position = np.bincount(matches.owner, weights=decay, minlength=n)
+
+        union = n_query_terms + matches.n_terms - inter
+        jaccard = inter / np.maximum(union, 1)
+        coverage = inter / max(n_query_terms, 1)
+        position = position / np.maximum(inter, 1)
+
+        scores = np.minimum(0.4 * jaccard + 0.35 * coverage + 0.25 * position, 1.0)
+        if n_query_terms == 0:
+            scores[:] = 0.0
+        scores[matches.n_terms == 0] = 0.0
+        return scores
+
     def _compute_relevance(self, query: str, text: str) -> float:
         """模拟 cross-encoder 打分。
 
@@ -53,8 +98,8 @@ class CrossEncoderReranker:
         2. 查询词在文档中的覆盖率
         3. 位置加权（前面出现的匹配更重要）
         """
-        q_tokens = set(self._tokenize(query))
-        t_tokens = set(self._tokenize(text))
+        q_tokens = get_tokenizer().query(query).terms
+        t_tokens = {w for w in get_tokenizer().cut(text) if w.strip()}
 
         if not q_tokens or not t_tokens:
             return 0.0
@@ -80,8 +125,41 @@ class CrossEncoderReranker:
         score = 0.4 * jaccard + 0.35 * coverage + 0.25 * position_score
         return min(score, 1.0)
 
-    def _tokenize(self, text: str) -> list[str]:
-        """简易分词：中文按字，英文按空格。"""
-        import jieba
 
-        return [w for w in jieba.cut(text) if w.strip()]
+class ModelReranker:
+    """真实 cross-encoder 精排：(query, chunk 文本) 对交给 MicroBatchingReranker，
+    与其它并发请求的候选合批推理。
+    """
+
+    def __init__(self, chunk_store: ChunkStore, scheduler):
+        self._chunk_store = chunk_store
+        self.scheduler = scheduler
+
+    def _texts(self, candidates: list[tuple[str, float]]) -> tuple[list[str], list[str]]:
+        chunk_ids, texts = [], []
+        for chunk_id, _prev_score in candidates:
+            text = self._chunk_store.text(chunk_id)
+            if text is None:
+                continue
+            chunk_ids.append(chunk_id)
+            texts.append(text)
+        return chunk_ids, texts
+
+    async def arerank(
+        self, query: str, candidates: list[tuple[str, float]]
+    ) -> list[tuple[str, float]]:
+        chunk_ids, texts = self._texts(candidates)
+        scores = await self.scheduler.score(query, texts)
+        results = sorted(zip(chunk_ids, scores), key=lambda x: x[1], reverse=True)
+        logger.debug("[Reranker] 模型精排 %d 个候选", len(results))
+        return results
+
+    def rerank(
+        self, query: str, candidates: list[tuple[str, float]]
+    ) -> list[tuple[str, float]]:
+        chunk_ids, texts = self._texts(candidates)
+        scores = self.scheduler.score_sync(query, texts)
+        return sorted(zip(chunk_ids, scores), key=lambda x: x[1], reverse=True)
+
+    def close(self) -> None:
+        self.scheduler.close()
@@ -9,8 +9,13 @@
 
 from __future__ import annotations
 
+import heapq
+import json
 import logging
+import time
+from typing import Iterable
 
+import numpy as np
 from pymilvus import (
     Collection,
     CollectionSchema,
@@ -21,7 +26,7 @@ from pymilvus import (
 )
 
 from config.settings import Settings
-from models.schemas import DocumentChunk
+from models.schemas import DocumentChunk, RetrievalFilter
 
 logger = logging.getLogger(__name__)
 
@@ -104,6 +109,53 @@ class MilvusVectorEngine:
                 ]
             )
 
+    def insert_chunks(
+        self,
+        chunks: Iterable[DocumentChunk],
+        batch_size: int | None = None,
+        flush: bool = True,
+    ) -> int:
+        """按列批量插入：每批构建 chunk_id / doc_id / embedding 三列，一次 RPC 写入。
+
+        embedding 列为连续的 float32 矩阵；每个 Collection 按 batch_size 分批，
+        整组写完后统一 flush 一次。返回写入的向量行数（两个 Collection 之和）。
+        """
+        if self._collection_384 is None:
+            self.connect()
+
+        chunks = list(chunks)
+        batch_size = batch_size or self.settings.milvus_insert_batch_size
+        inserted = 0
+        for collection, attr in (
+            (self._collection_384, "vector_384"),
+            (self._collection_768, "vector_768"),
+        ):
+            rows = [c for c in chunks if getattr(c, attr)]
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start : start + batch_size]
+                embeddings = np.asarray(
+                    [getattr(c, attr) for c in batch], dtype=np.float32
+                )
+                collection.insert(
+                    [
+                        [c.chunk_id for c in batch],
+                        [c.metadata.doc_id for c in batch],
+                        embeddings,
+                    ]
+                )
+                inserted += len(batch)
+
+        if flush:
+            self.flush()
+
+        logger.info(
+            "[Milvus] 批量插入 %d 个 chunk, %d 行向量 (batch=%d)",
+            len(chunks),
+            inserted,
+            batch_size,
+        )
+        return inserted
+
     def flush(self) -> None:
         if self._collection_384:
             self._collection_384.flush()
@@ -114,37 +166,135 @@ class MilvusVectorEngine:
         self, query_vector: list[float], top_k: int = 1500
     ) -> list[tuple[str, float]]:
         """384 维向量检索（第一层粗筛）。"""
-        return self._search(self._collection_384, query_vector, top_k)
+        return self.search_384_many([query_vector], top_k)[0]
 
     def search_768(
         self, query_vector: list[float], top_k: int = 80
     ) -> list[tuple[str, float]]:
         """768 维向量检索（第二层精筛）。"""
-        return self._search(self._collection_768, query_vector, top_k)
+        return self.search_768_many([query_vector], top_k)[0]
+
+    def search_384_many(
+        self,
+        query_vectors: list[list[float]],
+        top_k: int = 1500,
+        timeout: float | None = None,
+        metadata_filter: RetrievalFilter | None = None,
+        allowed_ids: set[str] | None = None,
+    ) -> list[list[tuple[str, float]]]:
+        """384 维批量检索：N 个 query 向量一次 RPC，结果与输入一一对应。
+
+        过滤条件翻译为 Milvus 布尔表达式，在 ANN 搜索内部生效（见 _filter_exprs）；
+        表达式被拆成多段时逐段检索（共享 timeout），按分数合并各段结果后取 top_k。
+        """
+        exprs = self._filter_exprs(metadata_filter, allowed_ids)
+        if len(exprs) == 1:
+            return self._search_many(
+                "_collection_384", query_vectors, top_k, expr=exprs[0], timeout=timeout
+            )
+        stop_at = None if timeout is None else time.monotonic() + timeout
+        merged: list[list[tuple[str, float]]] = [[] for _ in query_vectors]
+        for expr in exprs:
+            remaining = None if stop_at is None else max(stop_at - time.monotonic(), 0.001)
+            parts = self._search_many(
+                "_collection_384", query_vectors, top_k, expr=expr, timeout=remaining
+            )
+            for hits, part in zip(merged, parts):
+                hits.extend(part)
+        return [heapq.nlargest(top_k, hits, key=lambda h: h[1]) for hits in merged]
+
+    def supports_filter(self, metadata_filter: RetrievalFilter) -> bool:
+        """Collection 只有 doc_id 一个元数据字段，其余条件需要调用方解析出 allowed_ids。"""
+        return metadata_filter.only_doc_ids()
 
-    def _search(
-        self, collection: Collection | None, query_vector: list[float], top_k: int
+    def search_768_many(
+        self, query_vectors: list[list[float]], top_k: int = 80
+    ) -> list[list[tuple[str, float]]]:
+        """768 维批量检索：N 个 query 向量一次 RPC，结果与输入一一对应。"""
+        return self._search_many("_collection_768", query_vectors, top_k)
+
+    def rescore_768(
+        self,
+        query_vector: list[float],
+        candidate_ids: list[str],
+        timeout: float | None = None,
     ) -> list[tuple[str, float]]:
-        if collection is None:
+        """只对给定候选做 768 维打分（第二层精筛）。
+
+        通过 chunk_id in [...] 过滤表达式把检索限定在 L1 候选内，
+        不在 768 Collection 中的候选不会出现在结果里。
+        """
+        if not candidate_ids:
+            return []
+        expr = f"chunk_id in {json.dumps(list(candidate_ids), ensure_ascii=False)}"
+        return self._search_many(
+            "_collection_768", [query_vector], len(candidate_ids), expr=expr, timeout=timeout
+        )[0]
+
+    def _filter_exprs(
+        self, metadata_filter: RetrievalFilter | None, allowed_ids: set[str] | None
+    ) -> list[str | None]:
+        """返回 Milvus 过滤表达式列表，每个表达式对应一次检索。
+
+        Collection 只有 doc_id 一个元数据字段：doc_id 条件直接下推；
+        node_type / heading 条件借助 ChunkStore 解析出的 allowed_ids 下推为 chunk_id in [...]，
+        超过 milvus_filter_max_ids 时按上限拆成多段，避免只下推 doc_id 后在 top_k 上后过滤召回不足。
+        """
+        if metadata_filter is None or metadata_filter.is_empty():
+            return [None]
+        if metadata_filter.only_doc_ids() or allowed_ids is None:
+            if not metadata_filter.doc_ids:
+                return [None]
+            return [f"doc_id in {json.dumps(metadata_filter.doc_ids, ensure_ascii=False)}"]
+        ids = sorted(allowed_ids)
+        if not ids:
+            return ["chunk_id in []"]
+        step = self.settings.milvus_filter_max_ids
+        if len(ids) > step:
+            logger.debug("[Milvus] 过滤后有 %d 个 chunk，拆成 %d 段检索", len(ids), -(-len(ids) // step))
+        return [
+            f"chunk_id in {json.dumps(ids[i:i + step], ensure_ascii=False)}"
+            for i in range(0, len(ids), step)
+        ]
+
+    def _search_many(
+        self,
+        collection_attr: str,
+        query_vectors: list[list[float]],
+        top_k: int,
+        expr: str | None = None,
+        timeout: float | None = None,
+    ) -> list[list[tuple[str, float]]]:
+        """timeout（秒）下发给 Milvus 客户端，超时后 RPC 被中止而不是在后台继续执行。"""
+        if not query_vectors:
+            return []
+        if getattr(self, collection_attr) is None:
             self.connect()
-            collection = self._collection_384  # fallback
+        collection: Collection = getattr(self, collection_attr)
 
-        search_params = {"metric_type": "COSINE", "params": {"ef": 128}}
+        search_params = {"metric_type": "COSINE", "params": {"ef": max(128, top_k)}}
 
         results = collection.search(
-            data=[query_vector],
+            data=query_vectors,
             anns_field="embedding",
             param=search_params,
             limit=top_k,
+            expr=expr,
             output_fields=["chunk_id"],
+            timeout=timeout,
         )
 
-        output = []
-        for hits in results:
-            for hit in hits:
-                output.append((hit.entity.get("chunk_id"), hit.score))
+        output = [
+            [(hit.entity.get("chunk_id"), hit.score) for hit in hits]
+            for hits in results
+        ]
 
-        logger.debug("[Milvus] 向量搜索: %d 结果 (top_k=%d)", len(output), top_k)
+        logger.debug(
+            "[Milvus] 批量向量搜索: %d 个 query, %d 结果 (top_k=%d)",
+            len(query_vectors),
+            sum(len(hits) for hits in output),
+            top_k,
+        )
         return output
 
     def drop_collections(self) -> None:
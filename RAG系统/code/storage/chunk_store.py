@@ -0,0 +1,910 @@
+"""紧凑列式 chunk 存储，替代 dict[str, DocumentChunk]。
+
+每个 chunk 不再是一个带两条 float 列表的 pydantic 对象，而是按列存放：
+- 文本：UTF-8 写入一块连续缓冲区，offsets 记录每行起止
+- 元数据：doc_id / doc_name / heading_path / node_type 字典编码为整数列，
+  parent_summary 稀疏存放
+- 分词：token 字典编码后连续存放 + offsets
+- 词表：每个 chunk 去重后的非空白 token id 及其在小写文本中的首次出现位置，
+  摄入时计算一次，供 Reranker 批量打分（见 match_terms）
+- 向量不入库：384 / 768 维向量由向量引擎（Milvus / LocalVectorEngine）保存，
+  读取到的视图中 vector_384 / vector_768 为 None
+
+存储由若干只读磁盘 segment + 一个内存 segment（memtable）组成：
+- 写入先进入 memtable，flush() 时封存为新的磁盘 segment（seg_XXXXXX/ 目录，
+  列以 .npy / .bin 文件存放），启动时直接 memory-map，不逐条解析
+- 每个磁盘 segment 带按 chunk_id 64 位哈希排序的索引，查找用 searchsorted
+- 同 chunk_id 重复写入视为覆盖：新版本所在 segment 更新，旧行被标记失效
+- segment 数超过上限时合并为一个
+- MANIFEST.json + generation 发布 segment，多个 worker 进程只读映射同一目录，
+  flock 写锁保证单写者
+
+读取时只在需要时（最终 top-k）按行构造 DocumentChunk 视图；
+Reranker 等热路径直接用 text() 取文本，不构造对象，解码后的文本有界缓存。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+from models.schemas import ChunkMetadata, DocumentChunk, RetrievalFilter
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_PREFIX = "seg_"
+_MANIFEST = "MANIFEST.json"
+_LOCK = "LOCK"
+
+
+def _id_hash(chunk_id: str) -> int:
+    digest = hashlib.blake2b(chunk_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+@dataclass
+class TermMatches:
+    """一批 chunk 与 query 词集合的匹配结果，数组按输入 chunk 顺序对齐。"""
+
+    found: np.ndarray  # bool[n]，chunk 是否存在
+    has_table: np.ndarray  # bool[n]，是否有预计算词表（无分词的 chunk 为 False）
+    n_terms: np.ndarray  # int64[n]，chunk 去重后的词数
+    text_len: np.ndarray  # int64[n]，文本字符数
+    owner: np.ndarray  # int64[m]，每个命中词所属的 chunk 下标
+    first_pos: np.ndarray  # int64[m]，命中词在小写文本中的首次出现位置，-1 表示未出现
+
+
+def term_table(text: str, tokens: Iterable[str]) -> list[tuple[str, int]]:
+    """chunk 去重后的非空白 token 及其在小写文本中的首次出现位置。"""
+    text_lower = text.lower()
+    return [
+        (token, text_lower.find(token.lower()))
+        for token in dict.fromkeys(t for t in tokens if t.strip())
+    ]
+
+
+class _Dictionary:
+    """字符串字典编码：值 <-> 整数 code。"""
+
+    def __init__(self, values: list[str] | None = None):
+        self.values: list[str] = list(values or [])
+        self._codes: dict[str, int] = {v: i for i, v in enumerate(self.values)}
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: str) -> int | None:
+        return self._codes.get(value)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Segment：行级列访问，MemSegment / DiskSegment 共用视图构造
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class _Segment(ABC):
+    """单个 segment 的行级读取接口。"""
+
+    # 由子类提供的字典表
+    doc_ids: _Dictionary
+    doc_names: _Dictionary
+    headings: _Dictionary
+    node_types: _Dictionary
+    vocab: _Dictionary
+    parent_summary: dict[int, str]
+
+    @abstractmethod
+    def chunk_id_at(self, row: int) -> str: ...
+
+    @abstractmethod
+    def text_at(self, row: int) -> str: ...
+
+    @abstractmethod
+    def tokens_at(self, row: int) -> list[str] | None: ...
+
+    @abstractmethod
+    def codes_at(self, row: int) -> tuple[int, int, int, int, bool]:
+        """(doc, doc_name, heading, node_type, is_continuation) 编码。"""
+
+    @abstractmethod
+    def terms_at(self, row: int) -> tuple[np.ndarray, np.ndarray, int] | None:
+        """(去重词 id, 首次出现位置, 文本字符数)；无预计算词表时返回 None。"""
+
+    def doc_id_at(self, row: int) -> str:
+        return self.doc_ids.values[self.codes_at(row)[0]]
+
+    def view(self, row: int) -> DocumentChunk:
+        chunk_id = self.chunk_id_at(row)
+        doc, doc_name, heading, node_type, is_continuation = self.codes_at(row)
+        return DocumentChunk(
+            chunk_id=chunk_id,
+            text=self.text_at(row),
+            metadata=ChunkMetadata(
+                chunk_id=chunk_id,
+                doc_id=self.doc_ids.values[doc],
+                doc_name=self.doc_names.values[doc_name],
+                heading_path=self.headings.values[heading],
+                node_type=self.node_types.values[node_type],
+                is_continuation=is_continuation,
+                parent_summary=self.parent_summary.get(row),
+            ),
+            bm25_tokens=self.tokens_at(row),
+        )
+
+
+class _MemSegment(_Segment):
+    """可追加写的内存 segment（memtable）。"""
+
+    def __init__(self):
+        self.row_of: dict[str, int] = {}
+        self.chunk_ids: list[str] = []
+
+        self.text = bytearray()
+        self.text_offsets = array("Q", [0])
+
+        self.doc_ids = _Dictionary()
+        self.doc_names = _Dictionary()
+        self.headings = _Dictionary()
+        self.node_types = _Dictionary()
+        self.doc_code = array("I")
+        self.doc_name_code = array("I")
+        self.heading_code = array("I")
+        self.node_type_code = array("B")
+        self.is_continuation = bytearray()
+        self.parent_summary: dict[int, str] = {}
+
+        self.vocab = _Dictionary()
+        self.token_ids = array("I")
+        self.token_offsets = array("Q", [0])
+        self.has_tokens = bytearray()
+
+        self.term_ids = array("I")
+        self.term_pos = array("i")
+        self.term_offsets = array("Q", [0])
+        self.text_len = array("I")
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def append(self, chunk: DocumentChunk) -> None:
+        row = len(self.chunk_ids)
+        meta = chunk.metadata
+
+        self.text.extend(chunk.text.encode("utf-8"))
+        self.text_offsets.append(len(self.text))
+
+        self.doc_code.append(self.doc_ids.encode(meta.doc_id))
+        self.doc_name_code.append(self.doc_names.encode(meta.doc_name))
+        self.heading_code.append(self.headings.encode(meta.heading_path))
+        self.node_type_code.append(self.node_types.encode(meta.node_type))
+        self.is_continuation.append(1 if meta.is_continuation else 0)
+        if meta.parent_summary is not None:
+            self.parent_summary[row] = meta.parent_summary
+
+        if chunk.bm25_tokens is not None:
+            self.token_ids.extend(self.vocab.encode(t) for t in chunk.bm25_tokens)
+            for token, pos in term_table(chunk.text, chunk.bm25_tokens):
+                self.term_ids.append(self.vocab.encode(token))
+                self.term_pos.append(pos)
+        self.token_offsets.append(len(self.token_ids))
+        self.term_offsets.append(len(self.term_ids))
+        self.text_len.append(len(chunk.text))
+        self.has_tokens.append(chunk.bm25_tokens is not None)
+
+        # 所有列写完后再发布行号，读者不会看到半写入的行
+        self.chunk_ids.append(chunk.chunk_id)
+        self.row_of[chunk.chunk_id] = row
+
+    def hashes(self) -> np.ndarray:
+        """存活 chunk_id 的 64 位哈希。"""
+        return np.fromiter((_id_hash(c) for c in list(self.row_of)), dtype=np.uint64)
+
+    def chunk_id_at(self, row: int) -> str:
+        return self.chunk_ids[row]
+
+    def text_at(self, row: int) -> str:
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        return self.text[start:end].decode("utf-8")
+
+    def tokens_at(self, row: int) -> list[str] | None:
+        if not self.has_tokens[row]:
+            return None
+        start, end = self.token_offsets[row], self.token_offsets[row + 1]
+        return [self.vocab.values[t] for t in self.token_ids[start:end]]
+
+    def terms_at(self, row: int) -> tuple[np.ndarray, np.ndarray, int] | None:
+        if not self.has_tokens[row]:
+            return None
+        start, end = self.term_offsets[row], self.term_offsets[row + 1]
+        # 切片复制而非 frombuffer：导出 buffer 期间 array 无法扩容
+        return (
+            np.array(self.term_ids[start:end], dtype=np.uint32),
+            np.array(self.term_pos[start:end], dtype=np.int32),
+            self.text_len[row],
+        )
+
+    def codes_at(self, row: int) -> tuple[int, int, int, int, bool]:
+        return (
+            self.doc_code[row],
+            self.doc_name_code[row],
+            self.heading_code[row],
+            self.node_type_code[row],
+            bool(self.is_continuation[row]),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        columns = (
+            self.text_offsets,
+            self.doc_code,
+            self.doc_name_code,
+            self.heading_code,
+            self.node_type_code,
+            self.token_ids,
+            self.token_offsets,
+            self.term_ids,
+            self.term_pos,
+            self.term_offsets,
+            self.text_len,
+        )
+        return (
+            len(self.text)
+            + sum(col.itemsize * len(col) for col in columns)
+            + len(self.is_continuation)
+            + len(self.has_tokens)
+        )
+
+    def write(self, path: str) -> None:
+        """把存活行写成磁盘 segment 目录（先写临时目录再 rename，保证原子可见）。"""
+        live_rows = sorted(self.row_of.values())
+        if len(live_rows) != len(self.chunk_ids):
+            # memtable 内部有覆盖：先压实成只含存活行的新 segment
+            compacted = _MemSegment()
+            for row in live_rows:
+                compacted.append(self.view(row))
+            compacted.write(path)
+            return
+
+        tmp = path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        def save(name: str, values, dtype) -> None:
+            np.save(os.path.join(tmp, name + ".npy"), np.asarray(values, dtype=dtype))
+
+        encoded_ids = [c.encode("utf-8") for c in self.chunk_ids]
+        id_offsets = np.zeros(len(encoded_ids) + 1, dtype=np.uint64)
+        np.cumsum([len(c) for c in encoded_ids], out=id_offsets[1:])
+        hashes = np.fromiter(
+            (_id_hash(c) for c in self.chunk_ids), dtype=np.uint64, count=len(encoded_ids)
+        )
+        order = np.argsort(hashes, kind="stable")
+
+        with open(os.path.join(tmp, "text.bin"), "wb") as f:
+            f.write(self.text)
+        with open(os.path.join(tmp, "ids.bin"), "wb") as f:
+            f.write(b"".join(encoded_ids))
+        save("text_offsets", self.text_offsets, np.uint64)
+        save("id_offsets", id_offsets, np.uint64)
+        save("id_hash", hashes[order], np.uint64)
+        save("id_order", order, np.int64)
+        save("doc_code", self.doc_code, np.uint32)
+        save("doc_name_code", self.doc_name_code, np.uint32)
+        save("heading_code", self.heading_code, np.uint32)
+        save("node_type_code", self.node_type_code, np.uint8)
+        save("is_continuation", self.is_continuation, np.uint8)
+        save("token_ids", self.token_ids, np.uint32)
+        save("token_offsets", self.token_offsets, np.uint64)
+        save("has_tokens", self.has_tokens, np.uint8)
+        save("term_ids", self.term_ids, np.uint32)
+        save("term_pos", self.term_pos, np.int32)
+        save("term_offsets", self.term_offsets, np.uint64)
+        save("text_len", self.text_len, np.uint32)
+        with open(os.path.join(tmp, "dicts.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "doc_ids": self.doc_ids.values,
+                    "doc_names": self.doc_names.values,
+                    "headings": self.headings.values,
+                    "node_types": self.node_types.values,
+                    "vocab": self.vocab.values,
+                    "parent_summary": {str(k): v for k, v in self.parent_summary.items()},
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp, path)
+
+
+class _DiskSegment(_Segment):
+    """只读磁盘 segment：列文件全部 memory-map，live 掩码常驻内存。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+        self.text = self._map_bytes(os.path.join(path, "text.bin"))
+        self.ids = self._map_bytes(os.path.join(path, "ids.bin"))
+        self.text_offsets = load("text_offsets")
+        self.id_offsets = load("id_offsets")
+        self.id_hash = load("id_hash")
+        self.id_order = load("id_order")
+        self.doc_code = load("doc_code")
+        self.doc_name_code = load("doc_name_code")
+        self.heading_code = load("heading_code")
+        self.node_type_code = load("node_type_code")
+        self.is_continuation = load("is_continuation")
+        self.token_ids = load("token_ids")
+        self.token_offsets = load("token_offsets")
+        self.has_tokens = load("has_tokens")
+        # 词表列在较早的 segment 中可能不存在，此时 Reranker 回退到逐条分词
+        self.has_terms = os.path.exists(os.path.join(path, "term_ids.npy"))
+        if self.has_terms:
+            self.term_ids = load("term_ids")
+            self.term_pos = load("term_pos")
+            self.term_offsets = load("term_offsets")
+            self.text_len = load("text_len")
+        # 较早的 segment 中残留的 vector_*.npy 不再加载
+
+        with open(os.path.join(path, "dicts.json"), encoding="utf-8") as f:
+            dicts = json.load(f)
+        self.doc_ids = _Dictionary(dicts["doc_ids"])
+        self.doc_names = _Dictionary(dicts["doc_names"])
+        self.headings = _Dictionary(dicts["headings"])
+        self.node_types = _Dictionary(dicts["node_types"])
+        self.vocab = _Dictionary(dicts["vocab"])
+        self.parent_summary = {int(k): v for k, v in dicts["parent_summary"].items()}
+
+        self.n_rows = len(self.doc_code)
+        self.live = np.ones(self.n_rows, dtype=bool)
+
+    @staticmethod
+    def _map_bytes(path: str) -> np.ndarray:
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(path, dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return int(self.live.sum())
+
+    def find(self, chunk_id: str) -> int | None:
+        """按 chunk_id 哈希二分查找存活行。"""
+        h = np.uint64(_id_hash(chunk_id))
+        pos = int(np.searchsorted(self.id_hash, h))
+        while pos < self.n_rows and self.id_hash[pos] == h:
+            row = int(self.id_order[pos])
+            if self.live[row] and self.chunk_id_at(row) == chunk_id:
+                return row
+            pos += 1
+        return None
+
+    def kill_hashes(self, hashes: np.ndarray) -> None:
+        """把哈希出现在更新 segment 中的行标记为失效（加载时按新旧顺序调用）。"""
+        dead = np.isin(self.id_hash, hashes)
+        self.live[self.id_order[dead]] = False
+
+    def live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.live)
+
+    def chunk_id_at(self, row: int) -> str:
+        start, end = self.id_offsets[row], self.id_offsets[row + 1]
+        return self.ids[start:end].tobytes().decode("utf-8")
+
+    def text_at(self, row: int) -> str:
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        return self.text[start:end].tobytes().decode("utf-8")
+
+    def tokens_at(self, row: int) -> list[str] | None:
+        if not self.has_tokens[row]:
+            return None
+        start, end = self.token_offsets[row], self.token_offsets[row + 1]
+        return [self.vocab.values[t] for t in self.token_ids[start:end].tolist()]
+
+    def terms_at(self, row: int) -> tuple[np.ndarray, np.ndarray, int] | None:
+        if not self.has_terms or not self.has_tokens[row]:
+            return None
+        start, end = self.term_offsets[row], self.term_offsets[row + 1]
+        return self.term_ids[start:end], self.term_pos[start:end], int(self.text_len[row])
+
+    def codes_at(self, row: int) -> tuple[int, int, int, int, bool]:
+        return (
+            int(self.doc_code[row]),
+            int(self.doc_name_code[row]),
+            int(self.heading_code[row]),
+            int(self.node_type_code[row]),
+            bool(self.is_continuation[row]),
+        )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ChunkStore
+# ─────────────────────────────────────────────────────────────────────────────
+
+
+class ChunkStore:
+    """chunk_id -> chunk 的列式存储，对外提供 dict 风格接口。
+
+    directory 为空时只在内存中保存；否则 flush() 把 memtable 封存为磁盘 segment，
+    load() 在启动时 memory-map 全部 segment。
+
+    多 worker 进程共享同一目录：
+    - MANIFEST.json 记录 generation 与当前 segment 列表，是唯一的发布点
+    - flush / compact 持有 LOCK 文件上的 flock 独占锁，同一时刻只有一个写者发布
+    - 读者每隔 refresh_interval_ms 检查 MANIFEST，memory-map 新 segment（只读、零拷贝，
+      各进程共享 page cache），不复制已有数据
+    """
+
+    def __init__(
+        self,
+        directory: str = "",
+        max_segments: int = 32,
+        refresh_interval_ms: int = 1000,
+        text_cache_size: int = 4096,
+    ):
+        self.directory = directory
+        self.max_segments = max_segments
+        self.refresh_interval = refresh_interval_ms / 1000
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._segments: list[_DiskSegment] = []  # 旧 -> 新
+        self._mem = _MemSegment()
+        self._manifest_stamp: tuple[int, int] | None = None
+        self._checked_at = 0.0
+        # chunk_id -> 解码后的文本；UTF-8 解码是 text() 的主要开销，热点候选反复命中。
+        # 按插入顺序淘汰（FIFO），命中路径只有一次 dict.get，不加锁
+        self.text_cache_size = text_cache_size
+        self._text_cache: dict[str, str] = {}
+        self._text_lock = threading.Lock()
+        self._text_epoch = 0  # 每次写入 / 同步 +1，读取期间有变化时不回填缓存
+        # refresh 映射到其他进程发布的 segment 时回调（参数见 add_listener）
+        self._listeners: list[Callable[[list[str] | None], None]] = []
+
+    # ---- 生命周期 ----
+
+    def load(self) -> None:
+        """memory-map MANIFEST 中的全部 segment，按新旧顺序计算存活行。"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.refresh()
+        logger.info(
+            "[ChunkStore] 已加载 generation=%d, %d 个 segment, %d chunks",
+            self.generation,
+            len(self._segments),
+            len(self),
+        )
+
+    def refresh(self) -> bool:
+        """按 MANIFEST 同步 segment 列表，返回是否有变化。
+
+        新 segment 追加在末尾时只映射新增部分；被其他进程合并过则整体重新映射。
+        """
+        if not self.directory:
+            return False
+        with self._lock:
+            for attempt in range(3):
+                stamp = self._stat_manifest()
+                generation, names = self._read_manifest()
+                try:
+                    changed, chunk_ids = self._apply_manifest(names)
+                    break
+                except FileNotFoundError:
+                    # 读 MANIFEST 与打开 segment 之间被其他进程合并删除，重读一次
+                    if attempt == 2:
+                        raise
+            self.generation = generation
+            self._manifest_stamp = stamp
+            self._checked_at = time.monotonic()
+        if changed:
+            # 其他进程写入的 segment 可能覆盖了已缓存的 chunk
+            self._clear_text_cache()
+            for listener in list(self._listeners):
+                listener(chunk_ids)
+            logger.info(
+                "[ChunkStore] 同步到 generation=%d (%d 个 segment)",
+                generation,
+                len(names),
+            )
+        return changed
+
+    def _apply_manifest(self, names: list[str]) -> tuple[bool, list[str] | None]:
+        """映射 MANIFEST 中的 segment，返回 (是否变化, 新 segment 中的 chunk_id)。
+
+        首次加载或被其他进程合并后整体重新映射时无法得知哪些 chunk 变化，返回 None。
+        """
+        current = [s.name for s in self._segments]
+        if names == current:
+            return False, []
+        if current and names[: len(current)] == current:
+            segments = list(self._segments)
+            new_names = names[len(current) :]
+        else:
+            segments = []
+            new_names = names
+        for name in new_names:
+            segment = _DiskSegment(os.path.join(self.directory, name))
+            for older in segments:
+                older.kill_hashes(segment.id_hash)
+            segments.append(segment)
+        # 本进程 memtable 中尚未封存的写入比任何已发布 segment 都新：
+        # 在新映射的 segment 上重新标记其旧版本失效，否则计数与遍历会重复
+        pending = self._mem.hashes()
+        if len(pending):
+            for segment in segments[len(segments) - len(new_names) :]:
+                segment.kill_hashes(pending)
+        self._segments = segments
+        if len(new_names) == len(segments):
+            return True, None
+        return True, [
+            segment.chunk_id_at(row)
+            for segment in segments[len(segments) - len(new_names) :]
+            for row in range(segment.n_rows)
+        ]
+
+    def add_listener(self, listener: Callable[[list[str] | None], None]) -> None:
+        """订阅其他进程发布的写入：参数为新映射 segment 中的 chunk_id，None 表示可能全部变化。
+
+        本进程自己 flush 的 segment 不回调（写入方自行处理失效）。
+        """
+        self._listeners.append(listener)
+
+    def maybe_refresh(self) -> None:
+        """读路径上的廉价检查：最多每 refresh_interval 秒 stat 一次 MANIFEST。"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        if self._stat_manifest() != self._manifest_stamp:
+            self.refresh()
+
+    def flush(self) -> None:
+        """把 memtable 封存为新的磁盘 segment 并发布新 generation；未配置目录时为空操作。"""
+        if not self.directory or len(self._mem) == 0:
+            return
+        with self._lock, self._writer_lock():
+            self.refresh()  # 先同步其他写者已发布的 segment
+            path = os.path.join(self.directory, self._next_segment_name())
+            self._mem.write(path)
+            segment = _DiskSegment(path)
+            for older in self._segments:
+                older.kill_hashes(segment.id_hash)
+            self._segments = self._segments + [segment]
+            self._mem = _MemSegment()
+            self._publish()
+            logger.info(
+                "[ChunkStore] 封存 segment %s (generation=%d)", segment.name, self.generation
+            )
+            if len(self._segments) > self.max_segments:
+                self._compact_locked()
+
+    def compact(self) -> None:
+        """把全部磁盘 segment 的存活行合并为一个新 segment，删除旧目录。"""
+        if not self.directory:
+            return
+        with self._lock, self._writer_lock():
+            self.refresh()
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        old = self._segments
+        merged = _MemSegment()
+        for segment in old:
+            for row in segment.live_rows():
+                merged.append(segment.view(int(row)))
+        path = os.path.join(self.directory, self._next_segment_name())
+        merged.write(path)
+        self._segments = [_DiskSegment(path)]
+        self._publish()
+        # 其他进程已映射的旧文件在 unlink 后仍然有效，下次 refresh 时切换到新 segment
+        for segment in old:
+            shutil.rmtree(segment.path, ignore_errors=True)
+        logger.info(
+            "[ChunkStore] 合并 %d 个 segment -> %s", len(old), os.path.basename(path)
+        )
+
+    def close(self) -> None:
+        self.flush()
+
+    # ---- MANIFEST / 写锁 ----
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, _MANIFEST)
+
+    def _stat_manifest(self) -> tuple[int, int] | None:
+        try:
+            st = os.stat(self._manifest_path())
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read_manifest(self) -> tuple[int, list[str]]:
+        try:
+            with open(self._manifest_path(), encoding="utf-8") as f:
+                manifest = json.load(f)
+            return manifest["generation"], manifest["segments"]
+        except FileNotFoundError:
+            # 没有 MANIFEST 的旧目录：按目录名顺序加载
+            names = sorted(
+                n
+                for n in os.listdir(self.directory)
+                if n.startswith(_SEGMENT_PREFIX) and not n.endswith(".tmp")
+            )
+            return 0, names
+
+    def _publish(self) -> None:
+        """原子替换 MANIFEST，generation + 1。调用方须持有写锁。"""
+        self.generation += 1
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "generation": self.generation,
+                    "segments": [s.name for s in self._segments],
+                },
+                f,
+            )
+        os.replace(tmp, self._manifest_path())
+        self._manifest_stamp = self._stat_manifest()
+
+    @contextmanager
+    def _writer_lock(self) -> Iterator[None]:
+        """跨进程写锁（flock），保证同一时刻只有一个写者发布 segment。"""
+        import fcntl
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, _LOCK), "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _next_segment_name(self) -> str:
+        numbers = [
+            int(n[len(_SEGMENT_PREFIX) :].split(".")[0])
+            for n in os.listdir(self.directory)
+            if n.startswith(_SEGMENT_PREFIX)
+        ]
+        return f"{_SEGMENT_PREFIX}{max(numbers, default=0) + 1:06d}"
+
+    # ---- 定位 ----
+
+    def _locate(self, chunk_id: str) -> tuple[_Segment, int] | None:
+        self.maybe_refresh()
+        row = self._mem.row_of.get(chunk_id)
+        if row is not None:
+            return self._mem, row
+        for segment in reversed(self._segments):
+            row = segment.find(chunk_id)
+            if row is not None:
+                return segment, row
+        return None
+
+    # ---- dict 接口 ----
+
+    def __len__(self) -> int:
+        self.maybe_refresh()
+        return len(self._mem) + sum(len(s) for s in self._segments)
+
+    def __contains__(self, chunk_id: object) -> bool:
+        return isinstance(chunk_id, str) and self._locate(chunk_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __getitem__(self, chunk_id: str) -> DocumentChunk:
+        chunk = self.get(chunk_id)
+        if chunk is None:
+            raise KeyError(chunk_id)
+        return chunk
+
+    def __setitem__(self, chunk_id: str, chunk: DocumentChunk) -> None:
+        if chunk_id != chunk.chunk_id:
+            raise ValueError(f"chunk_id 不一致: {chunk_id} != {chunk.chunk_id}")
+        self.add(chunk)
+
+    def get(self, chunk_id: str, default: DocumentChunk | None = None) -> DocumentChunk | None:
+        """按需构造 DocumentChunk 视图（包含文本、元数据与分词）。"""
+        found = self._locate(chunk_id)
+        return default if found is None else found[0].view(found[1])
+
+    def keys(self) -> list[str]:
+        return [segment.chunk_id_at(row) for segment, row in self._live_entries()]
+
+    def items(self) -> Iterator[tuple[str, DocumentChunk]]:
+        for segment, row in self._live_entries():
+            yield segment.chunk_id_at(row), segment.view(row)
+
+    def values(self) -> Iterator[DocumentChunk]:
+        for _, chunk in self.items():
+            yield chunk
+
+    def _live_entries(self) -> Iterator[tuple[_Segment, int]]:
+        self.maybe_refresh()
+        for segment in self._segments:
+            for row in segment.live_rows():
+                yield segment, int(row)
+        for row in list(self._mem.row_of.values()):
+            yield self._mem, row
+
+    # ---- 写入 ----
+
+    def add(self, chunk: DocumentChunk) -> None:
+        self.add_many([chunk])
+
+    def add_many(self, chunks: Iterable[DocumentChunk]) -> int:
+        count = 0
+        with self._lock:
+            for chunk in chunks:
+                # 覆盖磁盘上的旧版本：旧行标记失效
+                for segment in self._segments:
+                    row = segment.find(chunk.chunk_id)
+                    if row is not None:
+                        segment.live[row] = False
+                self._mem.append(chunk)
+                with self._text_lock:
+                    self._text_cache.pop(chunk.chunk_id, None)
+                    self._text_epoch += 1
+                count += 1
+        return count
+
+    # ---- 列读取（热路径，不构造对象） ----
+
+    def text(self, chunk_id: str) -> str | None:
+        self.maybe_refresh()
+        epoch = self._text_epoch
+        cached = self._text_cache.get(chunk_id)
+        if cached is not None:
+            return cached
+        found = self._locate(chunk_id)
+        if found is None:
+            return None
+        text = found[0].text_at(found[1])
+        with self._text_lock:
+            if self.text_cache_size > 0 and epoch == self._text_epoch:
+                self._text_cache[chunk_id] = text
+                while len(self._text_cache) > self.text_cache_size:
+                    del self._text_cache[next(iter(self._text_cache))]
+        return text
+
+    def _clear_text_cache(self) -> None:
+        with self._text_lock:
+            self._text_cache.clear()
+            self._text_epoch += 1
+
+    def doc_id(self, chunk_id: str) -> str | None:
+        found = self._locate(chunk_id)
+        return None if found is None else found[0].doc_id_at(found[1])
+
+    def tokens(self, chunk_id: str) -> list[str] | None:
+        found = self._locate(chunk_id)
+        return None if found is None else found[0].tokens_at(found[1])
+
+    def match_terms(self, chunk_ids: list[str], terms: set[str]) -> TermMatches:
+        """批量匹配：每个 chunk 的预计算词表与 query 词集合求交。
+
+        同一 segment 的候选拼接后一次 np.isin，不对 chunk 文本重新分词。
+        """
+        n = len(chunk_ids)
+        found = np.zeros(n, dtype=bool)
+        has_table = np.zeros(n, dtype=bool)
+        n_terms = np.zeros(n, dtype=np.int64)
+        text_len = np.zeros(n, dtype=np.int64)
+        by_segment: dict[int, tuple[_Segment, list[tuple[int, np.ndarray, np.ndarray]]]] = {}
+
+        for i, chunk_id in enumerate(chunk_ids):
+            located = self._locate(chunk_id)
+            if located is None:
+                continue
+            found[i] = True
+            segment, row = located
+            table = segment.terms_at(row)
+            if table is None:
+                continue
+            ids, pos, length = table
+            has_table[i] = True
+            n_terms[i] = len(ids)
+            text_len[i] = length
+            by_segment.setdefault(id(segment), (segment, []))[1].append((i, ids, pos))
+
+        owners: list[np.ndarray] = []
+        positions: list[np.ndarray] = []
+        for segment, entries in by_segment.values():
+            query_ids = [c for c in map(segment.vocab.lookup, terms) if c is not None]
+            if not query_ids:
+                continue
+            ids = np.concatenate([e[1] for e in entries])
+            hit = np.isin(ids, np.asarray(query_ids, dtype=ids.dtype))
+            owner = np.repeat([e[0] for e in entries], [len(e[1]) for e in entries])
+            owners.append(owner[hit])
+            positions.append(np.concatenate([e[2] for e in entries])[hit])
+
+        return TermMatches(
+            found=found,
+            has_table=has_table,
+            n_terms=n_terms,
+            text_len=text_len,
+            owner=np.concatenate(owners).astype(np.int64) if owners else np.zeros(0, np.int64),
+            first_pos=(
+                np.concatenate(positions).astype(np.int64) if positions else np.zeros(0, np.int64)
+            ),
+        )
+
+    def ids_by_doc(self, doc_ids: Iterable[str]) -> list[str]:
+        """返回属于给定文档的全部 chunk_id（按各 segment 的 doc_id 编码列过滤）。"""
+        self.maybe_refresh()
+        doc_ids = list(doc_ids)
+        result: list[str] = []
+        for segment in self._segments:
+            codes = [c for c in map(segment.doc_ids.lookup, doc_ids) if c is not None]
+            if not codes:
+                continue
+            rows = np.flatnonzero(np.isin(segment.doc_code, codes) & segment.live)
+            result.extend(segment.chunk_id_at(int(r)) for r in rows)
+        codes = {c for c in map(self._mem.doc_ids.lookup, doc_ids) if c is not None}
+        result.extend(
+            chunk_id
+            for chunk_id, row in list(self._mem.row_of.items())
+            if self._mem.doc_code[row] in codes
+        )
+        return result
+
+    def ids_matching(self, filt: RetrievalFilter) -> set[str]:
+        """返回满足元数据过滤条件的全部存活 chunk_id。
+
+        条件先在各 segment 的字典里解析为 code 集合（heading 前缀只扫字典），
+        再对编码列做一次 np.isin，不逐行构造元数据。
+        """
+        self.maybe_refresh()
+        result: set[str] = set()
+        for segment in [*self._segments, self._mem]:
+            if segment is self._mem:
+                rows = np.array(list(self._mem.row_of.values()), dtype=np.int64)
+                if len(rows) == 0:
+                    continue
+            else:
+                rows = segment.live_rows()
+            mask = np.ones(len(rows), dtype=bool)
+            for values, dictionary, column in (
+                (filt.doc_ids, segment.doc_ids, segment.doc_code),
+                (filt.node_types, segment.node_types, segment.node_type_code),
+            ):
+                if values:
+                    codes = [c for c in map(dictionary.lookup, values) if c is not None]
+                    mask &= np.isin(np.asarray(column)[rows], codes)
+            if filt.heading_prefix:
+                codes = [
+                    code
+                    for code, heading in enumerate(segment.headings.values)
+                    if heading.startswith(filt.heading_prefix)
+                ]
+                mask &= np.isin(np.asarray(segment.heading_code)[rows], codes)
+            result.update(segment.chunk_id_at(int(r)) for r in rows[mask])
+        return result
+
+    @property
+    def nbytes(self) -> int:
+        """常驻内存字节数：memtable 列数据 + 磁盘 segment 的 live 掩码（列为 memory-map，不计入）。"""
+        return self._mem.nbytes + sum(s.live.nbytes for s in self._segments)
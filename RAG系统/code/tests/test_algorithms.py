@@ -6,6 +6,7 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from core.algorithms import (
+    choose_rerank_depth,
     compute_rsf_alpha,
     normalize_scores,
     rerank_with_threshold_cutoff,
@@ -128,3 +129,34 @@ class TestRerankCutoff:
     def test_empty_input(self):
         result = rerank_with_threshold_cutoff([])
         assert result == []
+
+
+class TestRerankDepth:
+    """自适应精排深度测试。"""
+
+    def test_decisive_top_skips_rerank(self):
+        assert choose_rerank_depth([1.0, 0.5, 0.4], max_depth=80) == (0, "decisive_top")
+
+    def test_gradual_scores_rerank_all(self):
+        scores = [1.0 - i * 0.01 for i in range(80)]
+        assert choose_rerank_depth(scores, max_depth=80) == (80, "full")
+
+    def test_cut_at_score_gap(self):
+        """前 30 名与其后分差明显时只精排前 30。"""
+        scores = [1.0 - i * 0.005 for i in range(30)] + [0.5 - i * 0.005 for i in range(50)]
+        assert choose_rerank_depth(scores, max_depth=80, min_depth=20) == (30, "score_gap")
+
+    def test_gap_before_min_depth_ignored(self):
+        scores = [1.0 - i * 0.01 for i in range(5)] + [0.7 - i * 0.001 for i in range(75)]
+        assert choose_rerank_depth(scores, max_depth=80, min_depth=20)[0] == 80
+
+    def test_budget_shrinks_depth(self):
+        scores = [1.0 - i * 0.01 for i in range(80)]
+        depth, reason = choose_rerank_depth(
+            scores, max_depth=80, remaining_ms=40, cost_per_candidate_ms=1.0
+        )
+        assert (depth, reason) == (40, "budget")
+        depth, reason = choose_rerank_depth(
+            scores, max_depth=80, remaining_ms=5, cost_per_candidate_ms=1.0
+        )
+        assert (depth, reason) == (0, "budget_exhausted")
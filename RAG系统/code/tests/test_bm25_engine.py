@@ -0,0 +1,298 @@
+"""Elasticsearch BM25 引擎单元测试：使用桩客户端校验请求体与响应解析，无需 ES。"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import retrieval.bm25_engine as bm25_module
+from config.settings import Settings
+from models.schemas import ChunkMetadata, DocumentChunk, RetrievalFilter
+from retrieval.bm25_engine import BM25Engine
+
+
+class _Response:
+    def __init__(self, body: dict):
+        self.body = body
+
+
+class StubIndices:
+    def __init__(self, refresh_interval: str | None = None):
+        self.refresh_interval = refresh_interval
+        self.heading_raw = True
+        self.calls: list[tuple] = []
+
+    def exists(self, index):
+        return True
+
+    def refresh(self, index):
+        self.calls.append(("refresh", index))
+
+    def get_settings(self, index, name):
+        settings = {}
+        if self.refresh_interval is not None:
+            settings = {"index": {"refresh_interval": self.refresh_interval}}
+        return _Response({index: {"settings": settings}})
+
+    def put_settings(self, index, settings):
+        self.calls.append(("put_settings", settings["index"]["refresh_interval"]))
+
+    def get_mapping(self, index):
+        heading = {"type": "text"}
+        if self.heading_raw:
+            heading["fields"] = {"raw": {"type": "keyword"}}
+        return _Response({index: {"mappings": {"properties": {"heading_path": heading}}}})
+
+    def put_mapping(self, index, properties):
+        self.calls.append(("put_mapping", properties))
+
+
+class StubTasks:
+    def __init__(self):
+        self.completed = False
+
+    def get(self, task_id):
+        body = {"completed": self.completed}
+        if self.completed:
+            body["response"] = {"updated": 3, "failures": []}
+        return _Response(body)
+
+
+class StubES:
+    """记录请求并返回预设响应的 Elasticsearch 客户端桩。"""
+
+    def __init__(self, msearch_body: dict | None = None):
+        self.msearch_body = msearch_body or {"responses": []}
+        self.msearch_calls: list[dict] = []
+        self.indices = StubIndices()
+        self.tasks = StubTasks()
+
+    def options(self, **kwargs):
+        return self
+
+    def update_by_query(self, index, **kwargs):
+        self.indices.calls.append(
+            ("update_by_query", kwargs["conflicts"], kwargs["wait_for_completion"])
+        )
+        return _Response({"task": "node:1"})
+
+    def msearch(self, searches, filter_path=None):
+        self.msearch_calls.append({"searches": searches, "filter_path": filter_path})
+        return _Response(self.msearch_body)
+
+
+def _engine(es, **overrides) -> BM25Engine:
+    engine = BM25Engine(Settings(**overrides))
+    engine._es = es
+    return engine
+
+
+class TestMsearch:
+    """_msearch 请求体与响应解析。"""
+
+    def test_body_keeps_id_in_hits(self):
+        """stored_fields=_none_ 会去掉 _id，请求体不得设置。"""
+        body = BM25Engine._build_search_body("随机接入", 50)
+        assert "stored_fields" not in body
+        assert body["_source"] is False
+        assert body["size"] == 50
+
+        filtered = BM25Engine._build_search_body(
+            "随机接入", 50, RetrievalFilter(doc_ids=["doc_1"], heading_prefix="# 5G")
+        )
+        assert filtered["query"]["bool"]["filter"] == [
+            {"terms": {"doc_id": ["doc_1"]}},
+            {"prefix": {"heading_path.raw": "# 5G"}},
+        ]
+
+    def test_parse_realistic_response(self):
+        # 按 filter_path 裁剪后的真实 _msearch 响应结构
+        es = StubES(
+            {
+                "responses": [
+                    {
+                        "status": 200,
+                        "hits": {
+                            "hits": [
+                                {"_id": "c1", "_score": 7.5},
+                                {"_id": "c3", "_score": 2.25},
+                            ]
+                        },
+                    },
+                    {"status": 200},  # 无命中时 hits 被 filter_path 剔除
+                    {"status": 400, "error": {"reason": "parse error"}},
+                ]
+            }
+        )
+        results = _engine(es).search_many(["随机接入", "无结果", "坏查询"], top_k=10, timeout=0.5)
+        assert results == [[("c1", 7.5), ("c3", 2.25)], [], []]
+
+        call = es.msearch_calls[0]
+        assert "responses.hits.hits._id" in call["filter_path"]
+        headers, bodies = call["searches"][0::2], call["searches"][1::2]
+        assert all(h == {"index": Settings().es_index_name} for h in headers)
+        assert [b["query"]["multi_match"]["query"] for b in bodies] == [
+            "随机接入",
+            "无结果",
+            "坏查询",
+        ]
+        assert all(b["timeout"] == "500ms" for b in bodies)
+
+
+class TestEnsureIndex:
+    """已有索引的 heading_path.raw 迁移。"""
+
+    def test_existing_mapping_untouched(self):
+        es = StubES()
+        _engine(es)._ensure_index()
+        assert es.indices.calls == []
+
+    def test_missing_raw_subfield_added_and_backfilled(self):
+        es = StubES()
+        es.indices.heading_raw = False
+        _engine(es)._ensure_index()
+        assert es.indices.calls == [
+            (
+                "put_mapping",
+                {"heading_path": {"type": "text", "fields": {"raw": {"type": "keyword"}}}},
+            ),
+            ("update_by_query", "proceed", False),
+        ]
+
+    def test_heading_prefix_uses_allowed_ids_until_backfill_done(self):
+        es = StubES({"responses": [{"status": 200, "hits": {"hits": []}}]})
+        es.indices.heading_raw = False
+        engine = _engine(es, es_backfill_poll_interval_s=0.0)
+        engine._ensure_index()
+        prefix = RetrievalFilter(heading_prefix="# 5G")
+
+        assert not engine.supports_filter(prefix)
+        assert engine.supports_filter(RetrievalFilter(doc_ids=["d1"]))
+        engine.search_many(["随机接入"], metadata_filter=prefix, allowed_ids={"c2", "c1"})
+        clauses = es.msearch_calls[-1]["searches"][1]["query"]["bool"]["filter"]
+        assert clauses == [{"ids": {"values": ["c1", "c2"]}}]
+
+        es.tasks.completed = True
+        assert engine.supports_filter(prefix)
+        engine.search_many(["随机接入"], metadata_filter=prefix, allowed_ids={"c1"})
+        clauses = es.msearch_calls[-1]["searches"][1]["query"]["bool"]["filter"]
+        assert clauses == [{"prefix": {"heading_path.raw": "# 5G"}}]
+
+
+def _chunk(cid: str, text: str = "随机接入") -> DocumentChunk:
+    return DocumentChunk(
+        chunk_id=cid,
+        text=text,
+        metadata=ChunkMetadata(
+            chunk_id=cid, doc_id="doc", doc_name="5G", heading_path="# 5G", node_type="leaf"
+        ),
+    )
+
+
+@pytest.fixture
+def bulk_calls(monkeypatch):
+    """替换 bulk helper，记录每次调用的 action 与参数，逐条返回成功。"""
+    calls: list[dict] = []
+
+    def fake_bulk(client, actions, chunk_size, raise_on_error, **kwargs):
+        actions = list(actions)
+        calls.append({"actions": actions, "chunk_size": chunk_size, **kwargs})
+        return [(True, {"index": {"_id": a["_id"]}}) for a in actions]
+
+    monkeypatch.setattr(bm25_module, "streaming_bulk", fake_bulk)
+    monkeypatch.setattr(bm25_module, "parallel_bulk", fake_bulk)
+    return calls
+
+
+class TestBulkIndex:
+    """bulk 写入与 refresh_interval 切换。"""
+
+    def test_bulk_actions(self, bulk_calls):
+        es = StubES()
+        engine = _engine(es, es_bulk_workers=1, es_bulk_batch_size=2)
+        assert engine.index_chunks([_chunk("c1"), _chunk("c2", "载波聚合")]) == 2
+
+        call = bulk_calls[0]
+        assert call["chunk_size"] == 2
+        assert "thread_count" not in call  # workers=1 使用 streaming_bulk
+        assert call["actions"][1] == {
+            "_index": Settings().es_index_name,
+            "_id": "c2",
+            "_source": {
+                "chunk_id": "c2",
+                "doc_id": "doc",
+                "doc_name": "5G",
+                "text": "载波聚合",
+                "heading_path": "# 5G",
+                "node_type": "leaf",
+            },
+        }
+        # 小批量不切换 refresh_interval
+        assert es.indices.calls == []
+
+    def test_parallel_bulk_when_multiple_workers(self, bulk_calls):
+        _engine(StubES(), es_bulk_workers=3).index_chunks([_chunk("c1")])
+        assert bulk_calls[0]["thread_count"] == 3
+
+    def test_large_batch_disables_refresh(self, bulk_calls):
+        es = StubES()
+        es.indices = StubIndices(refresh_interval="5s")
+        engine = _engine(es, es_bulk_workers=1, es_bulk_refresh_threshold=3)
+        engine.index_chunks([_chunk(f"c{i}") for i in range(3)])
+        assert es.indices.calls == [
+            ("put_settings", "-1"),
+            ("put_settings", "5s"),
+            ("refresh", Settings().es_index_name),
+        ]
+
+    def test_bulk_load_nested_and_restores_default(self, bulk_calls):
+        """嵌套只由最外层切换；原值未设置时写回 None（恢复集群默认），异常时同样恢复。"""
+        es = StubES()
+        engine = _engine(es, es_bulk_workers=1, es_bulk_refresh_threshold=1)
+        with pytest.raises(RuntimeError):
+            with engine.bulk_load():
+                engine.index_chunks([_chunk("c1")])  # 超过阈值，但已在 bulk_load 内
+                with engine.bulk_load():
+                    pass
+                raise RuntimeError("写入中断")
+        assert es.indices.calls == [
+            ("put_settings", "-1"),
+            ("put_settings", None),
+            ("refresh", Settings().es_index_name),
+        ]
+        assert engine._bulk_depth == 0
+
+    def test_bulk_load_concurrent_threads_restore_original(self):
+        """两个线程交错进出：只在最后一个退出时恢复进入前的原值，不会写回 "-1"。"""
+        import threading
+
+        es = StubES()
+        es.indices = StubIndices(refresh_interval="5s")
+        engine = _engine(es)
+        a_inside, b_inside, a_done = threading.Event(), threading.Event(), threading.Event()
+
+        def thread_a():
+            with engine.bulk_load():
+                a_inside.set()
+                b_inside.wait(5)
+            a_done.set()
+
+        def thread_b():
+            a_inside.wait(5)
+            with engine.bulk_load():
+                b_inside.set()
+                a_done.wait(5)
+
+        threads = [threading.Thread(target=thread_a), threading.Thread(target=thread_b)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        assert es.indices.calls == [
+            ("put_settings", "-1"),
+            ("put_settings", "5s"),
+            ("refresh", Settings().es_index_name),
+        ]
+        assert engine._bulk_depth == 0
@@ -0,0 +1,146 @@
+"""批量摄入流水线单元测试：使用进程内 BM25 / 向量引擎，无需 ES / Milvus / Kafka。"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+pytest.importorskip("kafka")  # IngestionPipeline 依赖 Kafka 客户端（批量摄入本身不经过 Kafka）
+
+from config.settings import Settings
+from data.sample_documents import SAMPLE_DOCUMENTS
+from ingestion.chunk_splitter import HierarchicalChunkSplitter
+from ingestion.data_cleaner import DataCleaner
+from ingestion.document_parser import MarkdownDocumentParser
+from ingestion.embedder import Embedder
+from ingestion.kafka_consumer import KafkaChunkConsumer
+from ingestion.kafka_producer import KafkaChunkProducer
+from ingestion.pipeline import IngestionPipeline
+from models.schemas import IngestRequest
+from retrieval.local_bm25_engine import LocalBM25Engine
+from retrieval.local_vector_engine import LocalVectorEngine
+
+
+def _make_pipeline(**overrides) -> IngestionPipeline:
+    settings = Settings(**overrides)
+    return IngestionPipeline(
+        settings=settings,
+        parser=MarkdownDocumentParser(),
+        cleaner=DataCleaner(),
+        splitter=HierarchicalChunkSplitter(settings),
+        embedder=Embedder(settings),
+        kafka_producer=KafkaChunkProducer(settings),
+        kafka_consumer=KafkaChunkConsumer(settings),
+        bm25_engine=LocalBM25Engine(settings),
+        vector_engine=LocalVectorEngine(settings),
+    )
+
+
+def _documents() -> list[IngestRequest]:
+    return [
+        IngestRequest(doc_id=d["doc_id"], doc_name=d["doc_name"], content=d["content"])
+        for d in SAMPLE_DOCUMENTS
+    ]
+
+
+class TestIngestDocuments:
+    """三阶段批量摄入测试。"""
+
+    def test_inline_matches_direct(self):
+        direct = _make_pipeline()
+        expected = sum(
+            len(direct.ingest_document_direct(d.doc_id, d.doc_name, d.content))
+            for d in _documents()
+        )
+
+        pipeline = _make_pipeline(
+            ingest_workers=1, embedding_batch_size=8, ingest_queue_size=2
+        )
+        stats = pipeline.ingest_documents(iter(_documents()))
+        assert stats.documents == len(SAMPLE_DOCUMENTS)
+        assert stats.chunks == expected == len(pipeline.chunk_store)
+        assert stats.failed == 0
+        assert stats.docs_per_s > 0
+        assert set(stats.utilization()) == {"prepare", "embed", "write"}
+
+        chunk = pipeline.chunk_store[next(iter(pipeline.chunk_store))]
+        assert chunk.bm25_tokens
+        hits = pipeline.bm25_engine.search("随机接入", top_k=3)
+        assert hits
+
+    def test_process_pool(self):
+        pipeline = _make_pipeline(ingest_workers=2, ingest_inprocess_threshold=1)
+        try:
+            stats = pipeline.ingest_documents(_documents())
+            assert stats.workers == 2
+            assert stats.documents == len(SAMPLE_DOCUMENTS)
+            assert stats.chunks == len(pipeline.chunk_store) > 0
+            assert pipeline.vector_engine.search_384_many(
+                [pipeline.embedder.embed_384("随机接入")], top_k=3
+            )[0]
+
+            # 进程池跨调用复用，close() 时关闭
+            pool = pipeline._pool
+            assert pool is not None
+            pipeline.ingest_documents(_documents()[:2])
+            assert pipeline._pool is pool
+        finally:
+            pipeline.close()
+        assert pipeline._pool is None
+
+    def test_small_batch_runs_in_process(self):
+        pipeline = _make_pipeline(ingest_workers=4, ingest_inprocess_threshold=16)
+        stats = pipeline.ingest_documents(iter(_documents()))
+        assert stats.workers == 1
+        assert stats.documents == len(SAMPLE_DOCUMENTS)
+        assert pipeline._pool is None
+
+    def test_failed_document_skipped(self):
+        class BrokenParser(MarkdownDocumentParser):
+            def parse(self, raw_content, file_type="markdown"):
+                if "损坏" in raw_content:
+                    raise ValueError("无法解析")
+                return super().parse(raw_content, file_type)
+
+        pipeline = _make_pipeline(ingest_workers=1)
+        pipeline.parser = BrokenParser()
+        docs = _documents()[:2] + [IngestRequest(doc_id="bad", doc_name="bad", content="损坏")]
+        stats = pipeline.ingest_documents(docs)
+        assert stats.documents == 2
+        assert stats.failed_doc_ids == ["bad"]
+
+    def test_write_failure_reported_per_document(self):
+        pipeline = _make_pipeline(
+            ingest_workers=1, ingest_write_batch_size=1, embedding_batch_size=8
+        )
+        calls = []
+        index_chunks = pipeline.bm25_engine.index_chunks
+
+        def flaky(chunks, batch_size=None, workers=None):
+            calls.append(len(chunks))
+            if len(calls) > 1:
+                raise ConnectionError("es down")
+            return index_chunks(chunks, batch_size, workers)
+
+        pipeline.bm25_engine.index_chunks = flaky
+        docs = _documents()
+        stats = pipeline.ingest_documents(docs, raise_on_error=False)
+        assert stats.failed == len(docs) - stats.documents > 0
+        assert set(stats.failed_doc_ids) == set(stats.errors)
+        assert all(
+            "es down" in reason or "未处理" in reason for reason in stats.errors.values()
+        )
+        # 成功的文档与失败的文档互不重叠，合起来覆盖全部请求
+        assert stats.documents + len(stats.errors) == len(docs)
+
+    def test_write_failure_raises(self):
+        pipeline = _make_pipeline(ingest_workers=1)
+
+        def broken(chunks, batch_size=None, workers=None):
+            raise ConnectionError("es down")
+
+        pipeline.bm25_engine.index_chunks = broken
+        with pytest.raises(ConnectionError):
+            pipeline.ingest_documents(_documents())
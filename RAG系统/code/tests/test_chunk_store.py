@@ -0,0 +1,191 @@
+"""列式 ChunkStore 单元测试。"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from models.schemas import ChunkMetadata, DocumentChunk, RetrievalFilter
+from storage.chunk_store import ChunkStore
+
+
+def _chunk(cid: str, text: str, doc_id: str = "doc", **meta) -> DocumentChunk:
+    return DocumentChunk(
+        chunk_id=cid,
+        text=text,
+        metadata=ChunkMetadata(chunk_id=cid, doc_id=doc_id, doc_name=f"{doc_id}.md", **meta),
+    )
+
+
+class TestChunkStore:
+    """列式存储的 dict 语义与行视图测试。"""
+
+    def test_roundtrip_view(self):
+        store = ChunkStore()
+        chunk = _chunk(
+            "c1",
+            "5G 随机接入流程",
+            heading_path="# 5G / ## 随机接入",
+            node_type="non_leaf",
+            is_continuation=True,
+            parent_summary="摘要",
+        )
+        chunk.bm25_tokens = ["5G", "随机接入", "流程"]
+        chunk.vector_384 = [0.1, 0.2, 0.3, 0.4]
+        store["c1"] = chunk
+
+        view = store["c1"]
+        # 向量由向量引擎保存，不入 chunk store
+        assert view.vector_384 is None
+        assert view.model_dump(exclude={"vector_384"}) == chunk.model_dump(
+            exclude={"vector_384"}
+        )
+        assert store.text("c1") == "5G 随机接入流程"
+        assert store.tokens("c1") == ["5G", "随机接入", "流程"]
+
+    def test_dict_semantics(self):
+        store = ChunkStore()
+        store.add_many([_chunk("a", "甲"), _chunk("b", "乙")])
+        assert len(store) == 2
+        assert "a" in store and "x" not in store
+        assert store.get("x") is None
+        assert sorted(store) == ["a", "b"]
+        assert {cid: c.text for cid, c in store.items()} == {"a": "甲", "b": "乙"}
+        with pytest.raises(KeyError):
+            store["x"]
+
+    def test_overwrite_keeps_latest(self):
+        store = ChunkStore()
+        store.add(_chunk("a", "旧文本", doc_id="d1"))
+        store.add(_chunk("a", "新文本", doc_id="d2"))
+        assert len(store) == 1
+        assert store.text("a") == "新文本"
+        assert store.ids_by_doc(["d1"]) == []
+        assert store.ids_by_doc(["d2", "missing"]) == ["a"]
+
+    def test_text_cache_invalidated_on_overwrite(self):
+        store = ChunkStore(text_cache_size=2)
+        store.add_many([_chunk("a", "甲"), _chunk("b", "乙"), _chunk("c", "丙")])
+        assert [store.text(c) for c in ("a", "b", "c")] == ["甲", "乙", "丙"]
+        assert list(store._text_cache) == ["b", "c"]  # 淘汰最早缓存的 a
+        store.add(_chunk("b", "新乙"))
+        assert store.text("b") == "新乙"
+
+    def test_mismatched_key_rejected(self):
+        store = ChunkStore()
+        with pytest.raises(ValueError):
+            store["b"] = _chunk("a", "甲")
+
+
+class TestChunkStorePersistence:
+    """磁盘 segment 持久化与重启加载测试。"""
+
+    def test_flush_and_reload(self, tmp_path):
+        store = ChunkStore(directory=str(tmp_path))
+        chunk = _chunk("a", "甲文本", doc_id="d1", parent_summary="摘要")
+        chunk.bm25_tokens = ["甲", "文本"]
+        chunk.vector_384 = [1.0, 0.0, 0.0, 0.0]
+        store.add_many([chunk, _chunk("b", "乙文本", doc_id="d2")])
+        store.flush()
+
+        restored = ChunkStore(directory=str(tmp_path))
+        restored.load()
+        assert len(restored) == 2
+        assert restored.text("b") == "乙文本"
+        assert restored.get("a").model_dump() == store.get("a").model_dump()
+        assert restored.ids_by_doc(["d1"]) == ["a"]
+
+    def test_overwrite_across_segments(self, tmp_path):
+        store = ChunkStore(directory=str(tmp_path))
+        store.add_many([_chunk("a", "旧"), _chunk("b", "乙")])
+        store.flush()
+        store.add(_chunk("a", "新"))
+        assert store.text("a") == "新"
+        assert len(store) == 2
+        store.flush()
+
+        restored = ChunkStore(directory=str(tmp_path))
+        restored.load()
+        assert restored.text("a") == "新"
+        assert sorted(restored) == ["a", "b"]
+
+    def test_compact_merges_segments(self, tmp_path):
+        store = ChunkStore(directory=str(tmp_path), max_segments=2)
+        for i in range(3):
+            store.add_many([_chunk(f"c{i}", f"文本{i}"), _chunk("shared", f"版本{i}")])
+            store.flush()
+        assert len([n for n in os.listdir(tmp_path) if n.startswith("seg_")]) == 1
+        assert store.text("shared") == "版本2"
+        assert len(store) == 4
+
+        restored = ChunkStore(directory=str(tmp_path))
+        restored.load()
+        assert sorted(restored) == ["c0", "c1", "c2", "shared"]
+
+
+    def test_match_terms_after_reload(self, tmp_path):
+        store = ChunkStore(directory=str(tmp_path))
+        chunk = _chunk("a", "Random Access 随机接入")
+        chunk.bm25_tokens = ["Random", " ", "Access", " ", "随机接入"]
+        store.add_many([chunk, _chunk("b", "无分词")])
+        before = store.match_terms(["a", "b", "x"], {"access", "Access", "随机接入"})
+        store.flush()
+
+        restored = ChunkStore(directory=str(tmp_path))
+        restored.load()
+        after = restored.match_terms(["a", "b", "x"], {"access", "Access", "随机接入"})
+        for m in (before, after):
+            assert m.found.tolist() == [True, True, False]
+            assert m.has_table.tolist() == [True, False, False]
+            assert m.n_terms[0] == 3
+            assert sorted(m.first_pos.tolist()) == [7, 14]
+            assert m.owner.tolist() == [0, 0]
+
+
+class TestChunkStoreSharing:
+    """多进程共享目录：单写者发布 generation，读者只读映射。"""
+
+    def _pair(self, tmp_path):
+        writer = ChunkStore(directory=str(tmp_path), max_segments=2)
+        writer.load()
+        reader = ChunkStore(directory=str(tmp_path), refresh_interval_ms=0)
+        reader.load()
+        return writer, reader
+
+    def test_reader_sees_published_segments(self, tmp_path):
+        writer, reader = self._pair(tmp_path)
+        writer.add(_chunk("a", "甲"))
+        assert reader.text("a") is None  # 未 flush 前只在写者的 memtable 中
+        writer.flush()
+        assert reader.text("a") == "甲"
+        assert reader.generation == writer.generation == 1
+
+    def test_reader_survives_compaction(self, tmp_path):
+        writer, reader = self._pair(tmp_path)
+        writer.add(_chunk("a", "旧"))
+        writer.flush()
+        assert reader.text("a") == "旧"
+        for i in range(2):
+            writer.add_many([_chunk("a", "新"), _chunk(f"b{i}", "乙")])
+            writer.flush()  # 第 3 个 segment 触发合并，旧目录被删除
+        assert reader.text("a") == "新"
+        assert sorted(reader) == ["a", "b0", "b1"]
+        assert reader.generation == writer.generation
+
+    def test_memtable_overwrite_survives_external_compaction(self, tmp_path):
+        """其他进程合并后重新映射 segment，本进程 memtable 的覆盖仍使旧行失效。"""
+        writer, reader = self._pair(tmp_path)
+        writer.add_many([_chunk("a", "旧"), _chunk("b", "乙")])
+        writer.flush()
+        reader.add(_chunk("a", "本地新"))  # 读者进程未封存的覆盖
+        assert len(reader) == 2
+        writer.add(_chunk("c", "丙"))
+        writer.flush()
+        writer.compact()
+
+        assert len(reader) == 3
+        assert sorted(reader) == ["a", "b", "c"]
+        assert reader.text("a") == "本地新"
+        assert reader.ids_matching(RetrievalFilter(doc_ids=["doc"])) == {"a", "b", "c"}
@@ -49,6 +49,27 @@ class TestIngest:
         assert data["status"] == "success"
         assert data["chunks_created"] > 0
 
+    def test_ingest_batch(self, client):
+        resp = client.post(
+            "/ingest/batch",
+            json={
+                "documents": [
+                    {
+                        "doc_id": f"test_batch_{i}",
+                        "doc_name": f"批量测试文档 {i}",
+                        "content": f"# 标题 {i}\n\n批量摄入的测试内容 {i}。",
+                    }
+                    for i in range(3)
+                ]
+            },
+        )
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["status"] == "success"
+        assert data["documents"] == 3
+        assert data["chunks_created"] > 0
+        assert set(data["utilization"]) == {"prepare", "embed", "write"}
+
 
 class TestChat:
     def test_chat_basic(self, client):
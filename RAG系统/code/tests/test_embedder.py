@@ -0,0 +1,160 @@
+"""特征哈希 Embedder 单元测试。"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+import pytest
+
+from cache.embedding_cache import EmbeddingCache
+from config.settings import Settings
+from ingestion.embedder import Embedder
+
+TEXTS = [
+    "5G 随机接入流程包括四步：Msg1 到 Msg4。",
+    "5G 随机接入流程包括 Msg1 到 Msg4 四个步骤。",
+    "载波聚合 CA 可以提升用户峰值速率。",
+    "",
+]
+
+
+class TestEmbedBatch:
+    """批量接口与单条接口一致性测试。"""
+
+    def test_batch_matches_single(self):
+        embedder = Embedder(Settings())
+        vectors = embedder.embed_batch(TEXTS)
+        assert vectors[384].shape == (len(TEXTS), 384)
+        assert vectors[768].shape == (len(TEXTS), 768)
+        for i, text in enumerate(TEXTS[:3]):
+            assert vectors[384][i] == pytest.approx(np.array(embedder.embed_384(text)), abs=1e-6)
+            assert vectors[768][i] == pytest.approx(np.array(embedder.embed_768(text)), abs=1e-6)
+
+    def test_normalized_and_empty_text(self):
+        vectors = Embedder(Settings()).embed_batch(TEXTS, dims=(384,))
+        assert list(vectors) == [384]
+        norms = np.linalg.norm(vectors[384], axis=1)
+        assert norms[:3] == pytest.approx(1.0, abs=1e-5)
+        assert norms[3] == 0.0
+
+    def test_similar_texts_closer(self):
+        v = Embedder(Settings()).embed_batch(TEXTS[:3], dims=(768,))[768]
+        assert v[0] @ v[1] > v[0] @ v[2]
+
+
+class TestHashingBackend:
+    """整批 CSR 编码与逐条编码一致。"""
+
+    def test_batch_encode_matches_per_text(self):
+        backend = Embedder(Settings()).backend
+        texts = [f"{TEXTS[i % 3]} 第{i}条" for i in range(300)] + ["", "ab"]
+        batch = backend.encode(texts, 384)
+        single = np.stack([backend.encode([t], 384)[0] for t in texts])
+        assert batch == pytest.approx(single, abs=1e-4)
+        assert not batch[-2].any()
+
+    def test_words_split_like_str_split(self):
+        backend = Embedder(Settings()).backend
+        text = " 随机\u3000接入\t Msg1 "
+        rows, hashes, weights = backend._features([text, "x"])
+        words = hashes[(rows == 0) & (weights == 2.0)]
+        assert len(words) == len(text.split()) == 3
+        # trigram 不跨越文本边界
+        assert len(hashes[rows == 1]) == 1
+
+
+class TestMatryoshka:
+    """384 维由 768 维截断得到，双维度只编码一次。"""
+
+    def test_light_is_truncated_dense(self):
+        vectors = Embedder(Settings()).embed_batch(TEXTS[:3])
+        prefix = vectors[768][:, :384]
+        prefix = prefix / np.linalg.norm(prefix, axis=1, keepdims=True)
+        assert vectors[384] == pytest.approx(prefix, abs=1e-6)
+
+    def test_embed_dual_single_encode(self):
+        embedder = Embedder(Settings())
+        calls = []
+        encode = embedder.backend.encode
+
+        def counting(texts, dim):
+            calls.append(dim)
+            return encode(texts, dim)
+
+        embedder.backend.encode = counting
+        light, dense = embedder.embed_dual(TEXTS[0])
+        assert calls == [768]
+        assert light == pytest.approx(embedder.embed_384(TEXTS[0]), abs=1e-6)
+        assert dense == pytest.approx(embedder.embed_768(TEXTS[0]), abs=1e-6)
+
+
+class TestStableHashing:
+    """哈希与进程无关：子进程（不同的 hash 盐）生成相同向量。"""
+
+    def test_same_vector_across_processes(self):
+        import subprocess
+
+        code = (
+            "import sys; sys.path.insert(0, '.');"
+            "from config.settings import Settings; from ingestion.embedder import Embedder;"
+            f"print(Embedder(Settings()).embed_384({TEXTS[0]!r})[:4])"
+        )
+        root = os.path.join(os.path.dirname(__file__), "..")
+        outputs = {
+            subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=root,
+                env={**os.environ, "PYTHONHASHSEED": seed},
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            for seed in ("1", "2")
+        }
+        assert len(outputs) == 1
+
+
+class TestEmbeddingCache:
+    """两级 embedding 缓存测试。"""
+
+    def _embedder(self, path=""):
+        embedder = Embedder(Settings())
+        embedder.cache = EmbeddingCache(embedder.version, path=path)
+        calls = []
+        compute = embedder._compute
+
+        def counting(texts, dims):
+            calls.append(list(texts))
+            return compute(texts, dims)
+
+        embedder._compute = counting
+        return embedder, calls
+
+    def test_only_misses_are_computed(self):
+        embedder, calls = self._embedder()
+        plain = Embedder(Settings()).embed_batch(TEXTS)
+        first = embedder.embed_batch(TEXTS[:2])
+        second = embedder.embed_batch(TEXTS)
+        assert calls == [TEXTS[:2], TEXTS[2:]]
+        assert first[384] == pytest.approx(plain[384][:2])
+        assert second[768] == pytest.approx(plain[768])
+        embedder.embed_384(TEXTS[2])
+        assert len(calls) == 2
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        path = str(tmp_path / "emb.sqlite")
+        embedder, _ = self._embedder(path)
+        expected = embedder.embed_batch(TEXTS[:3], dims=(768,))[768]
+        embedder.cache.close()
+
+        restarted, calls = self._embedder(path)
+        assert restarted.embed_batch(TEXTS[:3], dims=(768,))[768] == pytest.approx(expected)
+        assert calls == []
+        assert restarted.cache.stats()["disk_hits"] == 3
+        light = restarted.embed_batch(TEXTS[:3], dims=(384,))[384]
+        assert calls == []  # 只缓存完整维度，384 维由截断得到
+        plain = Embedder(Settings()).embed_batch(TEXTS[:3], dims=(384,))[384]
+        assert light == pytest.approx(plain, abs=1e-6)
+        assert restarted.cache.stats()["entries"] == 3
@@ -0,0 +1,364 @@
+"""进程内检索引擎单元测试：LocalBM25Engine / LocalVectorEngine。"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+import pytest
+
+from config.settings import Settings
+from models.schemas import ChunkMetadata, DocumentChunk, RetrievalFilter
+from retrieval.local_bm25_engine import LocalBM25Engine
+from retrieval.local_vector_engine import LocalVectorEngine
+
+
+def _chunk(cid: str, text: str, doc_id: str = "doc") -> DocumentChunk:
+    return DocumentChunk(
+        chunk_id=cid,
+        text=text,
+        metadata=ChunkMetadata(chunk_id=cid, doc_id=doc_id, doc_name=doc_id),
+    )
+
+
+def _make_bm25() -> LocalBM25Engine:
+    engine = LocalBM25Engine(Settings())
+    engine.index_chunks(
+        [
+            _chunk("c1", "随机接入 流程 包括 四步 随机接入"),
+            _chunk("c2", "载波聚合 提升 峰值 速率"),
+            _chunk("c3", "波束 管理 与 波束 失败 恢复"),
+        ]
+    )
+    engine.refresh()
+    return engine
+
+
+class TestLocalBM25:
+    """进程内 BM25 测试。"""
+
+    def test_search_ranks_matching_doc_first(self):
+        engine = _make_bm25()
+        hits = engine.search("随机接入 流程")
+        assert hits[0][0] == "c1"
+        assert all(score > 0 for _, score in hits)
+
+    def test_search_many_aligned(self):
+        engine = _make_bm25()
+        results = engine.search_many(["载波聚合", "波束 恢复", "不存在的词"])
+        assert results[0][0][0] == "c2"
+        assert results[1][0][0] == "c3"
+        assert results[2] == []
+
+    def test_top_k(self):
+        engine = _make_bm25()
+        engine.index_chunk(_chunk("c4", "波束 扫描"))
+        assert len(engine.search("波束", top_k=1)) == 1
+
+    def test_reindex_overwrites(self):
+        engine = _make_bm25()
+        engine.index_chunk(_chunk("c1", "载波聚合"))
+        engine.refresh()
+        assert engine.search("随机接入") == []
+        assert {cid for cid, _ in engine.search("载波聚合")} == {"c1", "c2"}
+
+    def test_uses_precomputed_tokens(self):
+        engine = LocalBM25Engine(Settings())
+        chunk = _chunk("c1", "原文不参与分词")
+        chunk.bm25_tokens = ["预", "分词"]
+        engine.index_chunk(chunk)
+        assert engine.search("分词")[0][0] == "c1"
+
+    def test_snapshot_roundtrip(self, tmp_path):
+        engine = _make_bm25()
+        path = str(tmp_path / "bm25.npz")
+        engine.save(path)
+
+        restored = LocalBM25Engine(Settings())
+        restored.load(path)
+        assert restored.search_many(["波束", "载波聚合"]) == engine.search_many(
+            ["波束", "载波聚合"]
+        )
+        restored.index_chunk(_chunk("c5", "波束 波束 波束"))
+        assert restored.search("波束")[0][0] == "c5"
+
+    def test_allowed_ids_applied_before_top_k(self):
+        engine = _make_bm25()
+        engine.index_chunk(_chunk("c4", "波束 波束 扫描"))
+        engine.refresh()
+        assert engine.search("波束", top_k=1)[0][0] == "c4"
+        hits = engine.search_many(["波束"], top_k=1, allowed_ids={"c3", "missing"})
+        assert hits == [[("c3", pytest.approx(engine.search("波束")[1][1]))]]
+
+
+def _vector_chunks(n: int, seed: int = 0) -> list[DocumentChunk]:
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for i in range(n):
+        chunk = _chunk(f"v{i}", f"向量 {i}", doc_id=f"doc{i % 3}")
+        chunk.vector_384 = rng.standard_normal(384).tolist()
+        chunk.vector_768 = rng.standard_normal(768).tolist()
+        chunks.append(chunk)
+    return chunks
+
+
+class TestLocalVector:
+    """进程内向量索引测试。"""
+
+    def test_exact_search_finds_self(self):
+        engine = LocalVectorEngine(Settings())
+        chunks = _vector_chunks(50)
+        assert engine.insert_chunks(chunks) == 100
+        results = engine.search_384_many([c.vector_384 for c in chunks[:5]], top_k=3)
+        assert [hits[0][0] for hits in results] == [f"v{i}" for i in range(5)]
+        assert results[0][0][1] == pytest.approx(1.0, abs=1e-5)
+        assert len(engine.search_768(chunks[7].vector_768, top_k=10)) == 10
+
+    def test_reinsert_overwrites(self):
+        engine = LocalVectorEngine(Settings())
+        chunks = _vector_chunks(10)
+        engine.insert_chunks(chunks)
+        moved = chunks[0].model_copy(update={"vector_384": chunks[1].vector_384})
+        engine.insert_chunk(moved)
+        hits = engine.search_384(chunks[0].vector_384, top_k=10)
+        assert len(hits) == 10
+        assert hits[0][0] != "v0"
+
+    def test_rescore_only_candidates(self):
+        engine = LocalVectorEngine(Settings())
+        chunks = _vector_chunks(20)
+        engine.insert_chunks(chunks)
+        hits = engine.rescore_768(chunks[3].vector_768, ["v1", "v3", "missing"])
+        assert [cid for cid, _ in hits] == ["v3", "v1"]
+
+    def test_allowed_ids_filter(self):
+        engine = LocalVectorEngine(Settings())
+        chunks = _vector_chunks(30)
+        engine.insert_chunks(chunks)
+        allowed = {"v3", "v6", "v9"}
+        hits = engine.search_384_many([chunks[0].vector_384], top_k=5, allowed_ids=allowed)[0]
+        assert {cid for cid, _ in hits} == allowed
+
+    def test_doc_id_filter_native(self, tmp_path):
+        """doc_id 条件按 doc_id 列原生过滤，无需 allowed_ids；保存后重新加载同样生效。"""
+        settings = Settings(local_vector_dir=str(tmp_path))
+        engine = LocalVectorEngine(settings)
+        chunks = _vector_chunks(30)
+        engine.insert_chunks(chunks)
+        doc_filter = RetrievalFilter(doc_ids=["doc1"])
+        assert engine.supports_filter(doc_filter)
+        assert not engine.supports_filter(RetrievalFilter(doc_ids=["doc1"], node_types=["leaf"]))
+        hits = engine.search_384_many([chunks[0].vector_384], top_k=5, metadata_filter=doc_filter)
+        assert len(hits[0]) == 5
+        assert all(int(cid[1:]) % 3 == 1 for cid, _ in hits[0])
+
+        engine.save(str(tmp_path))
+        restored = LocalVectorEngine(settings)
+        restored.connect()
+        again = restored.search_384_many(
+            [chunks[0].vector_384], top_k=5, metadata_filter=doc_filter
+        )
+        assert [cid for cid, _ in again[0]] == [cid for cid, _ in hits[0]]
+
+    def test_ivf_matches_flat_top1(self):
+        settings = Settings(
+            local_vector_index_type="ivf",
+            local_ivf_nlist=8,
+            local_ivf_nprobe=8,
+            local_ivf_min_rows=1,
+        )
+        engine = LocalVectorEngine(settings)
+        chunks = _vector_chunks(200)
+        engine.insert_chunks(chunks)
+        assert engine._index_384.ivf is not None
+        # 建簇后写入的尾部向量同样可被检索
+        extra = _vector_chunks(1, seed=1)[0].model_copy(update={"chunk_id": "tail"})
+        engine.insert_chunks([extra], flush=False)
+        queries = [c.vector_384 for c in chunks[:10]] + [extra.vector_384]
+        results = engine.search_384_many(queries, top_k=5)
+        assert [hits[0][0] for hits in results] == [f"v{i}" for i in range(10)] + [
+            "tail"
+        ]
+        filtered = engine.search_384_many(queries[:1], top_k=5, allowed_ids={"v1", "tail"})
+        assert {cid for cid, _ in filtered[0]} <= {"v1", "tail"}
+
+    def test_ivf_flush_assigns_without_retraining(self):
+        settings = Settings(
+            local_vector_index_type="ivf",
+            local_ivf_nlist=8,
+            local_ivf_min_rows=1,
+            local_ivf_retrain_ratio=0.5,
+        )
+        engine = LocalVectorEngine(settings)
+        engine.insert_chunks(_vector_chunks(100))
+        trained = engine._index_384.ivf
+        assert trained.trained_rows == 100
+
+        extra = [
+            c.model_copy(update={"chunk_id": f"x{i}"})
+            for i, c in enumerate(_vector_chunks(20, seed=5))
+        ]
+        engine.insert_chunks(extra)
+        ivf = engine._index_384.ivf
+        assert ivf.centroids is trained.centroids  # 只归簇，未重新训练
+        assert ivf.covered == 120 and len(ivf.rows) == 120
+        assert sorted(ivf.rows.tolist()) == list(range(120))
+        hits = engine.search_384_many([extra[3].vector_384], top_k=1)[0]
+        assert hits[0][0] == "x3"
+
+        more = [
+            c.model_copy(update={"chunk_id": f"y{i}"})
+            for i, c in enumerate(_vector_chunks(40, seed=6))
+        ]
+        engine.insert_chunks(more)  # 160 > 100 x 1.5，重新训练
+        assert engine._index_384.ivf.trained_rows == 160
+        engine.rebuild_ivf()
+        assert engine._index_384.ivf is not ivf
+
+    def test_search_ignores_unpublished_rows(self):
+        """写入过程中（向量已追加、live 未发布）的并发检索不越界，也看不到新行。"""
+        engine = LocalVectorEngine(Settings())
+        chunks = _vector_chunks(10)
+        engine.insert_chunks(chunks)
+        index = engine._index_384
+        pending = np.asarray(_vector_chunks(3, seed=4)[0].vector_384, dtype=np.float32)
+        index.chunk_ids.extend(["p0", "p1", "p2"])
+        index.matrix.append(np.stack([pending] * 3))
+        index.row_of["p0"] = 10
+        hits = engine.search_384_many(
+            [chunks[2].vector_384], top_k=20, allowed_ids={"v2", "p0"}
+        )[0]
+        assert [cid for cid, _ in hits] == ["v2"]
+        assert len(engine.search_384(chunks[2].vector_384, top_k=20)) == 10
+
+    def test_persist_and_mmap_load(self, tmp_path):
+        settings = Settings(local_vector_dir=str(tmp_path))
+        engine = LocalVectorEngine(settings)
+        chunks = _vector_chunks(30)
+        engine.insert_chunks(chunks)
+        engine.close()
+
+        restored = LocalVectorEngine(settings)
+        restored.connect()
+        assert isinstance(restored._index_384.matrix.rows, np.memmap)
+        query = chunks[4].vector_384
+        assert restored.search_384(query, 5) == engine.search_384(query, 5)
+        restored.insert_chunks(_vector_chunks(1, seed=2))
+        assert len(restored.search_384(query, 100)) == 30
+
+
+class TestQuantizedVector:
+    """量化向量存储测试。"""
+
+    def test_quantize_roundtrip_error_small(self):
+        from retrieval.quantization import dequantize, quantize
+
+        vectors = np.random.default_rng(0).standard_normal((20, 384)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for mode, tol in (("float16", 1e-3), ("int8", 1e-2)):
+            codes, scales = quantize(vectors, mode)
+            assert np.abs(dequantize(codes, scales) - vectors).max() < tol
+
+    @pytest.mark.parametrize("mode", ["float16", "int8"])
+    def test_rescored_scores_are_exact(self, mode):
+        exact = LocalVectorEngine(Settings())
+        quantized = LocalVectorEngine(Settings(local_vector_quantization=mode))
+        chunks = _vector_chunks(100)
+        exact.insert_chunks(chunks)
+        quantized.insert_chunks(chunks)
+
+        query = _vector_chunks(1, seed=3)[0].vector_384
+        expected = exact.search_384(query, top_k=10)
+        got = quantized.search_384(query, top_k=10)
+        assert [cid for cid, _ in got] == [cid for cid, _ in expected]
+        assert np.allclose([s for _, s in got], [s for _, s in expected], atol=1e-6)
+
+        ratio = 2 if mode == "float16" else 4
+        # int8 每个向量额外 4 字节 scale
+        assert quantized.memory_usage()["vectors_384"] <= (
+            exact.memory_usage()["vectors_384"] // ratio + 4 * 100
+        )
+
+    def test_quantized_persist_roundtrip(self, tmp_path):
+        settings = Settings(local_vector_dir=str(tmp_path), local_vector_quantization="int8")
+        engine = LocalVectorEngine(settings)
+        chunks = _vector_chunks(30)
+        engine.insert_chunks(chunks)
+        engine.close()
+
+        restored = LocalVectorEngine(settings)
+        restored.connect()
+        query = chunks[9].vector_384
+        assert restored.search_384(query, 5) == engine.search_384(query, 5)
+
+        mismatched = LocalVectorEngine(Settings(local_vector_dir=str(tmp_path)))
+        with pytest.raises(ValueError):
+            mismatched.connect()
+
+    @pytest.mark.parametrize("mode", ["float16", "int8"])
+    def test_approx_scores_match_dequantized(self, mode):
+        from retrieval import quantization
+        from retrieval.quantization import approx_scores, dequantize, quantize
+
+        rng = np.random.default_rng(1)
+        # 行数跨越多个块，并含 float16 非规格数
+        vectors = rng.standard_normal((quantization._BLOCK_ROWS + 7, 64)).astype(np.float32)
+        vectors[0, :4] = [1e-6, -3e-7, 0.0, -0.0]
+        queries = rng.standard_normal((3, 64)).astype(np.float32)
+        codes, scales = quantize(vectors, mode)
+        expected = queries @ dequantize(codes, scales).T
+        got = approx_scores(codes, scales, queries)
+        np.testing.assert_allclose(got, expected, rtol=1e-5, atol=1e-4)
+
+    def test_temp_raw_dir_removed_on_close(self):
+        engine = LocalVectorEngine(Settings(local_vector_quantization="int8"))
+        engine.insert_chunks(_vector_chunks(5))
+        raw_dir = engine._raw_dir
+        assert os.path.isdir(raw_dir)
+        engine.close()
+        assert not os.path.exists(raw_dir)
+
+
+class TestLocalFallback:
+    """外部引擎不可用时切换到进程内引擎。"""
+
+    def test_bm25_fallback_rebuilds_from_chunk_store(self):
+        from types import SimpleNamespace
+
+        from api.dependencies import _fallback_bm25
+        from storage.chunk_store import ChunkStore
+
+        store = ChunkStore()
+        store.add_many(
+            [
+                _chunk("c1", "随机接入 流程", doc_id="d1"),
+                _chunk("c2", "载波聚合 速率", doc_id="d2"),
+            ]
+        )
+        switched = []
+        comp = SimpleNamespace(
+            settings=Settings(), chunk_store=store, use_bm25_engine=switched.append
+        )
+        _fallback_bm25(comp)
+        assert len(switched) == 1
+        assert len(switched[0]) == 2
+        assert switched[0].search("载波聚合")[0][0] == "c2"
+
+    def test_vector_fallback_requires_persisted_index(self, tmp_path):
+        from types import SimpleNamespace
+
+        from api.dependencies import _fallback_vector
+
+        switched = []
+        settings = Settings(local_vector_dir=str(tmp_path / "vectors"))
+        comp = SimpleNamespace(settings=settings, use_vector_engine=switched.append)
+        _fallback_vector(comp)
+        assert switched == []  # 无持久化索引：保持 BM25_ONLY 降级
+
+        engine = LocalVectorEngine(settings)
+        engine.insert_chunks(_vector_chunks(3))
+        engine.close()
+        _fallback_vector(comp)
+        assert len(switched) == 1
+        assert switched[0].has_persisted_index()
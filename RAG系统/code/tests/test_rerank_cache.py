@@ -0,0 +1,121 @@
+"""Rerank 分数缓存单元测试。"""
+
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from cache.rerank_cache import CachedReranker, RerankCache, query_digest
+from models.schemas import ChunkMetadata, DocumentChunk
+from storage.chunk_store import ChunkStore
+
+
+def _chunk(cid: str, text: str) -> DocumentChunk:
+    return DocumentChunk(
+        chunk_id=cid,
+        text=text,
+        metadata=ChunkMetadata(chunk_id=cid, doc_id="doc", doc_name="doc.md"),
+    )
+
+
+class CountingReranker:
+    def __init__(self):
+        self.scored: list[str] = []
+
+    def rerank(self, query, candidates):
+        self.scored.extend(c for c, _ in candidates)
+        return sorted(
+            ((c, 1.0 / (1 + int(c[1:]))) for c, _ in candidates if c != "missing"),
+            key=lambda x: x[1],
+            reverse=True,
+        )
+
+    async def arerank(self, query, candidates):
+        return self.rerank(query, candidates)
+
+    def close(self):
+        pass
+
+
+class BrokenRedis:
+    @property
+    def client(self):
+        raise ConnectionError("redis down")
+
+
+class TestRerankCache:
+    """进程内 LRU 的命中、淘汰与失效测试。"""
+
+    def test_query_normalization(self):
+        assert query_digest("  5G  随机接入 ") == query_digest("5g 随机接入")
+        assert query_digest("5G 随机接入") != query_digest("5G 波束")
+
+    def test_bulk_get_set_and_stats(self):
+        cache = RerankCache("v1")
+        cache.set_many("q", {"c1": 0.9, "c2": 0.5})
+        assert cache.get_many("Q ", ["c1", "c2", "c3"]) == {"c1": 0.9, "c2": 0.5}
+        stats = cache.stats()
+        assert stats["hits"] == 2 and stats["misses"] == 1
+        assert stats["hit_ratio"] == pytest.approx(2 / 3)
+
+    def test_lru_eviction(self):
+        cache = RerankCache("v1", capacity=2)
+        cache.set_many("q", {"c1": 0.1, "c2": 0.2})
+        cache.get_many("q", ["c1"])  # c1 变为最近使用
+        cache.set_many("q", {"c3": 0.3})
+        assert cache.get_many("q", ["c1", "c2", "c3"]) == {"c1": 0.1, "c3": 0.3}
+
+    def test_invalidate_by_chunk(self):
+        cache = RerankCache("v1")
+        cache.set_many("q1", {"c1": 0.1, "c2": 0.2})
+        cache.set_many("q2", {"c1": 0.3})
+        assert cache.invalidate(["c1"]) == 2
+        assert cache.get_many("q1", ["c1", "c2"]) == {"c2": 0.2}
+        assert cache.get_many("q2", ["c1"]) == {}
+
+    def test_other_process_writes_invalidate_via_store(self, tmp_path):
+        """另一个 worker 摄入并 flush 后，本进程读取前按 MANIFEST 失效对应 chunk 的分数。"""
+        writer = ChunkStore(directory=str(tmp_path), max_segments=2)
+        writer.add_many([_chunk("c1", "旧"), _chunk("c2", "乙")])
+        writer.flush()
+        reader = ChunkStore(directory=str(tmp_path), refresh_interval_ms=0)
+        reader.load()
+        cache = RerankCache("v1", chunk_store=reader)
+        cache.set_many("q", {"c1": 0.1, "c2": 0.2})
+
+        writer.add(_chunk("c1", "新"))
+        writer.flush()
+        assert cache.get_many("q", ["c1", "c2"]) == {"c2": 0.2}
+
+        # 合并后整体重新映射，无法区分变化的 chunk：清空本地缓存
+        cache.set_many("q", {"c1": 0.3})
+        writer.add(_chunk("c3", "丙"))
+        writer.flush()
+        assert cache.get_many("q", ["c1", "c2"]) == {}
+
+    def test_redis_failure_degrades_to_local(self):
+        cache = RerankCache("v1", redis_cache=BrokenRedis())
+        cache.set_many("q", {"c1": 0.5})
+        assert cache.get_many("q", ["c1", "c2"]) == {"c1": 0.5}
+        assert cache.invalidate(["c1"]) == 1
+
+
+class TestCachedReranker:
+    """缓存包装层只对未命中的候选打分。"""
+
+    def test_only_misses_are_scored(self):
+        inner = CountingReranker()
+        reranker = CachedReranker(inner, RerankCache("v1"))
+        candidates = [("c1", 0.0), ("c2", 0.0), ("missing", 0.0)]
+
+        first = reranker.rerank("q", candidates)
+        assert [c for c, _ in first] == ["c1", "c2"]
+        inner.scored.clear()
+
+        second = asyncio.run(reranker.arerank("q", candidates + [("c3", 0.0)]))
+        assert inner.scored == ["missing", "c3"]
+        assert [c for c, _ in second] == ["c1", "c2", "c3"]
+        assert second[:2] == first
@@ -0,0 +1,691 @@
+"""三级检索器单元测试：使用内存假引擎，无需 ES / Milvus。"""
+
+import sys
+import os
+import asyncio
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cache.retrieval_cache import RetrievalCache, retrieval_key
+from config.settings import Settings
+from core.deadline import NO_RERANK, RULE_REWRITE, VECTOR_ONLY, Deadline
+from generation.query_rewriter import QueryRewriter
+from ingestion.embedder import Embedder
+from models.schemas import ChunkMetadata, DocumentChunk, RetrievalFilter
+from retrieval.pipeline_retriever import ThreeLevelRetriever
+from retrieval.rerank_server import MicroBatchingReranker, SimulatedBackend
+from retrieval.reranker import CrossEncoderReranker, ModelReranker
+from storage.chunk_store import ChunkStore
+
+TEXTS = {
+    "c1": "5G 随机接入流程包括四步：Msg1 到 Msg4。",
+    "c2": "载波聚合 CA 可以提升用户峰值速率。",
+    "c3": "波束管理包括波束扫描、测量与上报。",
+}
+
+
+def _make_store() -> ChunkStore:
+    store = ChunkStore()
+    store.add_many(
+        DocumentChunk(
+            chunk_id=cid,
+            text=text,
+            metadata=ChunkMetadata(chunk_id=cid, doc_id=f"doc_{cid}", doc_name=cid),
+        )
+        for cid, text in TEXTS.items()
+    )
+    return store
+
+
+def _doc_matches(chunk_id: str, metadata_filter) -> bool:
+    """桩引擎原生执行 doc_id 条件（_make_store 中 doc_id 为 doc_<chunk_id>）。"""
+    return metadata_filter is None or not metadata_filter.doc_ids or (
+        f"doc_{chunk_id}" in metadata_filter.doc_ids
+    )
+
+
+class FakeBM25:
+    def __init__(self, delay: float = 0.0, native_doc_filter: bool = False):
+        self.delay = delay
+        self.native_doc_filter = native_doc_filter
+
+    def supports_filter(self, metadata_filter):
+        return self.native_doc_filter and metadata_filter.only_doc_ids()
+
+    def search(self, query, top_k=1500):
+        return [(cid, 1.0 + i) for i, cid in enumerate(TEXTS) if query[:2] in TEXTS[cid]]
+
+    def search_many(
+        self, queries, top_k=1500, timeout=None, metadata_filter=None, allowed_ids=None
+    ):
+        time.sleep(self.delay)
+        return [
+            [
+                h
+                for h in self.search(q, top_k)
+                if (allowed_ids is None or h[0] in allowed_ids)
+                and _doc_matches(h[0], metadata_filter)
+            ]
+            for q in queries
+        ]
+
+
+class FakeVector:
+    def __init__(self, delay: float = 0.0, dense: dict[str, float] | None = None):
+        self.delay = delay
+        self.dense = dense or {}
+        self.rescored: list[str] = []
+        self.native_doc_filter = False
+
+    def supports_filter(self, metadata_filter):
+        return self.native_doc_filter and metadata_filter.only_doc_ids()
+
+    def search_384_many(
+        self, vectors, top_k=1500, timeout=None, metadata_filter=None, allowed_ids=None
+    ):
+        time.sleep(self.delay)
+        return [
+            [
+                (cid, 0.5)
+                for cid in TEXTS
+                if (allowed_ids is None or cid in allowed_ids)
+                and _doc_matches(cid, metadata_filter)
+            ]
+            for _ in vectors
+        ]
+
+    def rescore_768(self, vector, candidate_ids, timeout=None):
+        self.rescored = list(candidate_ids)
+        return [(cid, self.dense[cid]) for cid in candidate_ids if cid in self.dense]
+
+
+def _make_retriever(bm25=None, vector=None, **overrides) -> ThreeLevelRetriever:
+    settings = Settings(**overrides)
+    store = _make_store()
+    return ThreeLevelRetriever(
+        settings=settings,
+        bm25_engine=bm25 or FakeBM25(),
+        vector_engine=vector or FakeVector(),
+        reranker=CrossEncoderReranker(store),
+        embedder=Embedder(settings),
+        chunk_store=store,
+    )
+
+
+class TestLevel1Recall:
+    """L1 并发召回测试。"""
+
+    def test_retrieve_returns_chunks(self):
+        retriever = _make_retriever()
+        results = asyncio.run(retriever.retrieve("5G 随机接入", ["5G 随机接入"], top_k=3))
+        assert results
+        assert all(r.source == "rerank" for r in results)
+
+    def test_rewrites_run_concurrently(self):
+        """3 条改写合并为每路一次批量调用；两路各 0.2s 并发执行，总耗时应远小于串行的 0.4s。"""
+
+        class CountingBM25(FakeBM25):
+            def __init__(self, delay):
+                super().__init__(delay)
+                self.calls: list[list[str]] = []
+
+            def search_many(self, queries, **kwargs):
+                self.calls.append(list(queries))
+                return super().search_many(queries, **kwargs)
+
+        bm25_engine = CountingBM25(0.2)
+        retriever = _make_retriever(bm25_engine, FakeVector(0.2))
+        queries = ["5G 随机接入", "载波聚合", "波束管理"]
+        start = time.perf_counter()
+        bm25, vector = asyncio.run(retriever._recall_level1(queries))
+        elapsed = time.perf_counter() - start
+        assert bm25_engine.calls == [queries]
+        assert elapsed < 0.35
+        assert len(vector) == len(queries)
+        assert all(len(hits) == len(TEXTS) for hits in vector)
+        assert bm25[0]
+
+    def test_slow_path_dropped_on_timeout(self):
+        """单路超时只丢弃该路结果，另一路正常返回。"""
+        retriever = _make_retriever(
+            FakeBM25(0.5), FakeVector(0.0), level1_timeout_ms=100
+        )
+        bm25, vector = asyncio.run(retriever._recall_level1(["5G 随机接入"]))
+        assert bm25 == [[]]
+        assert len(vector[0]) == len(TEXTS)
+
+    def test_retrieve_many_aligned(self):
+        """批量检索结果与请求一一对应。"""
+        retriever = _make_retriever()
+        requests = [("5G 随机接入", ["5G 随机接入"]), ("波束管理", ["波束管理", "波束"])]
+        batched = asyncio.run(retriever.retrieve_many(requests, top_k=3))
+        assert len(batched) == 2
+        single = asyncio.run(retriever.retrieve("波束管理", ["波束管理", "波束"], top_k=3))
+        assert [r.chunk.chunk_id for r in batched[1]] == [
+            r.chunk.chunk_id for r in single
+        ]
+
+
+class TestLevel2DenseRescore:
+    """L2 768 维候选重打分测试。"""
+
+    def test_rescore_restricted_to_l1_candidates(self):
+        vector = FakeVector(dense={"c1": 0.9, "c2": 0.1, "c3": 0.2})
+        retriever = _make_retriever(vector=vector)
+        fused = asyncio.run(
+            retriever._fuse_with_dense_rescore(
+                "波束", [("c1", 1.0), ("c3", 2.0)], [("c1", 0.5)], alpha=0.7
+            )
+        )
+        assert set(vector.rescored) == {"c1", "c3"}
+        assert fused[0][0] == "c1"
+
+    def test_rescore_failure_falls_back(self):
+        class BrokenVector(FakeVector):
+            def rescore_768(self, vector, candidate_ids, timeout=None):
+                raise ConnectionError("milvus down")
+
+        retriever = _make_retriever(vector=BrokenVector())
+        fused = asyncio.run(
+            retriever._fuse_with_dense_rescore(
+                "波束", [("c1", 1.0), ("c3", 2.0)], [("c1", 0.5)], alpha=0.5
+            )
+        )
+        assert {cid for cid, _ in fused} == {"c1", "c3"}
+
+    def test_query_encoded_once_for_both_dims(self):
+        """768 维 query 向量在 L1 中与 384 维一次编码，L2 不再单独编码。"""
+
+        class RecordingVector(FakeVector):
+            def rescore_768(self, vector, candidate_ids, timeout=None):
+                self.vector = vector
+                return super().rescore_768(vector, candidate_ids, timeout)
+
+        vector = RecordingVector(dense={"c1": 0.9})
+        retriever = _make_retriever(vector=vector)
+        encoded = []
+        encode = retriever.embedder.backend.encode
+
+        def counting(texts, dim):
+            encoded.append((list(texts), dim))
+            return encode(texts, dim)
+
+        retriever.embedder.backend.encode = counting
+        query = "5G 随机接入"
+        asyncio.run(retriever.retrieve(query, [query, "随机接入流程"], top_k=3))
+        assert encoded == [([query, "随机接入流程"], 768)]
+        assert vector.vector == pytest.approx(retriever.embedder.embed_768(query))
+
+
+class TestAdaptiveRerankDepth:
+    """L3 自适应精排深度测试。"""
+
+    def test_decisive_top_skips_cross_encoder(self):
+        retriever = _make_retriever(rerank_adaptive_depth=True, rerank_skip_gap=0.3)
+        calls = []
+
+        async def arerank(query, candidates):
+            calls.append(candidates)
+            return []
+
+        retriever.reranker.arerank = arerank
+        fused = [("c1", 1.0), ("c2", 0.4), ("c3", 0.3)]
+        final, n_reranked = asyncio.run(
+            retriever._rerank_level3("q", fused, 2, time.perf_counter())
+        )
+        assert not calls
+        assert final == fused[:2] and n_reranked == 0
+
+    def test_decisive_top_applies_cutoff(self):
+        retriever = _make_retriever(
+            rerank_adaptive_depth=True, rerank_skip_gap=0.3, rerank_diff_threshold=0.5
+        )
+        fused = [("c1", 0.9), ("c2", 0.2), ("c3", 0.1)]
+        final, _ = asyncio.run(retriever._rerank_level3("q", fused, 3, time.perf_counter()))
+        assert final == fused[:1]
+
+    def test_shallow_depth_fill_ranked_below_cross_encoder(self):
+        retriever = _make_retriever(rerank_adaptive_depth=True, rerank_min_depth=2)
+
+        async def arerank(query, candidates):
+            return [(cid, 0.95 - 0.05 * i) for i, (cid, _) in enumerate(candidates)]
+
+        retriever.reranker.arerank = arerank
+        # 第 2、3 个候选之间分差达到 gap_threshold：只精排前 2 个，其余按 RSF 补足
+        fused = [("c1", 0.9), ("c2", 0.85), ("c3", 0.5), ("c4", 0.45)]
+        final, n_reranked = asyncio.run(
+            retriever._rerank_level3("q", fused, 4, time.perf_counter())
+        )
+        assert n_reranked == 2
+        assert [cid for cid, _ in final] == ["c1", "c2", "c3", "c4"]
+        scores = [s for _, s in final]
+        assert scores[2] < scores[1] and scores[2] - scores[3] == pytest.approx(0.05)
+
+    def test_cost_ema_counts_only_cache_misses(self):
+        from cache.rerank_cache import CachedReranker, RerankCache
+
+        retriever = _make_retriever()
+        cache = RerankCache("v1")
+        retriever.reranker = CachedReranker(retriever.reranker, cache)
+        fused = [("c1", 1.0), ("c2", 0.4), ("c3", 0.3)]
+        asyncio.run(retriever._rerank_level3("5G 随机接入", fused, 3, time.perf_counter()))
+        cost = retriever._rerank_cost_ms
+        assert cost is not None
+        # 第二次全部命中缓存，不更新单候选耗时
+        asyncio.run(retriever._rerank_level3("5G 随机接入", fused, 3, time.perf_counter()))
+        assert retriever._rerank_cost_ms == cost
+
+    def test_disabled_reranks_everything(self):
+        retriever = _make_retriever()
+        fused = [("c1", 1.0), ("c2", 0.4), ("c3", 0.3)]
+        final, n_reranked = asyncio.run(
+            retriever._rerank_level3("5G 随机接入", fused, 3, time.perf_counter())
+        )
+        assert {cid for cid, _ in final} == set(TEXTS) and n_reranked == 3
+        assert retriever._rerank_cost_ms is not None
+
+
+class TestDeadline:
+    """请求级延迟预算与降级测试。"""
+
+    def test_stage_budget_capped_by_remaining(self):
+        deadline = Deadline(100)
+        assert deadline.budget_s(50) == pytest.approx(0.05, abs=0.01)
+        assert deadline.budget_s(10_000) <= 0.1
+        deadline.degrade(NO_RERANK)
+        deadline.degrade(NO_RERANK)
+        assert deadline.degradations == [NO_RERANK]
+
+    def test_l1_timeout_recorded(self):
+        vector = FakeVector(0.0, dense={"c1": 0.9, "c2": 0.1, "c3": 0.2})
+        retriever = _make_retriever(FakeBM25(0.5), vector, level1_timeout_ms=100)
+        deadline = Deadline(5000)
+        results = asyncio.run(
+            retriever.retrieve("5G 随机接入", ["5G 随机接入"], top_k=3, deadline=deadline)
+        )
+        assert results
+        assert deadline.degradations == [VECTOR_ONLY]
+
+    def test_l1_bounded_by_remaining_budget(self):
+        retriever = _make_retriever(FakeBM25(0.0), FakeVector(0.5))
+        start = time.perf_counter()
+        asyncio.run(retriever._recall_level1(["5G 随机接入"], Deadline(100)))
+        assert time.perf_counter() - start < 0.4
+
+    def test_rerank_timeout_falls_back_to_fusion_order(self):
+        retriever = _make_retriever(rerank_timeout_ms=50)
+
+        async def slow_arerank(query, candidates):
+            await asyncio.sleep(1)
+            return candidates
+
+        retriever.reranker.arerank = slow_arerank
+        deadline = Deadline(5000)
+        fused = [("c1", 0.9), ("c2", 0.5), ("c3", 0.4)]
+        final, n_reranked = asyncio.run(
+            retriever._rerank_level3("q", fused, 2, time.perf_counter(), deadline)
+        )
+        assert final == fused[:2] and n_reranked == 0
+        assert deadline.degradations == [NO_RERANK]
+
+    def test_slow_llm_rewrite_degrades_to_rules(self):
+        rewriter = QueryRewriter(Settings(llm_provider="gemini", rewrite_timeout_ms=50))
+        rewriter.rewrite = lambda query, history=None: time.sleep(0.5) or ["llm"]
+        deadline = Deadline(5000)
+        rewritten = asyncio.run(rewriter.arewrite("CA 的峰值速率", None, deadline))
+        assert rewritten[0] == "CA 的峰值速率"
+        assert deadline.degradations == [RULE_REWRITE]
+
+
+class TestRetrievalCache:
+    """检索结果缓存测试。"""
+
+    def _retriever(self, **overrides):
+        bm25 = FakeBM25()
+        bm25.calls = 0
+        search_many = bm25.search_many
+
+        def counting(queries, top_k=1500, **kwargs):
+            bm25.calls += 1
+            return search_many(queries, top_k, **kwargs)
+
+        bm25.search_many = counting
+        retriever = _make_retriever(bm25=bm25, **overrides)
+        retriever.result_cache = RetrievalCache()
+        return retriever, bm25
+
+    def test_key_ignores_rewrite_order_and_case(self):
+        assert retrieval_key("Q", ["5G  随机接入", "CA"], 3) == retrieval_key(
+            "q", ["ca", "5g 随机接入", "CA"], 3
+        )
+        assert retrieval_key("q", ["a"], 3) != retrieval_key("q", ["a"], 5)
+        assert retrieval_key("q1", ["a"], 3) != retrieval_key("q2", ["a"], 3)
+
+    def test_second_request_served_from_cache(self):
+        retriever, bm25 = self._retriever()
+        first = asyncio.run(retriever.retrieve("5G 随机接入", ["5G 随机接入", "随机接入"], 3))
+        second = asyncio.run(retriever.retrieve("5G 随机接入", ["随机接入", "5G 随机接入"], 3))
+        assert bm25.calls == 1
+        assert [(r.chunk.chunk_id, r.score) for r in second] == [
+            (r.chunk.chunk_id, r.score) for r in first
+        ]
+        assert all(r.source == "retrieval_cache" for r in second)
+
+    def test_generation_bump_invalidates(self):
+        retriever, bm25 = self._retriever()
+        asyncio.run(retriever.retrieve("波束", ["波束"], 3))
+        retriever.result_cache.bump_generation()
+        asyncio.run(retriever.retrieve("波束", ["波束"], 3))
+        assert bm25.calls == 2
+
+    def test_other_worker_flush_invalidates(self, tmp_path):
+        """未配置 Redis 时，另一个 worker 发布新 segment 后本进程的旧条目失效。"""
+        chunk = DocumentChunk(
+            chunk_id="c1",
+            text="波束",
+            metadata=ChunkMetadata(chunk_id="c1", doc_id="doc", doc_name="doc.md"),
+        )
+        writer = ChunkStore(directory=str(tmp_path))
+        reader = ChunkStore(directory=str(tmp_path), refresh_interval_ms=0)
+        reader.load()
+        cache = RetrievalCache(chunk_store=reader)
+        _, generation = cache.get("k")
+        assert cache.set("k", [("c0", 1.0)], generation)
+        assert cache.get("k")[0] == [("c0", 1.0)]
+
+        writer.add(chunk)
+        writer.flush()
+        assert cache.get("k")[0] is None
+
+    def test_result_computed_before_bump_not_cached(self):
+        """检索期间发生摄入：旧索引上算出的结果不得以新代号写入缓存。"""
+        cache = RetrievalCache()
+        hits, generation = cache.get("k")
+        assert hits is None
+        cache.bump_generation()
+        assert not cache.set("k", [("c0", 1.0)], generation)
+        assert cache.get("k")[0] is None
+
+    def test_degraded_results_not_cached(self):
+        retriever, bm25 = self._retriever(rerank_timeout_ms=0)
+        asyncio.run(retriever.retrieve("波束", ["波束"], 3))
+        asyncio.run(retriever.retrieve("波束", ["波束"], 3))
+        assert bm25.calls == 2
+
+
+class TestMetrics:
+    """检索链路的 Prometheus 埋点测试。"""
+
+    def test_retrieve_records_stage_metrics(self):
+        pytest.importorskip("prometheus_client")
+        from core.metrics import render
+
+        retriever = _make_retriever()
+        deadline = Deadline(5000)
+        deadline.degrade(NO_RERANK)
+        asyncio.run(retriever.retrieve("5G 随机接入", ["5G 随机接入"], top_k=3))
+        body, content_type = render()
+        text = body.decode()
+        assert content_type.startswith("text/plain")
+        for stage in ("bm25", "vector", "rsf", "rerank", "retrieval"):
+            assert f'rag_stage_latency_seconds_count{{stage="{stage}"}}' in text
+        assert 'rag_candidates{stage="l3"}' in text
+        assert 'rag_degradations_total{kind="no_rerank"}' in text
+
+
+class TestRerankerBatch:
+    """Reranker 批量打分与逐条打分一致性测试。"""
+
+    def _store(self, with_tokens: bool) -> ChunkStore:
+        import jieba
+
+        store = ChunkStore()
+        for cid, text in TEXTS.items():
+            chunk = DocumentChunk(
+                chunk_id=cid,
+                text=text,
+                metadata=ChunkMetadata(chunk_id=cid, doc_id="d", doc_name="d"),
+            )
+            if with_tokens:
+                chunk.bm25_tokens = list(jieba.cut(text))
+            store.add(chunk)
+        return store
+
+    def test_batch_matches_per_chunk_scores(self):
+        reranker = CrossEncoderReranker(self._store(with_tokens=True))
+        candidates = [(cid, 0.0) for cid in TEXTS] + [("missing", 0.0)]
+        for query in ["5G 随机接入流程", "载波聚合 峰值速率", "波束", "无关问题"]:
+            results = reranker.rerank(query, candidates)
+            assert [cid for cid, _ in results] == sorted(
+                TEXTS, key=lambda c: -reranker._compute_relevance(query, TEXTS[c])
+            )
+            for cid, score in results:
+                assert score == pytest.approx(
+                    reranker._compute_relevance(query, TEXTS[cid]), abs=1e-12
+                )
+
+    def test_falls_back_without_precomputed_terms(self):
+        with_terms = CrossEncoderReranker(self._store(with_tokens=True))
+        without = CrossEncoderReranker(self._store(with_tokens=False))
+        candidates = [(cid, 0.0) for cid in TEXTS]
+        expected = with_terms.rerank("随机接入", candidates)
+        got = without.rerank("随机接入", candidates)
+        assert [c for c, _ in got] == [c for c, _ in expected]
+        assert [s for _, s in got] == pytest.approx([s for _, s in expected])
+
+
+class TestMicroBatchingReranker:
+    """跨请求微批推理测试（模拟后端）。"""
+
+    def test_concurrent_requests_share_batches(self):
+        backend = SimulatedBackend(fixed_ms=5, per_token_us=0, scorer=lambda q, d: len(d) / 100)
+        scheduler = MicroBatchingReranker(backend, max_batch_size=64, max_wait_ms=20)
+        docs = list(TEXTS.values())
+
+        async def run():
+            return await asyncio.gather(
+                *(scheduler.score(f"问题{i}", docs) for i in range(8))
+            )
+
+        results = asyncio.run(run())
+        scheduler.close()
+        for scores in results:
+            assert scores == [len(d) / 100 for d in docs]
+        # 8 个请求的全部 pair 合成 1 次前向
+        assert backend.calls == 1
+        assert scheduler.pairs == 8 * len(docs)
+
+    def test_batches_respect_max_size_and_sort_by_length(self):
+        seen = []
+
+        class Recording(SimulatedBackend):
+            def score_pairs(self, pairs):
+                seen.append([len(d) for _, d in pairs])
+                return super().score_pairs(pairs)
+
+        scheduler = MicroBatchingReranker(Recording(fixed_ms=0, per_token_us=0), max_batch_size=4)
+        docs = ["x" * n for n in (50, 5, 300, 20, 120, 8, 60, 400, 1)]
+        scores = asyncio.run(scheduler.score("q", docs))
+        scheduler.close()
+        assert len(scores) == len(docs)
+        assert all(len(batch) <= 4 for batch in seen)
+        assert [n for batch in seen for n in batch] == sorted(len(d) for d in docs)
+
+    def test_adaptive_window(self):
+        """请求稀疏时不等待合批窗口，密集时等待。"""
+        backend = SimulatedBackend(fixed_ms=0, per_token_us=0)
+        scheduler = MicroBatchingReranker(backend, max_wait_ms=300)
+
+        async def run():
+            for _ in range(2):
+                start = time.perf_counter()
+                await scheduler.score("q", ["a", "b"])
+                assert time.perf_counter() - start < 0.15
+                await asyncio.sleep(0.35)
+            scheduler._arrival_gap = 0.001  # 模拟高并发到达
+            assert scheduler._window() == pytest.approx(0.3)
+
+        asyncio.run(run())
+        scheduler.close()
+
+    def test_backend_error_propagates(self):
+        class Broken:
+            def score_pairs(self, pairs):
+                raise RuntimeError("boom")
+
+        scheduler = MicroBatchingReranker(Broken(), max_wait_ms=1)
+        with pytest.raises(RuntimeError):
+            asyncio.run(scheduler.score("q", ["a", "b"]))
+        scheduler.close()
+
+    def test_model_reranker_orders_by_score(self):
+        store = TestRerankerBatch()._store(with_tokens=False)
+        backend = SimulatedBackend(fixed_ms=0, per_token_us=0, scorer=lambda q, d: len(d) / 1000)
+        reranker = ModelReranker(store, MicroBatchingReranker(backend, max_wait_ms=1))
+        candidates = [(cid, 0.0) for cid in TEXTS] + [("missing", 0.0)]
+        results = asyncio.run(reranker.arerank("q", candidates))
+        assert [cid for cid, _ in results] == sorted(TEXTS, key=lambda c: -len(TEXTS[c]))
+        assert reranker.rerank("q", candidates) == results
+        reranker.close()
+
+
+class TestMetadataFilter:
+    """元数据过滤下推测试。"""
+
+    def test_chunk_store_resolves_filter(self, tmp_path):
+        store = ChunkStore(directory=str(tmp_path))
+        store.add_many(
+            DocumentChunk(
+                chunk_id=cid,
+                text=cid,
+                metadata=ChunkMetadata(
+                    chunk_id=cid,
+                    doc_id=doc,
+                    doc_name=doc,
+                    heading_path=heading,
+                    node_type=node_type,
+                ),
+            )
+            for cid, doc, heading, node_type in [
+                ("a1", "docA", "# 5G / ## 随机接入", "leaf"),
+                ("a2", "docA", "# 5G / ## 波束", "non_leaf"),
+                ("b1", "docB", "# 5G / ## 随机接入 / ### PRACH", "leaf"),
+            ]
+        )
+        store.flush()
+        store.add_many([_make_store().get("c1")])  # memtable 中的行同样参与过滤
+
+        assert store.ids_matching(RetrievalFilter(doc_ids=["docA"])) == {"a1", "a2"}
+        assert store.ids_matching(RetrievalFilter(node_types=["leaf"])) == {"a1", "b1", "c1"}
+        assert store.ids_matching(
+            RetrievalFilter(heading_prefix="# 5G / ## 随机接入", node_types=["leaf"])
+        ) == {"a1", "b1"}
+        assert store.ids_matching(RetrievalFilter(doc_ids=["docB", "doc_c1"])) == {"b1", "c1"}
+        assert store.ids_matching(RetrievalFilter(doc_ids=["unknown"])) == set()
+
+    def test_retrieve_only_returns_matching_chunks(self):
+        retriever = _make_retriever()
+        results = asyncio.run(
+            retriever.retrieve(
+                "5G 随机接入",
+                ["5G 随机接入", "载波聚合"],
+                top_k=3,
+                metadata_filter=RetrievalFilter(doc_ids=["doc_c2", "doc_c3"]),
+            )
+        )
+        assert results
+        assert {r.chunk.metadata.doc_id for r in results} <= {"doc_c2", "doc_c3"}
+
+    def test_doc_only_filter_pushed_down_natively(self):
+        """两路引擎都能原生执行 doc_id 条件时不构造 allowed_ids 集合。"""
+        bm25 = FakeBM25(native_doc_filter=True)
+        vector = FakeVector()
+        vector.native_doc_filter = True
+        retriever = _make_retriever(bm25=bm25, vector=vector)
+        retriever.chunk_store.ids_matching = lambda filt: pytest.fail("不应解析 allowed_ids")
+        results = asyncio.run(
+            retriever.retrieve(
+                "5G 随机接入",
+                ["5G 随机接入", "载波聚合"],
+                top_k=3,
+                metadata_filter=RetrievalFilter(doc_ids=["doc_c2"]),
+            )
+        )
+        assert [r.chunk.chunk_id for r in results] == ["c2"]
+
+    def test_empty_store_does_not_drop_results(self):
+        """本地 chunk store 为空时不短路返回空结果，由引擎执行可原生表达的条件。"""
+        retriever = _make_retriever()
+        retriever.chunk_store = ChunkStore()
+        assert retriever._resolve_filter(RetrievalFilter(node_types=["leaf"])) is None
+
+    def test_local_engines_filter_doc_ids_natively(self, tmp_path):
+        from retrieval.local_bm25_engine import LocalBM25Engine
+
+        engine = LocalBM25Engine(Settings())
+        engine.index_chunks(_make_store().get(cid) for cid in TEXTS)
+        doc_filter = RetrievalFilter(doc_ids=["doc_c1"])
+        assert engine.supports_filter(doc_filter)
+        assert not engine.supports_filter(RetrievalFilter(node_types=["leaf"]))
+        assert [cid for cid, _ in engine.search("随机接入", metadata_filter=doc_filter)] == ["c1"]
+        assert engine.search("随机接入", metadata_filter=RetrievalFilter(doc_ids=["doc_c2"])) == []
+
+        path = str(tmp_path / "bm25.npz")
+        engine.save(path)
+        restored = LocalBM25Engine(Settings())
+        restored.load(path)
+        assert [cid for cid, _ in restored.search("随机接入", metadata_filter=doc_filter)] == [
+            "c1"
+        ]
+
+    def test_no_match_skips_recall(self):
+        bm25 = FakeBM25()
+        bm25.search_many = lambda *args, **kwargs: pytest.fail("不应发起召回")
+        retriever = _make_retriever(bm25=bm25)
+        results = asyncio.run(
+            retriever.retrieve(
+                "5G", ["5G"], metadata_filter=RetrievalFilter(node_types=["non_leaf"])
+            )
+        )
+        assert results == []
+
+    def test_cache_key_includes_filter(self):
+        scoped = RetrievalFilter(doc_ids=["b", "a"])
+        assert retrieval_key("q", ["a"], 3, scoped) != retrieval_key("q", ["a"], 3)
+        assert retrieval_key("q", ["a"], 3, scoped) == retrieval_key(
+            "q", ["a"], 3, RetrievalFilter(doc_ids=["a", "b"])
+        )
+        assert retrieval_key("q", ["a"], 3, RetrievalFilter()) == retrieval_key("q", ["a"], 3)
+
+    def test_es_filter_clauses(self):
+        from retrieval.bm25_engine import BM25Engine
+
+        body = BM25Engine._build_search_body(
+            "随机接入",
+            10,
+            RetrievalFilter(doc_ids=["d1"], node_types=["leaf"], heading_prefix="# 5G"),
+        )
+        assert body["query"]["bool"]["filter"] == [
+            {"terms": {"doc_id": ["d1"]}},
+            {"terms": {"node_type": ["leaf"]}},
+            {"prefix": {"heading_path.raw": "# 5G"}},
+        ]
+        assert "multi_match" in BM25Engine._build_search_body("随机接入", 10)["query"]
+
+    def test_milvus_filter_expr(self):
+        from retrieval.vector_engine import MilvusVectorEngine
+
+        engine = MilvusVectorEngine(Settings(milvus_filter_max_ids=2))
+        doc_only = RetrievalFilter(doc_ids=["d1", "d2"])
+        assert engine._filter_exprs(doc_only, {"c1"}) == ['doc_id in ["d1", "d2"]']
+        scoped = RetrievalFilter(doc_ids=["d1"], node_types=["leaf"])
+        assert engine._filter_exprs(scoped, {"c2", "c1"}) == ['chunk_id in ["c1", "c2"]']
+        # 允许集合超过上限：按上限拆成多段 chunk_id in [...]
+        assert engine._filter_exprs(scoped, {"c1", "c2", "c3"}) == [
+            'chunk_id in ["c1", "c2"]',
+            'chunk_id in ["c3"]',
+        ]
+        assert engine._filter_exprs(None, None) == [None]
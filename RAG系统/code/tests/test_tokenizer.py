@@ -0,0 +1,61 @@
+"""共享分词服务单元测试。"""
+
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+import core.tokenizer as tokenizer_module
+from core.tokenizer import TokenizerService, get_tokenizer
+
+
+class CountingTokenizer(TokenizerService):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.cut_calls: list[str] = []
+
+    def cut(self, text):
+        self.cut_calls.append(text)
+        return super().cut(text)
+
+
+@pytest.fixture
+def tokenizer(monkeypatch):
+    service = CountingTokenizer()
+    monkeypatch.setattr(tokenizer_module, "_tokenizer", service)
+    return service
+
+
+class TestTokenizerService:
+    """query 分词缓存测试。"""
+
+    def test_query_cached(self, tokenizer):
+        first = tokenizer.query("5G 随机接入流程")
+        second = get_tokenizer().query("5G 随机接入流程")
+        assert first is second
+        assert tokenizer.cut_calls == ["5G 随机接入流程"]
+        assert first.token_count == len(first.tokens)
+        assert " " not in first.terms
+        assert tokenizer.stats()["hits"] == 1
+
+    def test_lru_eviction(self):
+        service = CountingTokenizer(cache_size=2)
+        service.query("a")
+        service.query("b")
+        service.query("a")  # a 变为最近使用
+        service.query("c")
+        service.query("a")
+        service.query("b")
+        assert service.cut_calls == ["a", "b", "c", "b"]
+
+    def test_query_tokenized_once_per_request(self, tokenizer):
+        """RSF alpha、Reranker 共享同一次 query 分词。"""
+        from tests.test_retriever import _make_retriever
+
+        retriever = _make_retriever()
+        query = "5G 随机接入"
+        asyncio.run(retriever.retrieve(query, [query], top_k=3))
+        assert tokenizer.cut_calls.count(query) == 1
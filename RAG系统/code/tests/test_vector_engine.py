@@ -0,0 +1,108 @@
+"""Milvus 向量引擎单元测试：使用桩 Collection 校验批量插入的分批与列布局，无需 Milvus。"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import json
+
+import numpy as np
+
+from config.settings import Settings
+from models.schemas import ChunkMetadata, DocumentChunk, RetrievalFilter
+from retrieval.vector_engine import MilvusVectorEngine
+
+
+class StubCollection:
+    def __init__(self):
+        self.inserts: list[list] = []
+        self.flushes = 0
+
+    def insert(self, data):
+        self.inserts.append(data)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def _chunk(i: int, with_dense: bool = True) -> DocumentChunk:
+    cid = f"c{i}"
+    return DocumentChunk(
+        chunk_id=cid,
+        text=f"文本 {i}",
+        metadata=ChunkMetadata(chunk_id=cid, doc_id=f"doc_{i % 2}", doc_name="d"),
+        vector_384=[float(i)] * 4,
+        vector_768=[float(i)] * 8 if with_dense else None,
+    )
+
+
+def _engine(**overrides) -> MilvusVectorEngine:
+    engine = MilvusVectorEngine(Settings(**overrides))
+    engine._collection_384 = StubCollection()
+    engine._collection_768 = StubCollection()
+    return engine
+
+
+class TestInsertChunks:
+    """按列批量插入。"""
+
+    def test_batches_and_column_layout(self):
+        engine = _engine(milvus_insert_batch_size=2)
+        chunks = [_chunk(i) for i in range(5)]
+        assert engine.insert_chunks(chunks, flush=False) == 10
+
+        inserts = engine._collection_384.inserts
+        assert [len(data[0]) for data in inserts] == [2, 2, 1]
+        chunk_ids, doc_ids, embeddings = inserts[0]
+        assert chunk_ids == ["c0", "c1"]
+        assert doc_ids == ["doc_0", "doc_1"]
+        assert isinstance(embeddings, np.ndarray)
+        assert embeddings.dtype == np.float32 and embeddings.shape == (2, 4)
+        assert embeddings[1].tolist() == [1.0] * 4
+        assert engine._collection_768.inserts[2][2].shape == (1, 8)
+        assert engine._collection_384.flushes == engine._collection_768.flushes == 0
+
+    def test_missing_vectors_skipped_and_flush_once(self):
+        engine = _engine(milvus_insert_batch_size=10)
+        chunks = [_chunk(0), _chunk(1, with_dense=False), _chunk(2)]
+        assert engine.insert_chunks(chunks, batch_size=10) == 5
+
+        assert engine._collection_384.inserts[0][0] == ["c0", "c1", "c2"]
+        assert engine._collection_768.inserts[0][0] == ["c0", "c2"]
+        assert engine._collection_384.flushes == engine._collection_768.flushes == 1
+
+
+class _Hit:
+    def __init__(self, cid: str, score: float):
+        self.entity = {"chunk_id": cid}
+        self.score = score
+
+
+class StubSearchCollection:
+    """按 expr 中的 chunk_id 返回预设分数的检索桩。"""
+
+    def __init__(self, scores: dict[str, float]):
+        self.scores = scores
+        self.exprs: list[str] = []
+
+    def search(self, data, anns_field, param, limit, expr, output_fields, timeout):
+        self.exprs.append(expr)
+        ids = json.loads(expr[len("chunk_id in "):])
+        hits = sorted((_Hit(cid, self.scores[cid]) for cid in ids), key=lambda h: -h.score)
+        return [hits[:limit] for _ in data]
+
+
+class TestFilteredSearch:
+    """allowed_ids 超过上限时分段下推。"""
+
+    def test_chunked_expr_merges_top_k(self):
+        engine = _engine(milvus_filter_max_ids=2)
+        scores = {"c1": 0.1, "c2": 0.9, "c3": 0.5, "c4": 0.7, "c5": 0.3}
+        engine._collection_384 = StubSearchCollection(scores)
+        scoped = RetrievalFilter(node_types=["leaf"])
+        results = engine.search_384_many(
+            [[0.0] * 4], top_k=3, metadata_filter=scoped, allowed_ids=set(scores)
+        )
+        assert len(engine._collection_384.exprs) == 3
+        assert results == [[("c2", 0.9), ("c4", 0.7), ("c3", 0.5)]]
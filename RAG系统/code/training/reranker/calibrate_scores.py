@@ -96,7 +96,7 @@ def collect_raw_scores(
             batch_q, batch_d,
             max_length=max_length,
             truncation=True,
-            padding="max_length",
+            padding=True,
             return_tensors="pt",
         )
         enc = {k: v.to(device) for k, v in enc.items()}
@@ -193,7 +193,7 @@ class CalibratedReranker:
         """返回校准后的概率分数列表，与 docs 一一对应。"""
         enc = self.tokenizer(
             [query] * len(docs), docs,
-            max_length=max_length, truncation=True, padding="max_length", return_tensors="pt",
+            max_length=max_length, truncation=True, padding=True, return_tensors="pt",
         )
         enc = {k: v.to(self.device) for k, v in enc.items()}
         raw_scores = self.model(**enc).logits.squeeze(-1).cpu().numpy()